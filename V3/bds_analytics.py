@@ -0,0 +1,233 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from bds_events import iter_matches, parse_timestamp, PLAYER_CONNECTED, PLAYER_DISCONNECTED, GROUP_KINDS
+from bds_logsink import ROTATED_LINE, CONTINUED_LINE
+
+OLD_LOGS_DIR = "old_logs"
+CACHE_FILE = "analytics_cache.json"
+CACHE_VERSION = 2
+READ_CHUNK = 4 * 1024 * 1024
+
+ARCHIVE_NAME_RE = re.compile(r"^server_log_.*\.txt(?:\.gz)?$")
+LAST_TIME_RE = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)", re.M)
+ARCHIVE_ORDER_RE = re.compile(r"^(.*?)(?:_(\d+))?\.txt")
+
+def archive_order(name):
+    # Rotations within one second get _1, _2, ... suffixes, which must sort as numbers
+    match = ARCHIVE_ORDER_RE.match(name)
+    return (match.group(1), int(match.group(2) or 0)) if match else (name, 0)
+
+def analyze_archive(path):
+    # Runs in a worker process. Returns plain lists so the result can be cached as JSON:
+    # sessions are [name, xuid, start, end]. Players still online at the end are listed in "open"
+    # if the sink rotated the log while the server ran, and join_sessions carries them into the
+    # next archive; otherwise the server stopped and they are closed at the last timestamp.
+    # "first" has each player's first connect or disconnect, which ends a carried session.
+    online = {}
+    sessions = []
+    first = {}
+    last_time = None
+    partial = b""
+    continued = None
+    tail = ""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as archive:
+        while True:
+            chunk = archive.read(READ_CHUNK)
+            if continued is None:
+                continued = chunk.startswith(CONTINUED_LINE.encode("latin-1"))
+            data = partial + chunk
+            cut = len(data) if not chunk else data.rfind(b"\n") + 1
+            partial = data[cut:]
+            text = data[:cut].decode("latin-1")
+            for _, match in iter_matches(text):
+                kind = GROUP_KINDS[match.lastgroup]
+                if kind not in (PLAYER_CONNECTED, PLAYER_DISCONNECTED) or not match.group("ts"):
+                    continue
+                event_time = parse_timestamp(match.group("ts"))
+                if event_time is None:
+                    continue
+                prefix = match.lastgroup
+                name = match.group(prefix + "_name").strip().encode("latin-1").decode("utf-8", "replace")
+                if name not in first:
+                    first[name] = [name, match.group(prefix + "_xuid") or None, event_time]
+                if kind == PLAYER_CONNECTED:
+                    if name in online:
+                        sessions.append([name, online[name][0], online[name][1], event_time])
+                    online[name] = (match.group(prefix + "_xuid") or None, event_time)
+                elif name in online:
+                    xuid, started = online.pop(name)
+                    sessions.append([name, xuid or match.group(prefix + "_xuid") or None, started, event_time])
+            stamps = LAST_TIME_RE.findall(text[-65536:])
+            if stamps:
+                last_time = parse_timestamp(stamps[-1]) or last_time
+            if text:
+                tail = (tail + text)[-len(ROTATED_LINE) - 2:]
+            if not chunk:
+                break
+    continues = tail.rstrip("\r\n").endswith(ROTATED_LINE.rstrip("\n"))
+    open_sessions = []
+    for name, (xuid, started) in online.items():
+        if continues:
+            open_sessions.append([name, xuid, started])
+        else:
+            sessions.append([name, xuid, started, max(started, last_time or started)])
+    return {"sessions": sessions, "open": open_sessions, "first": list(first.values()),
+            "continued": continued, "continues": continues, "last_time": last_time}
+
+def join_sessions(archives):
+    # Yields (archive name, session) in archive order, each session under the archive it started in.
+    # A session still open when the log was rotated ends at the player's first event in the next
+    # archive, or is carried further if there is none.
+    carried = {}  # name -> (archive name, xuid, start)
+    last_time = None
+    for name in sorted(archives, key=archive_order):
+        result = archives[name]["result"]
+        if not result["continued"]:
+            # The next part is missing; they were online at least until the last known time
+            yield from close_carried(carried, last_time)
+        for player, xuid, moment in result["first"]:
+            if player in carried:
+                origin, carried_xuid, start = carried.pop(player)
+                yield origin, [player, carried_xuid or xuid, start, max(start, moment)]
+        for session in result["sessions"]:
+            yield name, session
+        last_time = result["last_time"] or last_time
+        if not result["continues"]:
+            yield from close_carried(carried, last_time)
+        for player, xuid, start in result["open"]:
+            carried[player] = (name, xuid, start)
+    yield from close_carried(carried, last_time)
+
+def close_carried(carried, last_time):
+    for player, (origin, xuid, start) in carried.items():
+        yield origin, [player, xuid, start, max(start, last_time or start)]
+    carried.clear()
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path, encoding="utf-8") as cache_file:
+            cache = json.load(cache_file)
+        if cache.get("version") == CACHE_VERSION:
+            return cache["archives"]
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+def save_cache(cache_path, archives):
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as cache_file:
+        json.dump({"version": CACHE_VERSION, "archives": archives}, cache_file, separators=(",", ":"))
+    os.replace(tmp_path, cache_path)
+
+def collect_archives(archive_dir=OLD_LOGS_DIR, workers=None):
+    # Returns ({archive name: {"size", "mtime", "result"}}, parsed count).
+    # Only archives whose (size, mtime) changed since the last run are parsed again.
+    cache_path = os.path.join(archive_dir, CACHE_FILE)
+    cached = load_cache(cache_path)
+    archives = {}
+    pending = []
+    for entry in os.scandir(archive_dir):
+        if not ARCHIVE_NAME_RE.match(entry.name):
+            continue
+        stat = entry.stat()
+        previous = cached.get(entry.name)
+        if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+            archives[entry.name] = previous
+        else:
+            pending.append((entry.name, entry.path, stat))
+
+    if pending:
+        if len(pending) == 1:
+            results = [analyze_archive(pending[0][1])]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(analyze_archive, [path for _, path, _ in pending], chunksize=1))
+        for (name, _, stat), result in zip(pending, results):
+            archives[name] = {"size": stat.st_size, "mtime": stat.st_mtime, "result": result}
+    if pending or len(archives) != len(cached):
+        save_cache(cache_path, archives)
+    return archives, len(pending)
+
+def collect_sessions(archive_dir=OLD_LOGS_DIR, workers=None):
+    archives, parsed = collect_archives(archive_dir, workers)
+    sessions = [session for _, session in join_sessions(archives)]
+    return sessions, len(archives), parsed
+
+def summarize(sessions):
+    players = {}
+    daily = defaultdict(set)
+    changes = []
+    for name, xuid, start, end in sessions:
+        player = players.setdefault(name, {"xuid": xuid, "sessions": 0, "playtime": 0.0,
+                                           "first_seen": start, "last_seen": end})
+        player["xuid"] = player["xuid"] or xuid
+        player["sessions"] += 1
+        player["playtime"] += end - start
+        player["first_seen"] = min(player["first_seen"], start)
+        player["last_seen"] = max(player["last_seen"], end)
+        day = datetime.fromtimestamp(start).date()
+        last_day = datetime.fromtimestamp(end).date()
+        while day <= last_day:
+            daily[day.isoformat()].add(name)
+            day += timedelta(days=1)
+        changes.append((start, 1))
+        changes.append((end, -1))
+
+    # Sweep; at equal times disconnects go first so back-to-back sessions do not overlap
+    peak, peak_time, current = 0, None, 0
+    for moment, delta in sorted(changes, key=lambda change: (change[0], change[1])):
+        current += delta
+        if current > peak:
+            peak, peak_time = current, moment
+    return {
+        "players": players,
+        "peak_concurrency": peak,
+        "peak_time": peak_time,
+        "daily_active": {day: len(names) for day, names in sorted(daily.items())},
+    }
+
+def format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}m"
+
+def main():
+    parser = argparse.ArgumentParser(description="Playtime and session analytics over old_logs/")
+    parser.add_argument("--dir", default=OLD_LOGS_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--top", type=int, default=20, help="players to list by playtime")
+    parser.add_argument("--days", type=int, default=14, help="recent days of daily active counts to list")
+    parser.add_argument("--json", action="store_true", help="print the full summary as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    sessions, archive_count, parsed = collect_sessions(args.dir, args.workers)
+    summary = summarize(sessions)
+    elapsed = time.perf_counter() - start
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{archive_count} archive(s), {parsed} parsed, {len(sessions)} sessions in {elapsed:.2f}s")
+    if summary["peak_time"]:
+        print(f"Peak concurrency: {summary['peak_concurrency']} at "
+              f"{datetime.fromtimestamp(summary['peak_time']):%Y-%m-%d %H:%M}")
+    print("\nTop players by playtime:")
+    ranked = sorted(summary["players"].items(), key=lambda item: item[1]["playtime"], reverse=True)
+    for name, player in ranked[:args.top]:
+        print(f"  {name:<20} {format_duration(player['playtime']):>10}  {player['sessions']:>5} sessions  "
+              f"last seen {datetime.fromtimestamp(player['last_seen']):%Y-%m-%d %H:%M}")
+    print("\nDaily active players:")
+    for day, count in list(summary["daily_active"].items())[-args.days:]:
+        print(f"  {day}  {count}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import bisect
+import gzip
+import json
+import mmap
+import os
+import re
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime
+from itertools import accumulate, chain
+
+from bds_events import iter_matches, event_from_match, parse_timestamp
+
+OLD_LOGS_DIR = "old_logs"
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+READ_CHUNK = 4 * 1024 * 1024
+MEMBER_READ = 256 * 1024
+MEMBER_CACHE = 4  # decompressed members kept while one archive's lines are read
+
+WORD_RE = re.compile(r"[a-z0-9_]{3,}")
+LINE_TIME_RE = re.compile(rb"\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)")
+ARCHIVE_NAME_RE = re.compile(r"^server_log_.*\.txt(?:\.gz)?$")
+
+Result = namedtuple("Result", "time archive line")
+
+def archive_stem(path):
+    if path.endswith(".gz"):
+        path = path[:-3]
+    return path[:-4] if path.endswith(".txt") else path
+
+def index_path_for(archive_path):
+    return archive_stem(archive_path) + INDEX_SUFFIX
+
+def event_terms(event):
+    terms = ["event:" + event.kind]
+    name = event.data.get("name")
+    if name:
+        terms.append("player:" + name.lower())
+    if event.data.get("xuid"):
+        terms.append("xuid:" + event.data["xuid"])
+    text = event.data.get("text")
+    if text:
+        terms.extend("word:" + word for word in set(WORD_RE.findall(text.lower())))
+    return terms
+
+def read_chunks(archive_path, blocks):
+    # Yields the archive's bytes in chunks. Each gzip member is decompressed on its own, and its
+    # (uncompressed offset, compressed offset) is appended to blocks.
+    with open(archive_path, "rb") as archive:
+        if not archive_path.endswith(".gz"):
+            while True:
+                chunk = archive.read(READ_CHUNK)
+                if not chunk:
+                    return
+                yield chunk
+        raw = b""
+        compressed = uncompressed = 0
+        decompressor = None
+        while True:
+            if not raw:
+                raw = archive.read(READ_CHUNK)
+                if not raw:
+                    return
+            if decompressor is None:
+                blocks.append((uncompressed, compressed))
+                decompressor = zlib.decompressobj(31)
+            size = len(raw)
+            chunk = decompressor.decompress(raw, READ_CHUNK)
+            if decompressor.eof:
+                raw = decompressor.unused_data
+                decompressor = None
+            else:
+                raw = decompressor.unconsumed_tail
+            compressed += size - len(raw)
+            uncompressed += len(chunk)
+            if chunk:
+                yield chunk
+
+def build_index(archive_path):
+    # Scans the archive once in chunks. Text is decoded as latin-1 so string offsets equal byte
+    # offsets; names are re-decoded as UTF-8 before they become terms.
+    postings = {}
+    blocks = []
+    start = end = None
+    offset = 0
+    partial = b""
+    for chunk in chain(read_chunks(archive_path, blocks), [b""]):
+        data = partial + chunk
+        cut = len(data) if not chunk else data.rfind(b"\n") + 1
+        partial = data[cut:]
+        text = data[:cut].decode("latin-1")
+        for line_start, match in iter_matches(text):
+            line_end = text.find("\n", match.end())
+            line = text[line_start:line_end if line_end >= 0 else len(text)]
+            event = event_from_match(match, line.encode("latin-1").decode("utf-8", "replace"))
+            stamp = match.group("ts")
+            if stamp:
+                event_time = parse_timestamp(stamp)
+                if event_time:
+                    start = event_time if start is None else min(start, event_time)
+                    end = event_time if end is None else max(end, event_time)
+            for term in event_terms(event):
+                postings.setdefault(term, []).append(offset + line_start)
+        offset += cut
+
+    if start is None:
+        start = end = os.path.getmtime(archive_path)
+    index = {
+        "version": INDEX_VERSION,
+        "archive": os.path.basename(archive_path),
+        "size": offset,
+        "start": start,
+        "end": end,
+        # Where each gzip member starts, so a search only decompresses the members holding its lines
+        "blocks": blocks,
+        # Offsets are ascending, so store gaps; they gzip far smaller than absolute positions
+        "terms": {term: [offsets[0]] + [b - a for a, b in zip(offsets, offsets[1:])]
+                  for term, offsets in postings.items()},
+    }
+    index_path = index_path_for(archive_path)
+    tmp_path = index_path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as index_file:
+        json.dump(index, index_file, separators=(",", ":"))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+def find_archive(stem):
+    for path in (stem + ".txt", stem + ".txt.gz"):
+        if os.path.exists(path):
+            return path
+    return None
+
+def read_member(archive, start, end):
+    # end is where the next member starts, or None for the last one
+    archive.seek(start)
+    decompressor = zlib.decompressobj(31)
+    data = []
+    while not decompressor.eof:
+        raw = archive.read(MEMBER_READ if end is None else min(MEMBER_READ, end - archive.tell()))
+        if not raw:
+            break
+        data.append(decompressor.decompress(raw))
+    return b"".join(data)
+
+def read_block_lines(archive_path, offsets, blocks):
+    # Decompresses only the members that hold the wanted lines, each once
+    starts = [block[0] for block in blocks]
+    members = {}
+    with open(archive_path, "rb") as archive:
+        def member(number):
+            if number not in members:
+                if len(members) >= MEMBER_CACHE:
+                    members.pop(next(iter(members)))
+                members[number] = read_member(archive, blocks[number][1],
+                                              blocks[number + 1][1] if number + 1 < len(blocks) else None)
+            return members[number]
+
+        for offset in offsets:
+            number = bisect.bisect_right(starts, offset) - 1
+            data = member(number)[offset - starts[number]:]
+            # A line only runs into the next member if the archive was not split at line ends
+            while b"\n" not in data and number + 1 < len(blocks):
+                number += 1
+                data += member(number)
+            end = data.find(b"\n")
+            yield offset, data[:end if end >= 0 else len(data)].rstrip(b"\r")
+
+def read_lines(archive_path, offsets, blocks=None):
+    # Plain archives are memory-mapped and read lazily in the order given. Gzip ones written in
+    # blocks are read member by member; a single-member gzip can only seek forward, so it is read
+    # in ascending order first.
+    if archive_path.endswith(".gz") and blocks and len(blocks) > 1:
+        yield from read_block_lines(archive_path, offsets, blocks)
+        return
+    if archive_path.endswith(".gz"):
+        lines = {}
+        with gzip.open(archive_path, "rb") as archive:
+            for offset in sorted(offsets):
+                archive.seek(offset)
+                lines[offset] = archive.readline().rstrip(b"\r\n")
+        for offset in offsets:
+            yield offset, lines[offset]
+        return
+    with open(archive_path, "rb") as archive:
+        if os.fstat(archive.fileno()).st_size == 0:
+            return
+        with mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            for offset in offsets:
+                end = view.find(b"\n", offset)
+                yield offset, view[offset:end if end >= 0 else len(view)].rstrip(b"\r")
+
+class ArchiveSearch:
+    def __init__(self, archive_dir=OLD_LOGS_DIR):
+        self.archive_dir = archive_dir
+        self._indexes = {}  # index path -> (mtime, header, terms)
+        self._postings = {}  # (index path, term) -> absolute offsets
+
+    def index_archives(self):
+        # Indexes archives that predate the indexer or whose index went missing
+        built = []
+        for entry in os.scandir(self.archive_dir):
+            if ARCHIVE_NAME_RE.match(entry.name) and not os.path.exists(index_path_for(entry.path)):
+                built.append(build_index(entry.path))
+        return built
+
+    def _load(self, index_path):
+        mtime = os.path.getmtime(index_path)
+        cached = self._indexes.get(index_path)
+        if cached and cached[0] == mtime:
+            return cached
+        with gzip.open(index_path, "rt", encoding="utf-8") as index_file:
+            index = json.load(index_file)
+        terms = index.pop("terms")
+        cached = self._indexes[index_path] = (mtime, index, terms)
+        self._postings = {key: value for key, value in self._postings.items() if key[0] != index_path}
+        return cached
+
+    def _offsets(self, index_path, terms, term):
+        key = (index_path, term)
+        offsets = self._postings.get(key)
+        if offsets is None:
+            offsets = self._postings[key] = list(accumulate(terms.get(term, ())))
+        return offsets
+
+    def search(self, player=None, kind=None, text=None, xuid=None, since=None, until=None, limit=100):
+        # Newest matches first. since/until are epoch seconds.
+        query = []
+        if player:
+            query.append("player:" + player.lower())
+        if kind:
+            query.append("event:" + kind)
+        if xuid:
+            query.append("xuid:" + xuid)
+        if text:
+            words = WORD_RE.findall(text.lower())
+            if not words:
+                raise ValueError("text must contain a word of at least 3 letters or digits")
+            query.extend("word:" + word for word in words)
+        if not query:
+            raise ValueError("search needs a player, kind, xuid or text")
+
+        try:
+            index_paths = [entry.path for entry in os.scandir(self.archive_dir) if entry.name.endswith(INDEX_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        headers = []
+        for index_path in index_paths:
+            try:
+                _, header, terms = self._load(index_path)
+            except (OSError, ValueError):
+                continue
+            if (since and header["end"] < since) or (until and header["start"] > until):
+                continue
+            headers.append((header["end"], index_path, header, terms))
+        headers.sort(key=lambda entry: (entry[0], entry[1]), reverse=True)
+
+        results = []
+        for _, index_path, header, terms in headers:
+            if any(term not in terms for term in query):
+                continue
+            matched = None
+            for term in sorted(query, key=lambda term: len(terms[term])):
+                offsets = self._offsets(index_path, terms, term)
+                matched = set(offsets) if matched is None else matched.intersection(offsets)
+                if not matched:
+                    break
+            if not matched:
+                continue
+            archive_path = find_archive(index_path[:-len(INDEX_SUFFIX)])
+            if archive_path is None:
+                continue
+            blocks = header.get("blocks") if archive_path.endswith(".gz") else None
+            for _, raw in read_lines(archive_path, sorted(matched, reverse=True), blocks):
+                stamp = LINE_TIME_RE.match(raw)
+                line_time = parse_timestamp(stamp.group(1).decode("ascii")) if stamp else None
+                if line_time and ((since and line_time < since) or (until and line_time > until)):
+                    continue
+                results.append(Result(line_time, os.path.basename(archive_path), raw.decode("utf-8", "replace")))
+                if len(results) >= limit:
+                    return results
+        return results
+
+def parse_when(value):
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD[ HH:MM[:SS]], got {value!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Search archived server logs in old_logs/")
+    parser.add_argument("--dir", default=OLD_LOGS_DIR)
+    parser.add_argument("--player")
+    parser.add_argument("--kind", help="event kind, e.g. player_connected, error, command_result")
+    parser.add_argument("--xuid")
+    parser.add_argument("--text", help="words that must appear in a command result, error or warning")
+    parser.add_argument("--since", type=parse_when)
+    parser.add_argument("--until", type=parse_when)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--index", action="store_true", help="index archives that have no index yet")
+    args = parser.parse_args()
+
+    search = ArchiveSearch(args.dir)
+    if args.index:
+        for index_path in search.index_archives():
+            print(f"indexed {index_path}")
+    if not (args.player or args.kind or args.xuid or args.text):
+        return
+    start = time.perf_counter()
+    try:
+        results = search.search(args.player, args.kind, args.text, args.xuid, args.since, args.until, args.limit)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = (time.perf_counter() - start) * 1000
+    for result in results:
+        print(f"{result.archive}  {result.line}")
+    print(f"{len(results)} match(es) in {elapsed:.1f} ms")
+
+if __name__ == "__main__":
+    main()
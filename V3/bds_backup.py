@@ -0,0 +1,340 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import stat
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from bds_funcpack import level_name
+from bds_metrics import BACKUP_SECONDS, BACKUP_BYTES
+from bds_scheduler import URGENT
+
+BACKUP_DIR = "backups"
+KEEP_LAST = 24  # newest snapshots always kept
+KEEP_DAILY = 14  # plus the newest snapshot of each of this many days
+QUERY_TIMEOUT = 60
+QUERY_INTERVAL = 1.0
+COPY_BUFFER = 1024 * 1024
+
+SAVE_READY = "Data saved. Files are now ready to be copied."
+PREFIX_RE = re.compile(r"^\[[^\]]*\] ")
+# "Bedrock level/db/000005.ldb:1024, Bedrock level/level.dat:2048, ..." (paths relative to worlds/)
+FILE_LIST_RE = re.compile(r"(?:^|, )(?P<path>[^,]+?):(?P<length>\d+)(?=, |$)")
+
+Snapshot = namedtuple("Snapshot", "name created files bytes")
+
+def parse_file_list(line):
+    return [(match["path"], int(match["length"])) for match in FILE_LIST_RE.finditer(PREFIX_RE.sub("", line.strip()))]
+
+def world_files(world_root, world_dir):
+    # With the server stopped nothing is being written, so every file is taken whole
+    files = []
+    for root, _, names in os.walk(world_dir):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, world_root).replace(os.sep, "/"), os.path.getsize(path)))
+    if not files:
+        raise RuntimeError(f"no world at {world_dir}")
+    return files
+
+def remove_tree(path):
+    # Stored objects are read-only, which Windows will not delete without clearing the flag first
+    def clear_and_retry(function, target, _):
+        os.chmod(target, stat.S_IWRITE)
+        function(target)
+    shutil.rmtree(path, onerror=clear_and_retry)
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        # No hard links on this filesystem: the snapshot gets its own copy
+        shutil.copyfile(source, target)
+
+class BackupStore:
+    # Content-addressed store: every distinct file version is kept once under objects/, and each
+    # snapshot is a directory of hard links to them plus a manifest. A LevelDB world mostly consists
+    # of immutable .ldb files, so a new snapshot usually copies a handful of files.
+    def __init__(self, path):
+        self.path = path
+        self.objects_dir = os.path.join(path, "objects")
+        self.snapshots_dir = os.path.join(path, "snapshots")
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def snapshots(self):
+        # Newest first
+        try:
+            names = sorted((entry.name for entry in os.scandir(self.snapshots_dir)
+                            if entry.is_dir() and not entry.name.endswith(".partial")), reverse=True)
+        except FileNotFoundError:
+            return []
+        snapshots = []
+        for name in names:
+            manifest = self.manifest(name)
+            if manifest is not None:
+                snapshots.append(Snapshot(name, manifest["created"], len(manifest["files"]),
+                                          sum(entry["length"] for entry in manifest["files"].values())))
+        return snapshots
+
+    def manifest(self, name):
+        # Names come from the API too: anything that is not a plain directory name is not a snapshot
+        if not name or os.path.basename(name) != name or name in (".", ".."):
+            return None
+        try:
+            with open(os.path.join(self.snapshots_dir, name, "manifest.json"), encoding="utf-8") as manifest_file:
+                return json.load(manifest_file)
+        except (OSError, ValueError):
+            return None
+
+    def snapshot(self, world_root, files):
+        # files: [(path relative to world_root, length)]; only the first length bytes of each are taken,
+        # as BDS asks. Unchanged files (same length and mtime as in the last snapshot) are not even read.
+        # Returns (Snapshot, bytes copied, bytes already in the store).
+        latest = self.snapshots()
+        previous = self.manifest(latest[0].name)["files"] if latest else {}
+        name = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        counter = 1
+        while os.path.exists(os.path.join(self.snapshots_dir, name)):
+            name = f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}_{counter}"
+            counter += 1
+        partial = os.path.join(self.snapshots_dir, name + ".partial")
+        os.makedirs(partial)
+        manifest = {}
+        copied = reused = 0
+        for path, length in files:
+            source = os.path.join(world_root, *path.split("/"))
+            mtime_ns = os.stat(source).st_mtime_ns
+            old = previous.get(path)
+            if old and old["length"] == length and old["mtime_ns"] == mtime_ns and os.path.exists(self.object_path(old["hash"])):
+                digest, new = old["hash"], False
+            else:
+                digest, new = self.store(source, length)
+            if new:
+                copied += length
+            else:
+                reused += length
+            target = os.path.join(partial, *path.split("/"))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            link_or_copy(self.object_path(digest), target)
+            manifest[path] = {"hash": digest, "length": length, "mtime_ns": mtime_ns}
+        with open(os.path.join(partial, "manifest.json"), "w", encoding="utf-8") as manifest_file:
+            json.dump({"created": time.time(), "files": manifest}, manifest_file, indent=1)
+        os.replace(partial, os.path.join(self.snapshots_dir, name))
+        return Snapshot(name, time.time(), len(manifest), copied + reused), copied, reused
+
+    def store(self, source, length):
+        # Copies and hashes in one pass; returns (digest, True if this content was not stored yet)
+        os.makedirs(self.objects_dir, exist_ok=True)
+        tmp_path = os.path.join(self.objects_dir, f"incoming_{threading.get_ident()}.tmp")
+        digest = hashlib.sha256()
+        remaining = length
+        with open(source, "rb") as src, open(tmp_path, "wb") as dst:
+            while remaining > 0:
+                block = src.read(min(COPY_BUFFER, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                dst.write(block)
+                remaining -= len(block)
+        digest = digest.hexdigest()
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            os.remove(tmp_path)
+            return digest, False
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.chmod(tmp_path, stat.S_IREAD)
+        os.replace(tmp_path, object_path)
+        return digest, True
+
+    def prune(self, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY):
+        snapshots = self.snapshots()
+        keep = {snapshot.name for snapshot in snapshots[:keep_last]}
+        days = {}
+        for snapshot in snapshots:
+            day = snapshot.name[:10]
+            if day not in days and len(days) < keep_daily:
+                days[day] = snapshot.name
+        keep.update(days.values())
+        removed = [snapshot.name for snapshot in snapshots if snapshot.name not in keep]
+        for name in removed:
+            remove_tree(os.path.join(self.snapshots_dir, name))
+        self.collect_garbage()
+        return removed
+
+    def collect_garbage(self):
+        # Removes objects no snapshot's manifest names. Link counts cannot tell: where link_or_copy had
+        # to copy, every object has a single link.
+        live = set()
+        for snapshot in self.snapshots():
+            manifest = self.manifest(snapshot.name)
+            if manifest is not None:
+                live.update(entry["hash"] for entry in manifest["files"].values())
+        freed = 0
+        for root, _, names in os.walk(self.objects_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                info = os.stat(path)
+                if name not in live and not name.endswith(".tmp"):
+                    os.chmod(path, stat.S_IWRITE)
+                    os.remove(path)
+                    freed += info.st_size
+        return freed
+
+    def restore(self, name, world_dir):
+        # Replaces world_dir with the snapshot's files; the current world is kept beside it, not deleted
+        manifest = self.manifest(name)
+        if manifest is None:
+            raise ValueError(f"no snapshot named {name}")
+        snapshot_dir = os.path.join(self.snapshots_dir, name)
+        level = os.path.basename(world_dir.rstrip("/\\"))
+        staging = world_dir + ".restoring"
+        if os.path.exists(staging):
+            remove_tree(staging)
+        copied = 0
+        for path in manifest["files"]:
+            parts = path.split("/")
+            if parts[0] != level:
+                continue
+            target = os.path.join(staging, *parts[1:])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # A plain copy: BDS must never write into a file that is hard-linked into the store
+            shutil.copyfile(os.path.join(snapshot_dir, *parts), target)
+            copied += 1
+        if not copied:
+            # Taken under another level-name: leave the current world alone
+            levels = sorted({path.split("/")[0] for path in manifest["files"]})
+            raise ValueError(f"snapshot {name} has no files for {level!r} (it holds {', '.join(levels) or 'nothing'})")
+        aside = None
+        if os.path.exists(world_dir):
+            aside = f"{world_dir}.before-restore-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}"
+            os.replace(world_dir, aside)
+        try:
+            os.replace(staging, world_dir)
+        except OSError:
+            if aside is not None:
+                os.replace(aside, world_dir)
+            raise
+        return aside
+
+class BackupManager:
+    # Consistent backups of a running server over its own stdin/stdout: "save hold", then "save query"
+    # until BDS lists the files and lengths to copy, then "save resume" whatever happens.
+    def __init__(self, instance, store_dir, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY):
+        self.instance = instance
+        self.store = BackupStore(store_dir)
+        self.keep_last = keep_last
+        self.keep_daily = keep_daily
+        self._lock = threading.Lock()
+        self._waiting = False
+        self._expect_list = False
+        self._files = None
+        self._ready = threading.Event()
+        instance.on_output.append(self._watch)
+
+    @property
+    def world_root(self):
+        return os.path.join(self.instance.server_dir, "worlds")
+
+    @property
+    def world_dir(self):
+        return os.path.join(self.world_root, level_name(self.instance.server_dir))
+
+    def _watch(self, line):
+        # Runs on the reader: only looks at lines while a query is outstanding
+        if not self._waiting:
+            return
+        if self._expect_list:
+            files = parse_file_list(line)
+            if files:
+                self._files = files
+                self._expect_list = False
+                self._ready.set()
+        elif SAVE_READY in line:
+            self._expect_list = True
+
+    def backup(self):
+        # Blocking; run it off the Tk thread. Returns the Snapshot.
+        with self._lock:
+            start = time.perf_counter()
+            if self.instance.process is None:
+                snapshot, copied, reused = self.store.snapshot(self.world_root, world_files(self.world_root, self.world_dir))
+            else:
+                try:
+                    files = self.hold()
+                    snapshot, copied, reused = self.store.snapshot(self.world_root, files)
+                finally:
+                    self.instance.send_commands(["save resume"], URGENT)
+            elapsed = time.perf_counter() - start
+            self.store.prune(self.keep_last, self.keep_daily)
+        BACKUP_SECONDS.labels(self.instance.name).observe(elapsed)
+        BACKUP_BYTES.labels(self.instance.name, "copied").inc(copied)
+        BACKUP_BYTES.labels(self.instance.name, "reused").inc(reused)
+        self.instance.emit(f"[Manager] Backup {snapshot.name}: {snapshot.files} files, {copied / 1e6:.1f} MB copied, "
+                           f"{reused / 1e6:.1f} MB unchanged, {elapsed:.1f}s\n")
+        return snapshot
+
+    def hold(self):
+        self._files = None
+        self._expect_list = False
+        self._ready.clear()
+        self._waiting = True
+        try:
+            self.instance.send_commands(["save hold"], URGENT)
+            deadline = time.monotonic() + QUERY_TIMEOUT
+            while time.monotonic() < deadline:
+                # BDS answers "A previous save has not been completed." until the files are ready
+                self.instance.send_commands(["save query"], URGENT)
+                if self._ready.wait(QUERY_INTERVAL):
+                    return self._files
+            raise RuntimeError(f"BDS did not list the files to copy within {QUERY_TIMEOUT}s")
+        finally:
+            self._waiting = False
+
+    def snapshots(self):
+        return self.store.snapshots()
+
+    def restore(self, name):
+        if self.instance.process is not None:
+            raise RuntimeError("stop the server before restoring a backup")
+        with self._lock:
+            aside = self.store.restore(name, self.world_dir)
+        self.instance.emit(f"[Manager] Restored backup {name}" + (f", previous world kept as {aside}" if aside else "") + "\n")
+        return aside
+
+def main():
+    parser = argparse.ArgumentParser(description="Take, list, prune and restore world backups")
+    parser.add_argument("--store", default=BACKUP_DIR, help="backup store (the server's data_dir/backups)")
+    parser.add_argument("--list", action="store_true", help="list snapshots, newest first")
+    parser.add_argument("--backup", action="store_true",
+                        help="snapshot the world now; only while the server is stopped (the manager backs up running servers)")
+    parser.add_argument("--restore", metavar="SNAPSHOT", help="restore a snapshot; the server must be stopped")
+    parser.add_argument("--server-dir", default=".", help="BDS directory holding worlds/ and server.properties")
+    parser.add_argument("--prune", action="store_true", help="apply the retention policy now")
+    parser.add_argument("--keep-last", type=int, default=KEEP_LAST)
+    parser.add_argument("--keep-daily", type=int, default=KEEP_DAILY)
+    args = parser.parse_args()
+    store = BackupStore(args.store)
+    world_root = os.path.join(args.server_dir, "worlds")
+    world_dir = os.path.join(world_root, level_name(args.server_dir))
+    if args.backup:
+        snapshot, copied, reused = store.snapshot(world_root, world_files(world_root, world_dir))
+        print(f"{snapshot.name}: {snapshot.files} files, {copied / 1e6:.1f} MB copied, {reused / 1e6:.1f} MB unchanged")
+    if args.prune:
+        for name in store.prune(args.keep_last, args.keep_daily):
+            print(f"removed {name}")
+    if args.restore:
+        aside = store.restore(args.restore, world_dir)
+        print(f"restored {args.restore} into {world_dir}" + (f", previous world moved to {aside}" if aside else ""))
+    if args.list or not (args.backup or args.prune or args.restore):
+        for snapshot in store.snapshots():
+            print(f"{snapshot.name}  {snapshot.files:>6} files  {snapshot.bytes / 1e6:>9.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,854 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bds_ipc import CommandServer, CommandClient, append_command_file
+from bds_events import parse_text, EventBus, SERVER_STARTED
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAKE_BDS = os.path.join(HERE, "bds_fake.py")
+BANNER_LINES = 11  # lines bds_fake.py prints before "Server started." counts as output
+
+# Stand-in for bedrock_server.exe: echoes every stdin line back on stdout
+ECHO_SERVER = "import sys\nfor line in sys.stdin:\n    sys.stdout.write(line)\n    sys.stdout.flush()\n"
+
+# Stand-in for a busy server: a log line every 10 ms, players coming and going, exits on "stop"
+CHATTY_SERVER = '''import sys, threading, time
+def chatter():
+    i = 0
+    while True:
+        i += 1
+        stamp = time.strftime("[%Y-%m-%d %H:%M:%S:000 INFO] ")
+        if i % 50 == 0:
+            print(f"{stamp}Player connected: Player{i % 7}, xuid: {2535400000000000 + i % 7}", flush=True)
+        elif i % 50 == 25:
+            print(f"{stamp}Player disconnected: Player{i % 7}, xuid: {2535400000000000 + i % 7}", flush=True)
+        else:
+            print(f"{stamp}Running AutoCompaction... {i}", flush=True)
+        time.sleep(0.01)
+threading.Thread(target=chatter, daemon=True).start()
+for line in sys.stdin:
+    if line.strip() == "stop":
+        break
+'''
+
+# Writes lines to stdout as fast as it can and records how long each write blocked
+FLOOD_SERVER = '''import json, sys, time
+count, stats_path = int(sys.argv[1]), sys.argv[2]
+out = sys.stdout.buffer
+block = []
+worst = 0.0
+start = time.perf_counter()
+for i in range(count):
+    block.append(b"[2026-01-01 10:00:00:000 INFO] Running AutoCompaction... flood line %d\\n" % i)
+    if i % 500 == 499 or i == count - 1:
+        before = time.perf_counter()
+        out.write(b"".join(block))
+        out.flush()
+        worst = max(worst, time.perf_counter() - before)
+        block = []
+elapsed = time.perf_counter() - start
+json.dump({"worst_ms": worst * 1000, "elapsed": elapsed}, open(stats_path, "w"))
+'''
+
+# Runs N ServerInstances of CHATTY_SERVER on one core loop and reports its own peak RSS and CPU time
+INSTANCE_PROBE = '''import json, os, resource, sys, time
+from bds_core import EventLoopThread
+from bds_instance import ServerConfig, ServerInstance
+from bds_lifecycle import STOPPED
+count, workdir, seconds, script = int(sys.argv[1]), sys.argv[2], float(sys.argv[3]), sys.argv[4]
+core = EventLoopThread()
+instances = [ServerInstance(ServerConfig(name=f"s{i}", path=sys.executable, args=("-c", script),
+                                         data_dir=os.path.join(workdir, f"s{i}"), command_port=0), core)
+             for i in range(count)]
+for instance in instances:
+    instance.open()
+    instance.start()
+time.sleep(seconds)
+for instance in instances:
+    instance.stop()
+deadline = time.time() + 30
+while any(instance.state != STOPPED for instance in instances) and time.time() < deadline:
+    time.sleep(0.05)
+usage = resource.getrusage(resource.RUSAGE_SELF)
+print(json.dumps({"rss_kb": usage.ru_maxrss, "cpu": usage.ru_utime + usage.ru_stime}))
+'''
+
+def report(name, values_ms, count, elapsed, lost=0):
+    values_ms = sorted(values_ms)
+    p99 = values_ms[min(len(values_ms) - 1, int(len(values_ms) * 0.99))]
+    print(f"{name:<28} {count:>7} cmds  {count / elapsed:>10.0f} cmd/s  "
+          f"p50 {statistics.median(values_ms):7.3f} ms  p99 {p99:7.3f} ms  max {values_ms[-1]:7.3f} ms  lost {lost}")
+
+def latencies(received, sent):
+    return [(received[command] - sent_at) * 1000 for command, sent_at in sent.items() if command in received]
+
+class EchoPipeline:
+    # Forwards commands into a child process' stdin and timestamps them as they come back
+    def __init__(self):
+        self.process = subprocess.Popen([sys.executable, "-u", "-c", ECHO_SERVER], stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, text=True, bufsize=1)
+        self.lock = threading.Lock()
+        self.received = {}
+        self.done = threading.Event()
+        self.expected = 0
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def forward(self, commands):
+        with self.lock:
+            self.process.stdin.write("".join(command + "\n" for command in commands))
+            self.process.stdin.flush()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.received[line.strip()] = time.perf_counter()
+            if len(self.received) >= self.expected:
+                self.done.set()
+
+    def expect(self, count):
+        self.received = {}
+        self.expected = count
+        self.done.clear()
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+def bench_command_channel(count):
+    workdir = tempfile.mkdtemp()
+    command_file = os.path.join(workdir, "server_commands.txt")
+    pipeline = EchoPipeline()
+    server = CommandServer(pipeline.forward, port=0, command_file=command_file)
+    server.start()
+    client = CommandClient(port=server.port, command_file=command_file, token=server.token)
+
+    # One frame per command, as the player list does for interactive actions
+    pipeline.expect(count)
+    sent = {}
+    start = time.perf_counter()
+    for i in range(count):
+        command = f"say single {i}"
+        sent[command] = time.perf_counter()
+        client.send([command])
+    pipeline.done.wait(60)
+    elapsed = time.perf_counter() - start
+    report("socket, frame per command", latencies(pipeline.received, sent), count, elapsed, count - len(pipeline.received))
+
+    # Whole burst in a single frame
+    pipeline.expect(count)
+    commands = [f"say burst {i}" for i in range(count)]
+    start = time.perf_counter()
+    client.send(commands)
+    pipeline.done.wait(60)
+    elapsed = time.perf_counter() - start
+    report("socket, one frame burst", latencies(pipeline.received, dict.fromkeys(commands, start)), count, elapsed,
+           count - len(pipeline.received))
+
+    # Fallback file while the socket is unavailable
+    client.close()
+    pipeline.expect(count)
+    commands = [f"say file {i}" for i in range(count)]
+    start = time.perf_counter()
+    for command in commands:
+        append_command_file([command], command_file)
+    pipeline.done.wait(60)
+    elapsed = time.perf_counter() - start
+    report("fallback command file", latencies(pipeline.received, dict.fromkeys(commands, start)), count, elapsed,
+           count - len(pipeline.received))
+
+    server.stop()
+    pipeline.close()
+
+# What "Open Player List" used to cost: a fresh interpreter that imports Tk and builds the panel
+PANEL_PROBE = "import tkinter as tk\nfrom bds_pl import PlayerListPanel\nroot = tk.Tk()\nPlayerListPanel(root)\nroot.update()\n"
+
+def bench_panel_startup(runs):
+    import tkinter as tk
+    from bds_pl import PlayerListPanel
+    from bds_roster import RosterTracker
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"panel startup skipped, no display: {e}")
+        return
+    root.withdraw()
+
+    subprocess_ms = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", PANEL_PROBE], cwd=HERE, check=True)
+        subprocess_ms.append((time.perf_counter() - start) * 1000)
+
+    in_process_ms = []
+    roster = RosterTracker(log_file=None)
+    for _ in range(runs):
+        start = time.perf_counter()
+        window = tk.Toplevel(root)
+        PlayerListPanel(window, roster=roster, command_sink=lambda commands: None)
+        window.update()
+        in_process_ms.append((time.perf_counter() - start) * 1000)
+        window.destroy()
+    root.destroy()
+
+    print(f"{'panel, new interpreter':<28} p50 {statistics.median(subprocess_ms):8.1f} ms")
+    print(f"{'panel, in-process Toplevel':<28} p50 {statistics.median(in_process_ms):8.1f} ms")
+
+def synthetic_log(count, players=50, seed=1):
+    # Mostly noise, like a busy server, with connects/disconnects, errors and command results mixed in
+    rng = random.Random(seed)
+    names = [f"Player{i}" for i in range(players)]
+    lines = []
+    for i in range(count):
+        stamp = f"[2025-02-16 {i // 3600000 % 24:02d}:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}:{i % 1000:03d} INFO] "
+        roll = rng.random()
+        name = rng.choice(names)
+        if roll < 0.01:
+            lines.append(f"{stamp}Player connected: {name}, xuid: {2535400000000000 + hash(name) % 100000}")
+        elif roll < 0.02:
+            lines.append(f"{stamp}Player disconnected: {name}, xuid: {2535400000000000 + hash(name) % 100000}, pfid: x")
+        elif roll < 0.025:
+            lines.append(stamp.replace("INFO", "ERROR") + "Failed to load chunk")
+        elif roll < 0.03:
+            lines.append(f"{stamp}Gave Diamond * 1 to {name}")
+        else:
+            lines.append(f"{stamp}Running AutoCompaction... chunk {i % 4096}, {i % 977}")
+    return "\n".join(lines) + "\n"
+
+def bench_event_parser(count):
+    text = synthetic_log(count)
+    lines = text.splitlines(keepends=True)
+    print(f"synthetic log: {count} lines, {len(text) / 1e6:.0f} MB")
+
+    start = time.perf_counter()
+    events = sum(1 for _ in parse_text(text))
+    elapsed = time.perf_counter() - start
+    print(f"{'parse_text (bulk)':<28} {count / elapsed:>12.0f} lines/s  {events} events")
+
+    bus = EventBus()
+    received = []
+    bus.subscribe("*", received.append)
+    start = time.perf_counter()
+    for line in lines:
+        bus.publish_line(line)
+    elapsed = time.perf_counter() - start
+    print(f"{'parse_line + bus (stream)':<28} {count / elapsed:>12.0f} lines/s  {len(received)} events")
+
+    # The old fetch_player_list() loop, for comparison
+    start = time.perf_counter()
+    for line in lines:
+        re.search(r"Player connected: ([^,]+),", line)
+        re.search(r"Player disconnected: ([^,]+)", line)
+    elapsed = time.perf_counter() - start
+    print(f"{'legacy two re.search/line':<28} {count / elapsed:>12.0f} lines/s  (players only)")
+
+def run_instance_probe(count, seconds):
+    workdir = tempfile.mkdtemp()
+    output = subprocess.run([sys.executable, "-c", INSTANCE_PROBE, str(count), workdir, str(seconds), CHATTY_SERVER],
+                            cwd=HERE, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def bench_instances(count, seconds):
+    # Manager-side cost only: the fake servers are children of the probes and are not counted
+    try:
+        import resource  # noqa: F401
+    except ImportError:
+        print("instances benchmark skipped, needs the resource module (Linux/macOS)")
+        return
+    shared = run_instance_probe(count, seconds)
+    separate = [None] * count
+    threads = [threading.Thread(target=lambda i=i: separate.__setitem__(i, run_instance_probe(1, seconds)))
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    separate_rss = sum(probe["rss_kb"] for probe in separate)
+    separate_cpu = sum(probe["cpu"] for probe in separate)
+    print(f"{count} servers, {seconds:.0f}s each, one log line per 10 ms per server")
+    print(f"{'one manager, N instances':<28} rss {shared['rss_kb'] / 1024:8.1f} MB  cpu {shared['cpu']:6.2f} s")
+    print(f"{'N separate managers':<28} rss {separate_rss / 1024:8.1f} MB  cpu {separate_cpu:6.2f} s")
+
+async def websocket_client(port, token, expected, latencies_ms):
+    from bds_daemon import ws_read
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /ws?token={token} HTTP/1.1\r\n".encode()
+                 + b"Host: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                 b"Sec-WebSocket-Key: YmVuY2htYXJrLWtleS0xMg==\r\nSec-WebSocket-Version: 13\r\n\r\n")
+    await reader.readuntil(b"\r\n\r\n")
+    received = 0
+    try:
+        while received < expected:
+            _, payload = await asyncio.wait_for(ws_read(reader), 30)
+            now = time.perf_counter()
+            for message in json.loads(payload):
+                if message["type"] == "console":
+                    received += 1
+                    latencies_ms.append((now - float(message["line"].split(" ", 1)[0])) * 1000)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    writer.close()
+    return received
+
+def bench_websocket(clients, count):
+    # Console lines published at ~20k/s, fanned out to many WebSocket subscribers at once
+    from bds_core import EventLoopThread
+    from bds_daemon import ApiServer
+    from bds_instance import ServerConfig, ServerInstance
+    core = EventLoopThread()
+    instance = ServerInstance(ServerConfig(name="bench", data_dir=tempfile.mkdtemp(), command_port=0), core)
+    api = ApiServer([instance], core, port=0)
+    api.start()
+    client_core = EventLoopThread("bench-clients")
+    latencies_ms = []
+
+    async def connect_all():
+        tasks = [asyncio.ensure_future(websocket_client(api.port, api.token, count, latencies_ms))
+                 for _ in range(clients)]
+        while len(api.hub.subscribers) < clients:
+            await asyncio.sleep(0.01)
+        return tasks
+
+    tasks = client_core.run(connect_all(), 60)
+    start = time.perf_counter()
+    for i in range(count):
+        instance.emit(f"{time.perf_counter()} line {i}\n")
+        if i % 100 == 99:
+            time.sleep(0.005)
+    async def wait_all():
+        return await asyncio.gather(*tasks)
+
+    received = client_core.run(wait_all(), 120)
+    elapsed = time.perf_counter() - start
+    api.stop()
+    delivered = sum(received)
+    print(f"{'websocket fan-out':<28} {clients:>5} clients  {count} lines  {delivered / elapsed:>10.0f} msg/s delivered  "
+          f"p50 {statistics.median(latencies_ms):7.2f} ms  p99 {sorted(latencies_ms)[int(len(latencies_ms) * 0.99)]:7.2f} ms  "
+          f"lost {clients * count - delivered}")
+
+def slow_consumer(consumer, delay):
+    def slow(lines):
+        time.sleep(delay)
+        consumer(lines)
+    return slow
+
+def bench_flood(count, delay=0.05):
+    # A server flooding stdout while the log sink stalls for `delay` per write: the inline reader
+    # (write per line, as read_output() used to) against the channel reader
+    from bds_core import EventLoopThread
+    from bds_instance import ServerConfig, ServerInstance
+    from bds_lifecycle import STOPPED
+    workdir = tempfile.mkdtemp()
+    stats_path = os.path.join(workdir, "flood.json")
+
+    process = subprocess.Popen([sys.executable, "-c", FLOOD_SERVER, str(count), stats_path], stdout=subprocess.PIPE,
+                               text=True, bufsize=1)
+    with open(os.path.join(workdir, "inline.txt"), "w") as log:
+        for i, line in enumerate(process.stdout):
+            log.write(line)
+            if i % 1000 == 999:
+                time.sleep(delay)
+    process.wait()
+    with open(stats_path) as stats_file:
+        inline = json.load(stats_file)
+
+    core = EventLoopThread()
+    instance = ServerInstance(ServerConfig(name="flood", path=sys.executable, args=("-c", FLOOD_SERVER, str(count), stats_path),
+                                           data_dir=workdir, command_port=0, auto_restart=False), core)
+    instance.log_channel.consumer = slow_consumer(instance.write_log, delay)
+    instance.start()
+    deadline = time.time() + 120
+    while instance.state == STOPPED and time.time() < deadline:
+        time.sleep(0.01)
+    while instance.state != STOPPED and time.time() < deadline:
+        time.sleep(0.05)
+    with open(stats_path) as stats_file:
+        channel = json.load(stats_file)
+    stats = instance.stream_stats()[instance.log_channel.name]
+
+    print(f"flood: {count} lines, log sink stalls {delay * 1000:.0f} ms per write")
+    print(f"{'inline reader':<28} server blocked up to {inline['worst_ms']:8.1f} ms  wrote all in {inline['elapsed']:6.2f} s")
+    print(f"{'channel reader':<28} server blocked up to {channel['worst_ms']:8.1f} ms  wrote all in {channel['elapsed']:6.2f} s")
+    print(f"{'log channel':<28} peak {stats['peak']} lines buffered, {stats['spilled']} spilled, "
+          f"{stats['delivered']}/{stats['lines']} delivered, {stats['dropped']} dropped")
+
+def percentiles(values_ms):
+    values_ms = sorted(values_ms)
+    return statistics.median(values_ms), values_ms[min(len(values_ms) - 1, int(len(values_ms) * 0.99))]
+
+def fake_instance(name, workdir, *fake_args, wait=True, server_dir=""):
+    # A ServerInstance supervising bds_fake.py, on its own core loop
+    from bds_core import EventLoopThread
+    from bds_instance import ServerConfig, ServerInstance
+    core = EventLoopThread()
+    instance = ServerInstance(ServerConfig(name=name, path=sys.executable, args=(FAKE_BDS, "--stop-delay", "0", *fake_args),
+                                           workdir=server_dir, data_dir=workdir, command_port=0, stop_timeout=10,
+                                           auto_restart=False), core)
+    started = threading.Event()
+    instance.events.subscribe(SERVER_STARTED, lambda event: started.set())
+    instance.start()
+    if wait and not started.wait(30):
+        raise RuntimeError("bds_fake.py did not start")
+    return instance
+
+def stop_instance(instance):
+    from bds_lifecycle import STOPPED
+    instance.stop()
+    deadline = time.time() + 30
+    while instance.state != STOPPED and time.time() < deadline:
+        time.sleep(0.02)
+    instance.core.stop()
+
+def bench_console(count):
+    # Fake server flooding its console: the reader -> on_output path, then the Tk console on top of it
+    expected = count + BANNER_LINES
+    seen = [0]
+    done = threading.Event()
+
+    def counter(line):
+        seen[0] += 1
+        if seen[0] >= expected:
+            done.set()
+
+    start = time.perf_counter()
+    instance = fake_instance("console", tempfile.mkdtemp(), "--rate", "0", "--flood", str(count), wait=False)
+    instance.on_output.append(counter)
+    done.wait(120)
+    elapsed = time.perf_counter() - start
+    stop_instance(instance)
+    print(f"{'console, reader to on_output':<28} {seen[0]:>8} lines  {seen[0] / elapsed:>10.0f} lines/s")
+
+    import tkinter as tk
+    from tkinter import scrolledtext
+    from bds_console import ConsoleView
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"console widget skipped, no display: {e}")
+        return
+    widget = scrolledtext.ScrolledText(root, width=85, height=20, state=tk.DISABLED)
+    widget.pack()
+    console = ConsoleView(widget)
+    render_ms = []
+    render = console._render
+
+    def timed_render(batch):
+        before = time.perf_counter()
+        render(batch)
+        render_ms.append((time.perf_counter() - before) * 1000)
+
+    console._render = timed_render
+    seen[0] = 0
+    done.clear()
+    start = time.perf_counter()
+    instance = fake_instance("console-tk", tempfile.mkdtemp(), "--rate", "0", "--flood", str(count), wait=False)
+    instance.on_output.append(counter)
+    instance.on_output.append(console.write)
+    deadline = time.time() + 120
+    while (not done.is_set() or console.pending.buffer) and time.time() < deadline:
+        root.update()
+        time.sleep(0.005)
+    root.update()
+    elapsed = time.perf_counter() - start
+    stop_instance(instance)
+    root.destroy()
+    p50, p99 = percentiles(render_ms or [0])
+    print(f"{'console, Tk widget':<28} {seen[0]:>8} lines  {seen[0] / elapsed:>10.0f} lines/s  {len(render_ms)} renders  "
+          f"p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  skipped {console.pending.stats['coalesced']}")
+
+def bench_roundtrip(count, rate=200):
+    # Command to answer through the dispatcher and a fake BDS that is also logging `rate` lines/s.
+    # Commands skip the scheduler, whose rate limit would otherwise be what gets measured.
+    instance = fake_instance("roundtrip", tempfile.mkdtemp(), "--rate", str(rate), "--online", "10")
+    names = [f"Player{i}" for i in range(10)]
+
+    # One at a time, waiting for each answer, like clicks in the player list
+    latencies_ms = []
+    failed = 0
+    start = time.perf_counter()
+    for i in range(count):
+        sent = time.perf_counter()
+        result = instance.dispatcher.submit([f"op {names[i % 10]}"])[0].result(30)
+        latencies_ms.append((time.perf_counter() - sent) * 1000)
+        failed += result.ok is not True
+    report("round trip, one at a time", latencies_ms, count, time.perf_counter() - start, failed)
+
+    # One batch, as a player list action on many players sends it
+    done_at = {}
+    start = time.perf_counter()
+    futures = instance.dispatcher.submit([f"give {names[i % 10]} diamond {i % 64 + 1}" for i in range(count)])
+    for index, future in enumerate(futures):
+        future.add_done_callback(lambda _, index=index: done_at.__setitem__(index, time.perf_counter()))
+    results = [future.result(60) for future in futures]
+    elapsed = time.perf_counter() - start
+    report("round trip, one batch", [(done_at[index] - start) * 1000 for index in done_at], count, elapsed,
+           sum(result.ok is not True for result in results))
+
+    # Selector commands wait out the settle window for every line of their answer
+    runs = 20
+    latencies_ms = []
+    failed = 0
+    start = time.perf_counter()
+    for _ in range(runs):
+        sent = time.perf_counter()
+        result = instance.dispatcher.submit(["op @a"])[0].result(30)
+        latencies_ms.append((time.perf_counter() - sent) * 1000)
+        failed += result.ok is not True or len(result.lines) != len(names)
+    report("round trip, @a selector", latencies_ms, runs, time.perf_counter() - start, failed)
+    stop_instance(instance)
+
+def bench_roster(sizes, panel_players=200):
+    # Roster refresh against the log, as the standalone player list does it, for growing log sizes
+    from bds_roster import RosterTracker
+    workdir = tempfile.mkdtemp()
+    print(f"{'log lines':>10} {'MB':>7} {'first poll':>12} {'idle poll':>12} {'+100 lines':>12}  players")
+    for count in sizes:
+        path = os.path.join(workdir, f"roster_{count}.txt")
+        with open(path, "w", encoding="utf-8") as log:
+            log.write(synthetic_log(count))
+        roster = RosterTracker(path)
+        start = time.perf_counter()
+        roster.poll()
+        first = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(1000):
+            roster.poll()
+        idle = (time.perf_counter() - start) / 1000
+        with open(path, "a", encoding="utf-8") as log:
+            log.write(synthetic_log(100, seed=count))
+        start = time.perf_counter()
+        roster.poll()
+        grown = time.perf_counter() - start
+        print(f"{count:>10} {os.path.getsize(path) / 1e6:>7.1f} {first * 1000:>9.1f} ms {idle * 1e6:>9.1f} us "
+              f"{grown * 1000:>9.2f} ms  {len(roster.names())}")
+
+    import tkinter as tk
+    from bds_pl import PlayerListPanel
+    from bds_events import Event, PLAYER_CONNECTED, PLAYER_DISCONNECTED
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"player list refresh skipped, no display: {e}")
+        return
+    root.withdraw()
+    roster = RosterTracker(log_file=None)
+    window = tk.Toplevel(root)
+    panel = PlayerListPanel(window, roster=roster, command_sink=lambda commands: None)
+    names = [f"Player{i}" for i in range(panel_players)]
+    timings = []
+    for label, kind, group in (("join", PLAYER_CONNECTED, names), ("leave half", PLAYER_DISCONNECTED, names[::2]),
+                               ("rejoin", PLAYER_CONNECTED, names[::2])):
+        for name in group:
+            roster.apply(Event(kind, time.time(), {"name": name, "xuid": ""}, ""))
+        start = time.perf_counter()
+        panel.refresh_players()
+        window.update()
+        timings.append(f"{label} {(time.perf_counter() - start) * 1000:.1f} ms")
+    root.destroy()
+    print(f"{'player list refresh':<28} {panel_players} players: " + ", ".join(timings))
+
+def bench_archive(sizes):
+    # Archiving a finished log: the rename the stopping server waits for, then gzip and index off-thread,
+    # then a search that reads its lines back out of the compressed archive
+    from bds_logsink import LogSink
+    from bds_archive_index import build_index, ArchiveSearch
+    workdir = tempfile.mkdtemp()
+    print(f"{'log lines':>10} {'MB':>7} {'rename':>10} {'gzip':>9} {'index':>9} {'MB/s':>8} {'search .gz':>11}")
+    for count in sizes:
+        path = os.path.join(workdir, f"archive_{count}.txt")
+        archive_dir = os.path.join(workdir, f"old_logs_{count}")
+        with open(path, "w", encoding="utf-8") as log:
+            log.write(synthetic_log(count))
+        size = os.path.getsize(path)
+        sink = LogSink(path, archive_dir, keep_files=0, keep_days=0)
+        timings = {}
+        done = threading.Event()
+
+        def timed_index(archived):
+            # Runs once the archive is compressed, possibly before close() has returned
+            timings["compressed"] = time.perf_counter()
+            build_index(archived)
+            timings["index"] = time.perf_counter() - timings["compressed"]
+            done.set()
+
+        sink.on_rotate.append(timed_index)
+        sink.open()
+        start = time.perf_counter()
+        sink.close(archive=True)
+        renamed = time.perf_counter()
+        rename = renamed - start
+        done.wait(300)
+        total = time.perf_counter() - start
+        if "compressed" in timings:
+            timings["gzip"] = max(0.0, timings["compressed"] - renamed)
+        sink.shutdown()
+        search = ArchiveSearch(archive_dir)
+        search.search(player="Player12")
+        before = time.perf_counter()
+        found = search.search(player="Player12", limit=50)
+        search_ms = (time.perf_counter() - before) * 1000
+        print(f"{count:>10} {size / 1e6:>7.1f} {rename * 1000:>7.2f} ms {timings.get('gzip', 0):>7.2f} s "
+              f"{timings.get('index', 0):>7.2f} s {size / 1e6 / total:>8.1f} {search_ms:>6.1f} ms ({len(found)} lines)")
+
+def bench_functions(count, delay_ms=0.5):
+    # One big player list action, line by line and as a generated function, against a fake BDS that
+    # spends delay_ms on every stdin line it parses
+    server_dir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(server_dir, "worlds", "Bedrock level"))
+    instance = fake_instance("functions", server_dir, "--rate", "0", "--online", "10", "--response-delay", str(delay_ms),
+                             server_dir=server_dir)
+    console_lines = [0]
+    instance.on_output.append(lambda line: console_lines.__setitem__(0, console_lines[0] + 1))
+    commands = [f"give Player{i % 10} diamond {i % 64 + 1}" for i in range(count)]
+    print(f"{count} give commands, fake BDS parses each stdin line in {delay_ms} ms")
+    # Line by line goes straight to the dispatcher, as it did before the scheduler's bulk lane existed
+    for label, send in (("line by line", instance.dispatcher.submit), ("function, new", instance.send_commands),
+                        ("function, cached", instance.send_commands)):
+        instance.function_pack.min_commands = 1
+        console_lines[0] = 0
+        start = time.perf_counter()
+        results = [future.result(120) for future in send(commands)]
+        elapsed = time.perf_counter() - start
+        print(f"{label:<28} {elapsed * 1000:>9.1f} ms  {console_lines[0]:>6} console lines  "
+              f"failed {sum(result.ok is False for result in results)}")
+    stop_instance(instance)
+
+def bench_lanes(bulk=500, delay_ms=0.5):
+    # A bulk job is queued, then a kick and a console command arrive: how long do they wait?
+    from bds_scheduler import BULK
+    instance = fake_instance("lanes", tempfile.mkdtemp(), "--rate", "0", "--online", "10", "--response-delay", str(delay_ms))
+    commands = [f"give Player{i % 10} diamond 1" for i in range(bulk)]
+    print(f"{bulk} bulk commands queued first, fake BDS parses each stdin line in {delay_ms} ms")
+    for label, send in (("dispatcher only (FIFO)", lambda batch, lane=None: instance.dispatcher.submit(batch)),
+                        ("scheduler lanes", instance.send_commands)):
+        background = send(commands, BULK)
+        urgent_start = time.perf_counter()
+        urgent = send(["kick Player3 bench"])[0]
+        interactive = send(["op Player1"])[0]
+        urgent.result(120)
+        urgent_ms = (time.perf_counter() - urgent_start) * 1000
+        interactive.result(120)
+        interactive_ms = (time.perf_counter() - urgent_start) * 1000
+        print(f"{label:<28} kick answered in {urgent_ms:8.1f} ms  op in {interactive_ms:8.1f} ms  "
+              f"bulk queued {instance.scheduler.depths()[BULK]}")
+        instance.scheduler.cancel_all("benchmark over")
+        for future in background:
+            future.result(120)
+        instance.send_commands(["connect Player3"], BULK)[0].result(30)
+
+    # Duplicates of an idempotent command while the first is still queued
+    from bds_metrics import COMMANDS_COALESCED
+    futures = instance.send_commands(["op Player1"] * 50, BULK)
+    results = [future.result(60) for future in futures]
+    print(f"{'50 x op Player1':<28} {COMMANDS_COALESCED.labels(instance.name).get()} coalesced, "
+          f"{sum(result.ok is True for result in results)} answered ok")
+    stop_instance(instance)
+
+def make_world(world_dir, files, size, seed=1):
+    # LevelDB-like: many immutable .ldb tables plus a few small files that change on every save
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(world_dir, "db"), exist_ok=True)
+    for i in range(files):
+        with open(os.path.join(world_dir, "db", f"{i:06d}.ldb"), "wb") as table:
+            table.write(rng.randbytes(size))
+    for name in ("db/CURRENT", "db/MANIFEST-000001", "level.dat", "levelname.txt"):
+        with open(os.path.join(world_dir, *name.split("/")), "wb") as small:
+            small.write(rng.randbytes(4096))
+
+def bench_backup(files=200, size=1024 * 1024):
+    # A full backup, then one after a save that wrote a few new tables, against copying the folder
+    import shutil
+    server_dir = tempfile.mkdtemp()
+    world_dir = os.path.join(server_dir, "worlds", "Bedrock level")
+    make_world(world_dir, files, size)
+    total = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(world_dir) for name in names)
+    start = time.perf_counter()
+    shutil.copytree(world_dir, os.path.join(server_dir, "copy"))
+    copy_time = time.perf_counter() - start
+    shutil.rmtree(os.path.join(server_dir, "copy"))
+    instance = fake_instance("backup", os.path.join(server_dir, "data"), "--rate", "50", "--world", world_dir,
+                             server_dir=server_dir)
+    print(f"world: {files + 4} files, {total / 1e6:.0f} MB")
+    print(f"{'copy of worlds/':<28} {copy_time:7.2f} s  {total / 1e6:8.1f} MB written")
+    for label in ("first backup", "after a save", "nothing changed"):
+        if label == "after a save":
+            make_world(world_dir, 0, 0, seed=2)
+            for i in range(files, files + 5):
+                with open(os.path.join(world_dir, "db", f"{i:06d}.ldb"), "wb") as table:
+                    table.write(random.randbytes(size))
+        start = time.perf_counter()
+        snapshot = instance.backups.backup()
+        elapsed = time.perf_counter() - start
+        store = instance.backups.store
+        stored = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(store.objects_dir)
+                     for name in names)
+        print(f"{label:<28} {elapsed:7.2f} s  {snapshot.files:>5} files  store {stored / 1e6:8.1f} MB "
+              f"for {len(store.snapshots())} snapshots")
+    stop_instance(instance)
+
+def bench_jobs(count=500, firing=100, seconds=5.0):
+    # CPU the core loop spends on jobs that are not due, and how close to their time due jobs start
+    from bds_core import EventLoopThread
+    from bds_jobs import JobScheduler, JobConfig
+    folder = tempfile.mkdtemp()
+    paths = (os.path.join(folder, "jobs.json"), os.path.join(folder, "jobs_state.json"))
+    for label, jobs in (("no jobs", 0), (f"{count} jobs, none due", count)):
+        core = EventLoopThread()
+        configs = [JobConfig(f"job{i}", "command", args=["say hello"], cron=f"{i % 60} {i % 24} * * *") if i % 2 else
+                   JobConfig(f"job{i}", "backup", every=3600 * (1 + i % 24)) for i in range(jobs)]
+        scheduler = JobScheduler(core, [], configs, *paths)
+        start = time.perf_counter()
+        scheduler.start()
+        core.run(asyncio.sleep(0))
+        scheduling_ms = (time.perf_counter() - start) * 1000
+        time.sleep(0.5)
+        cpu = time.process_time()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu
+        print(f"{label:<28} scheduled in {scheduling_ms:6.1f} ms  idle CPU {cpu * 1000 / seconds:6.2f} ms/s")
+        scheduler.stop()
+        core.stop()
+
+    instance = fake_instance("jobs", tempfile.mkdtemp(), "--rate", "0", "--online", "5")
+    core = instance.core
+    configs = [JobConfig(f"tick{i}", "command", server=instance.name, args=[f"tp Player{i % 5} {i} 64 0"], every=1)
+               for i in range(firing)]
+    scheduler = JobScheduler(core, [instance], configs, *paths)
+    scheduler.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    time.sleep(1)
+    described = scheduler.describe()
+    lags = [entry["last_lag"] * 1000 for entry in described if entry["last_lag"] is not None]
+    durations = [entry["last_seconds"] * 1000 for entry in described if entry["last_seconds"] is not None]
+    p50, p99 = percentiles(lags)
+    runs = sum(entry["runs"] for entry in described)
+    failed = sum(entry["failed"] for entry in described)
+    print(f"{firing} jobs every second         {runs} runs, {failed} failed in {seconds:g}s  start lag p50 {p50:5.2f} ms "
+          f"p99 {p99:5.2f} ms  run (tp answered) p50 {percentiles(durations)[0]:6.1f} ms")
+    stop_instance(instance)
+
+def bench_scrollback(count=100000, batch=500):
+    # Classifying and storing console lines, counting a filtered view and finding as a query is typed
+    from bds_console import Scrollback, VIEWS, LINE_PLAYER
+    lines = [line + "\n" for line in synthetic_log(count).splitlines()]
+    scrollback = Scrollback()
+    start = time.perf_counter()
+    for offset in range(0, count, batch):
+        scrollback.extend(lines[offset:offset + batch])
+    elapsed = time.perf_counter() - start
+    print(f"{'classify and store':<28} {count:>8} lines  {count / elapsed:>10.0f} lines/s")
+    start = time.perf_counter()
+    counts = {name: scrollback.count(mask) for name, mask in VIEWS.items()}
+    print(f"{'count every view':<28} {(time.perf_counter() - start) * 1000:8.2f} ms  "
+          + ", ".join(f"{name} {lines_in_view}" for name, lines_in_view in counts.items()))
+    for label, mask in (("find as typed", VIEWS["All"]), ("find as typed, Players", LINE_PLAYER)):
+        matches = None
+        steps = []
+        for end in range(1, len("player12") + 1):
+            start = time.perf_counter()
+            matches = scrollback.find("Player12"[:end], mask, matches)
+            steps.append(f"{(time.perf_counter() - start) * 1000:.1f}")
+        print(f"{label:<28} {' / '.join(steps)} ms per keystroke, {len(matches.positions)} matches")
+    start = time.perf_counter()
+    matches = scrollback.find("chunk 40")
+    print(f"{'find, one query':<28} {(time.perf_counter() - start) * 1000:8.2f} ms  {len(matches.positions)} matches")
+    scrollback.extend(lines[:batch])
+    start = time.perf_counter()
+    matches = scrollback.find("chunk 40", previous=matches)
+    print(f"{'same find after a batch':<28} {(time.perf_counter() - start) * 1000:8.2f} ms  {len(matches.positions)} matches")
+
+    import tkinter as tk
+    from tkinter import scrolledtext
+    from bds_console import ConsoleView
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"console widget skipped, no display: {e}")
+        return
+    widget = scrolledtext.ScrolledText(root, width=85, height=20, state=tk.DISABLED)
+    widget.pack()
+    console = ConsoleView(widget, max_lines=count)
+    start = time.perf_counter()
+    for offset in range(0, count, batch * 10):
+        console._render(lines[offset:offset + batch * 10])
+    root.update()
+    print(f"{'render into the widget':<28} {count:>8} lines  {count / (time.perf_counter() - start):>10.0f} lines/s")
+    for name, mask in VIEWS.items():
+        start = time.perf_counter()
+        console.set_view(mask)
+        root.update()
+        print(f"{'view ' + name:<28} {(time.perf_counter() - start) * 1000:8.2f} ms to show {console.count()} lines")
+    console.set_view(VIEWS["All"])
+    start = time.perf_counter()
+    status = console.find("player12")
+    root.update()
+    print(f"{'find and highlight':<28} {(time.perf_counter() - start) * 1000:8.2f} ms  {status}")
+    start = time.perf_counter()
+    for _ in range(20):
+        console.find_next()
+        root.update()
+    print(f"{'next match':<28} {(time.perf_counter() - start) * 1000 / 20:8.2f} ms each  {console.status()}")
+    root.destroy()
+
+SUITE = ["console", "roundtrip", "roster", "archive", "functions", "lanes", "backup", "jobs", "scrollback"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Bedrock Server Manager benchmarks")
+    parser.add_argument("benchmarks", nargs="*", default=["commands", "startup", "events"],
+                        help="commands, startup, events, instances, websocket, flood, and the bds_fake.py suite: "
+                             "console, roundtrip, roster, archive, functions, lanes, backup, jobs, scrollback (or \"suite\" for all of them)")
+    parser.add_argument("--commands", type=int, default=5000, help="commands per burst")
+    parser.add_argument("--runs", type=int, default=10, help="repetitions for startup timings")
+    parser.add_argument("--lines", type=int, default=2000000, help="synthetic log lines")
+    parser.add_argument("--servers", type=int, default=4, help="server instances for the instances benchmark")
+    parser.add_argument("--seconds", type=float, default=10, help="run time for the instances benchmark")
+    parser.add_argument("--clients", type=int, default=500, help="WebSocket subscribers for the websocket benchmark")
+    parser.add_argument("--flood-lines", type=int, default=500000, help="lines the flood benchmark writes")
+    parser.add_argument("--console-lines", type=int, default=200000, help="lines the fake server floods the console with")
+    parser.add_argument("--log-sizes", default="10000,100000,1000000", help="log lines for the roster and archive benchmarks")
+    args = parser.parse_args()
+    if "suite" in args.benchmarks:
+        args.benchmarks += SUITE
+    log_sizes = [int(size) for size in args.log_sizes.split(",")]
+    if "commands" in args.benchmarks:
+        bench_command_channel(args.commands)
+    if "startup" in args.benchmarks:
+        bench_panel_startup(args.runs)
+    if "events" in args.benchmarks:
+        bench_event_parser(args.lines)
+    if "instances" in args.benchmarks:
+        bench_instances(args.servers, args.seconds)
+    if "websocket" in args.benchmarks:
+        bench_websocket(args.clients, args.commands)
+    if "flood" in args.benchmarks:
+        bench_flood(args.flood_lines)
+    if "console" in args.benchmarks:
+        bench_console(args.console_lines)
+    if "roundtrip" in args.benchmarks:
+        bench_roundtrip(args.commands)
+    if "roster" in args.benchmarks:
+        bench_roster(log_sizes)
+    if "archive" in args.benchmarks:
+        bench_archive(log_sizes)
+    if "functions" in args.benchmarks:
+        bench_functions(args.commands)
+    if "lanes" in args.benchmarks:
+        bench_lanes()
+    if "backup" in args.benchmarks:
+        bench_backup()
+    if "jobs" in args.benchmarks:
+        bench_jobs()
+    if "scrollback" in args.benchmarks:
+        bench_scrollback()
+
+if __name__ == "__main__":
+    main()
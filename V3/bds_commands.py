@@ -0,0 +1,74 @@
+import re
+
+TARGET = "{target}"
+MAX_EXCLUDED = 8
+
+# Commands whose player argument accepts a target selector; op/deop/kick/ban/allowlist take plain names
+SELECTOR_COMMANDS = {"teleport", "tp", "gamemode", "effect", "enchant", "give", "kill", "clear", "xp", "tag",
+                     "title", "tell", "msg", "w", "spawnpoint", "clearspawnpoint", "playsound", "ability"}
+
+# A selector also hits anyone who joined after the roster was read. That is harmless for these, so they
+# may use one even when the roster comes from a log tail that lags; the rest need the manager's live roster.
+HARMLESS_SELECTOR_COMMANDS = {"title", "tell", "msg", "w", "playsound"}
+
+PLAIN_NAME_RE = re.compile(r"^[A-Za-z0-9_\-.]+$")
+
+def quote_name(name):
+    if PLAIN_NAME_RE.match(name):
+        return name
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def selector_for(players, online_players):
+    # One selector covering exactly `players`, or None if there is no safe way to express it
+    if online_players is None or len(players) < 2:
+        return None
+    online = set(online_players)
+    selected = set(players)
+    if not selected <= online:
+        return None
+    excluded = online - selected
+    if not excluded:
+        return "@a"
+    if len(excluded) <= MAX_EXCLUDED:
+        return "@a[" + ",".join(f"name=!{quote_name(name)}" for name in sorted(excluded)) + "]"
+    return None
+
+class CommandBatch:
+    # Collects commands for one UI action so they go out in a single write
+    def __init__(self, online_players=None, live=False):
+        # live: online_players is the event-fed roster, not a snapshot from a log tail
+        self.online_players = list(online_players) if online_players is not None else None
+        self.live = live
+        self.commands = []
+        self.targets = []  # players each command is aimed at, parallel to commands
+        self.naive_count = 0
+
+    def add(self, template, players):
+        # template holds TARGET where the player goes, e.g. "gamemode 1 {target}"
+        players = list(dict.fromkeys(players))
+        self.naive_count += len(players)
+        name = template.split(" ", 1)[0].lower()
+        if name in SELECTOR_COMMANDS and (self.live or name in HARMLESS_SELECTOR_COMMANDS):
+            selector = selector_for(players, self.online_players)
+        else:
+            selector = None
+        if selector:
+            self.commands.append(template.replace(TARGET, selector))
+            self.targets.append(players)
+        else:
+            self.commands.extend(template.replace(TARGET, quote_name(player)) for player in players)
+            self.targets.extend([player] for player in players)
+
+    def add_command(self, command):
+        self.naive_count += 1
+        self.commands.append(command)
+        self.targets.append([])
+
+    @property
+    def saved(self):
+        return self.naive_count - len(self.commands)
+
+    def summary(self):
+        if self.saved:
+            return f"{len(self.commands)} command(s) sent, {self.saved} saved by target selectors"
+        return f"{len(self.commands)} command(s) sent"
@@ -0,0 +1,373 @@
+import bisect
+import re
+import tkinter as tk
+from collections import namedtuple
+
+from bds_events import EVENT_PATTERNS, FAILED_RESULT_RE
+from bds_stream import Channel, COALESCE
+from bds_metrics import CONSOLE_RENDER, CONSOLE_LINES, CONSOLE_FIND, track_channel
+
+CONSOLE_MAX_LINES = 100000
+CONSOLE_REFRESH_MS = 50
+CONSOLE_IDLE_MS = 250
+BLOCK_LINES = 1000  # lowercased lines are joined into blocks of about this many for searching
+NARROW_RATIO = 8  # a longer query rechecks the previous matches one by one if they are this much fewer than all lines
+FIND_MARGIN = 50  # lines above and below the visible ones whose matches are highlighted too
+MAX_HIGHLIGHTS = 1000
+
+# Line classes, one bit each; a line can be in several (a failed command is LINE_COMMAND and LINE_ERROR)
+LINE_OTHER = 1
+LINE_WARNING = 2
+LINE_ERROR = 4
+LINE_PLAYER = 8
+LINE_COMMAND = 16
+LINE_MANAGER = 32
+ALL_LINES = 0xFF
+VIEWS = {"All": ALL_LINES, "Errors and warnings": LINE_WARNING | LINE_ERROR, "Players": LINE_PLAYER,
+         "Commands": LINE_COMMAND, "Manager": LINE_MANAGER}
+# A line takes the colour of its most important class
+LINE_COLOURS = ((LINE_ERROR, "#c00000"), (LINE_WARNING, "#a05a00"), (LINE_MANAGER, "#6a3d9a"),
+                (LINE_COMMAND, "#006400"), (LINE_PLAYER, "#0050a0"))
+GROUP_CLASSES = {"connected": LINE_PLAYER, "spawned": LINE_PLAYER, "disconnected": LINE_PLAYER, "result": LINE_COMMAND}
+LEVEL_CLASSES = (("ERROR] ", LINE_ERROR), ("WARN] ", LINE_WARNING))
+COMMAND_ECHO = "> "  # written by the console entry before the command is sent
+LINE_PREFIXES = (("[Manager]", LINE_MANAGER), (COMMAND_ECHO, LINE_COMMAND))
+# The event parser's patterns for the classes above, tried only where a "[time LEVEL] " prefix ends:
+# starting with a literal lets the regex engine skip ahead instead of trying every position
+CLASS_RE = re.compile(r"\] (?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in EVENT_PATTERNS
+                                          if name in GROUP_CLASSES) + ")")
+FIND_TAG = "find"
+CURRENT_TAG = "find_current"
+
+# positions: sorted (line number, column) of every match; end: the line number the search stopped at
+Matches = namedtuple("Matches", "query mask positions end")
+
+def find_all(text, literal):
+    position = text.find(literal)
+    while position >= 0:
+        yield position
+        position = text.find(literal, position + 1)
+
+def line_numbers(text, positions):
+    # (line, position) for increasing positions in text, counting newlines in C between them
+    line = last = 0
+    for position in positions:
+        line += text.count("\n", last, position)
+        last = position
+        yield line, position
+
+def classify(text, count):
+    # Class flags for the count lines of text, each ending in "\n". Every pass is a C-level scan of the
+    # whole batch, so only the few lines that are not plain output are touched from Python.
+    flags = bytearray([LINE_OTHER]) * count
+    matches = {match.start(): match for match in CLASS_RE.finditer(text)}
+    for line, position in line_numbers(text, matches):
+        match = matches[position]
+        flags[line] = GROUP_CLASSES[match.lastgroup]
+        if match.lastgroup == "result" and FAILED_RESULT_RE.match(match.group("result")):
+            flags[line] |= LINE_ERROR
+    for literal, line_class in LEVEL_CLASSES:
+        for line, _ in line_numbers(text, find_all(text, literal)):
+            flags[line] = flags[line] & ~LINE_OTHER | line_class
+    for prefix, line_class in LINE_PREFIXES:
+        if text.startswith(prefix):
+            flags[0] = line_class
+        # "\n" + prefix is found on the line before the one it starts
+        for line, _ in line_numbers(text, find_all(text, "\n" + prefix)):
+            flags[line + 1] = line_class
+    return flags
+
+class Scrollback:
+    # The console's lines with one byte of class flags each, kept in step with the widget so that
+    # counting and searching never read text back out of Tk. Line numbers are absolute and keep
+    # counting up as old lines are trimmed: first is the oldest line still held. A lowercased copy
+    # is kept in blocks so a search is a str.find over a few large strings, not a loop over lines.
+    def __init__(self):
+        self.lines = []
+        self.flags = bytearray()
+        self.first = 0
+        self.blocks = []  # [first line number, line count, lowercased text], oldest first; the last may still grow
+
+    @property
+    def end(self):
+        return self.first + len(self.lines)
+
+    def extend(self, lines):
+        # Every line must end with "\n"
+        text = "".join(lines)
+        flags = classify(text, len(lines))
+        lowered = text.lower()
+        if self.blocks and self.blocks[-1][1] < BLOCK_LINES:
+            block = self.blocks[-1]
+            block[1] += len(lines)
+            block[2] += lowered
+        else:
+            self.blocks.append([self.end, len(lines), lowered])
+        self.lines.extend(lines)
+        self.flags.extend(flags)
+        return flags
+
+    def trim(self, count):
+        del self.lines[:count]
+        del self.flags[:count]
+        self.first += count
+        while self.blocks and self.blocks[0][0] + self.blocks[0][1] <= self.first:
+            del self.blocks[0]
+
+    def clear(self):
+        self.trim(len(self.lines))
+
+    def count(self, mask):
+        if mask == ALL_LINES:
+            return len(self.flags)
+        return len(self.flags) - self.flags.translate(bytes(0 if flags & mask else 1 for flags in range(256))).count(1)
+
+    def find(self, query, mask=ALL_LINES, previous=None):
+        # Case-insensitive. Given the previous search with the same view, only what changed is searched:
+        # lines added since, and for a longer query the lines that matched before, when they are few.
+        needle = query.lower()
+        if not needle:
+            return Matches(query, mask, [], self.end)
+        first = self.first
+        if previous is None or previous.mask != mask or not previous.query or not needle.startswith(previous.query.lower()):
+            return Matches(query, mask, self.scan(needle, mask, first), self.end)
+        kept = previous.positions[bisect.bisect_left(previous.positions, (first, 0)):]
+        if needle == previous.query.lower():
+            positions = kept
+        elif len(kept) * NARROW_RATIO < len(self.lines):
+            positions = []
+            for number in dict.fromkeys(number for number, _ in kept):
+                text = self.lines[number - first].lower()
+                column = text.find(needle)
+                while column >= 0:
+                    positions.append((number, column))
+                    column = text.find(needle, column + len(needle))
+        else:
+            return Matches(query, mask, self.scan(needle, mask, first), self.end)
+        return Matches(query, mask, positions + self.scan(needle, mask, max(previous.end, first)), self.end)
+
+    def scan(self, needle, mask, start):
+        # (line number, column) of every match from line number start on, in lines the mask shows
+        positions = []
+        flags = self.flags
+        first = self.first
+        step = len(needle)
+        for block_first, count, text in self.blocks:
+            if block_first + count <= start:
+                continue
+            line = block_first
+            position = 0
+            hit = text.find(needle)
+            while hit >= 0:
+                line += text.count("\n", position, hit)
+                position = hit
+                if line >= start and flags[line - first] & mask:
+                    positions.append((line, hit - text.rfind("\n", 0, hit) - 1))
+                hit = text.find(needle, hit + step)
+        return positions
+
+class ConsoleView:
+    # Any thread calls write(); the Tk main loop drains the buffer in batches on a timer. The buffer is
+    # bounded: if Tk falls behind, the oldest lines are replaced by a "lines skipped" marker.
+    # Each line is classified once as it is rendered and tagged by its classes; a filtered view only
+    # switches the tags' elide option, so it shows at once however long the scrollback is.
+    def __init__(self, widget, max_lines=CONSOLE_MAX_LINES, refresh_ms=CONSOLE_REFRESH_MS, idle_ms=CONSOLE_IDLE_MS,
+                 name="console"):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.refresh_ms = refresh_ms
+        self.idle_ms = max(idle_ms, refresh_ms)
+        self.delay = refresh_ms
+        # Trim the widget only once it is this far over the cap, so deletes happen in bulk
+        self.trim_slack = max(1, max_lines // 10)
+        self.scrollback = Scrollback()
+        self.pending = Channel(name, policy=COALESCE, max_lines=max_lines)
+        self.widget_lines = 0
+        self.mask = ALL_LINES
+        self.tags = {}  # class flags -> tag name, for every combination seen so far
+        self.matches = None
+        self.current = None  # (line number, column) of the selected match
+        self._highlight_job = None
+        self.render_time = CONSOLE_RENDER.labels(name)
+        self.find_time = CONSOLE_FIND.labels(name)
+        CONSOLE_LINES.labels(name).set_function(lambda: self.widget_lines)
+        track_channel(self.pending)
+        widget.tag_configure(FIND_TAG, background="#fff176")
+        widget.tag_configure(CURRENT_TAG, background="#ff9800")
+        # Matches are highlighted around what is on screen, so follow every scroll
+        scroll_command = str(widget.cget("yscrollcommand"))
+        widget.config(yscrollcommand=lambda *args: self._scrolled(scroll_command, *args))
+        self.widget.after(self.refresh_ms, self._drain)
+
+    def write(self, line):
+        self.pending.put([line])
+
+    def clear(self):
+        self.scrollback.clear()
+        self.widget_lines = 0
+        self.matches = None
+        self.current = None
+        self.widget.config(state=tk.NORMAL)
+        self.widget.delete("1.0", tk.END)
+        self.widget.config(state=tk.DISABLED)
+
+    def at_bottom(self):
+        return self.widget.yview()[1] >= 0.999
+
+    def _drain(self):
+        batch = self.pending.take()
+        if batch:
+            with self.render_time.time():
+                self._render(batch)
+        # Poll quickly while output flows and back off while the server is quiet
+        self.delay = self.refresh_ms if batch else min(self.idle_ms, self.delay * 2)
+        self.widget.after(self.delay, self._drain)
+
+    def _render(self, batch):
+        # Anything beyond the cap would be trimmed straight away, so never insert it
+        batch = [line if line.endswith("\n") else line + "\n" for line in batch[-self.max_lines:]]
+        flags = self.scrollback.extend(batch)
+        follow = self.at_bottom()
+
+        # One insert for the whole batch, as runs of lines that share their classes
+        chunks = []
+        start = 0
+        for index in range(1, len(batch) + 1):
+            if index == len(batch) or flags[index] != flags[start]:
+                chunks.append("".join(batch[start:index]))
+                chunks.append((self.tag_for(flags[start]),))
+                start = index
+        self.widget.config(state=tk.NORMAL)
+        self.widget.insert(tk.END, *chunks)
+        self.widget_lines += len(batch)
+        excess = self.widget_lines - self.max_lines
+        if excess >= self.trim_slack:
+            self.widget.delete("1.0", f"{excess + 1}.0")
+            self.widget_lines -= excess
+            self.scrollback.trim(excess)
+        self.widget.config(state=tk.DISABLED)
+
+        if follow:
+            self.widget.yview(tk.END)
+
+    def tag_for(self, flags):
+        tag = self.tags.get(flags)
+        if tag is None:
+            tag = self.tags[flags] = f"lines{flags}"
+            colour = next((colour for line_class, colour in LINE_COLOURS if flags & line_class), "")
+            self.widget.tag_configure(tag, foreground=colour, elide=not flags & self.mask)
+            self.widget.tag_lower(tag)
+        return tag
+
+    # Views
+
+    def set_view(self, mask):
+        if mask == self.mask:
+            return
+        self.mask = mask
+        for flags, tag in self.tags.items():
+            self.widget.tag_configure(tag, elide=not flags & mask)
+        self.widget.yview(tk.END)
+        if self.matches is not None:
+            self.find(self.matches.query)
+
+    def count(self):
+        return self.scrollback.count(self.mask)
+
+    # Find
+
+    def find(self, query):
+        # Incremental: called as the query is typed. Selects the first match from the top of the view down.
+        if not query:
+            self.matches = None
+            self.current = None
+            self._highlight()
+            return ""
+        previous = self.matches if self.matches is not None and self.matches.mask == self.mask else None
+        with self.find_time.time():
+            self.matches = self.scrollback.find(query, self.mask, previous)
+        self.current = None
+        positions = self.matches.positions
+        if positions:
+            top = self.scrollback.first + int(self.widget.index("@0,0").split(".")[0]) - 1
+            index = bisect.bisect_left(positions, (top, 0))
+            self._select(positions[index if index < len(positions) else 0])
+        else:
+            self._highlight()
+        return self.status()
+
+    def find_next(self):
+        return self._step(1)
+
+    def find_previous(self):
+        return self._step(-1)
+
+    def _step(self, direction):
+        if self.matches is None:
+            return ""
+        scrollback = self.scrollback
+        if self.matches.end != scrollback.end or (self.matches.positions and self.matches.positions[0][0] < scrollback.first):
+            # Lines came or went since the search; the same query rescans only the lines that are new
+            with self.find_time.time():
+                self.matches = scrollback.find(self.matches.query, self.mask, self.matches)
+        positions = self.matches.positions
+        if not positions:
+            self.current = None
+            self._highlight()
+            return self.status()
+        current = self.current or (scrollback.end, 0)
+        if direction > 0:
+            index = bisect.bisect_right(positions, current)
+            self._select(positions[index if index < len(positions) else 0])
+        else:
+            index = bisect.bisect_left(positions, current) - 1
+            self._select(positions[index])
+        return self.status()
+
+    def _select(self, position):
+        self.current = position
+        self.widget.see(self.index(position))
+        self._highlight()
+
+    def status(self):
+        if self.matches is None:
+            return ""
+        positions = self.matches.positions
+        if not positions:
+            return "no matches"
+        if self.current is None:
+            return f"{len(positions)} matches"
+        return f"{bisect.bisect_left(positions, self.current) + 1} of {len(positions)}"
+
+    def index(self, position, offset=0):
+        number, column = position
+        return f"{number - self.scrollback.first + 1}.{column + offset}"
+
+    def _scrolled(self, scroll_command, *args):
+        if scroll_command:
+            self.widget.tk.call(*self.widget.tk.splitlist(scroll_command), *args)
+        if self.matches is not None and self._highlight_job is None:
+            self._highlight_job = self.widget.after_idle(self._highlight)
+
+    def _highlight(self):
+        # Only matches near the screen are tagged, so a common query on a long scrollback costs no more
+        self._highlight_job = None
+        widget = self.widget
+        widget.tag_remove(FIND_TAG, "1.0", tk.END)
+        widget.tag_remove(CURRENT_TAG, "1.0", tk.END)
+        if self.matches is None or not self.matches.positions:
+            return
+        first = self.scrollback.first
+        length = len(self.matches.query)
+        top = first + int(widget.index("@0,0").split(".")[0]) - 1 - FIND_MARGIN
+        bottom = first + int(widget.index(f"@0,{widget.winfo_height()}").split(".")[0]) - 1 + FIND_MARGIN
+        positions = self.matches.positions
+        start = bisect.bisect_left(positions, (max(top, first), 0))
+        for position in positions[start:start + MAX_HIGHLIGHTS]:
+            if position[0] > bottom:
+                break
+            widget.tag_add(FIND_TAG, self.index(position), self.index(position, length))
+        if self.current is not None and self.current[0] >= first:
+            widget.tag_add(CURRENT_TAG, self.index(self.current), self.index(self.current, length))
+        widget.tag_raise(FIND_TAG)
+        widget.tag_raise(CURRENT_TAG)
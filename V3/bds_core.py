@@ -0,0 +1,72 @@
+import asyncio
+import queue
+import threading
+
+BRIDGE_MIN_MS = 20
+BRIDGE_MAX_MS = 250
+
+class EventLoopThread:
+    # One asyncio loop on a background thread for all process, pipe, socket and timer I/O.
+    # Other threads hand it work with call() and submit(); nothing here touches Tk.
+    def __init__(self, name="bds-core"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def in_loop(self):
+        return threading.current_thread() is self._thread
+
+    def call(self, callback, *args):
+        # Runs callback(*args) on the loop thread, soon; safe from any thread
+        if self.in_loop():
+            return self.loop.call_soon(callback, *args)
+        return self.loop.call_soon_threadsafe(callback, *args)
+
+    def submit(self, coro):
+        # Schedules a coroutine and returns a concurrent.futures.Future for its result
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        # Blocking wrapper around submit() for callers outside the loop
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+class TkBridge:
+    # Carries callbacks from the core thread to the Tk main loop. Tk is only ever called from its
+    # own thread, so it polls a queue, backing off to BRIDGE_MAX_MS while nothing arrives.
+    def __init__(self, root, min_ms=BRIDGE_MIN_MS, max_ms=BRIDGE_MAX_MS):
+        self.root = root
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self._queue = queue.SimpleQueue()
+        self._delay = min_ms
+        self._job = root.after(min_ms, self._drain)
+
+    def post(self, callback, *args):
+        self._queue.put((callback, args))
+
+    def _drain(self):
+        handled = 0
+        try:
+            while True:
+                callback, args = self._queue.get_nowait()
+                handled += 1
+                try:
+                    callback(*args)
+                except Exception:
+                    pass
+        except queue.Empty:
+            pass
+        self._delay = self.min_ms if handled else min(self.max_ms, self._delay * 2)
+        self._job = self.root.after(self._delay, self._drain)
+
+    def close(self):
+        self.root.after_cancel(self._job)
@@ -0,0 +1,494 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import signal
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from bds_core import EventLoopThread
+from bds_events import ALL
+from bds_instance import ServerInstance, load_servers, broadcast, SERVERS_FILE
+from bds_ipc import load_token
+from bds_jobs import JobScheduler, JobConfig, load_jobs, JOBS_FILE
+from bds_lifecycle import STOPPED
+from bds_metrics import REGISTRY, Profiler, MemoryTracer, export_periodically
+from bds_scheduler import LANES
+
+API_HOST = "127.0.0.1"
+API_PORT = 19160
+# Every request needs the token: a web page in the user's browser can reach 127.0.0.1 too
+TOKEN_FILE = "daemon_token.txt"
+# Host and Origin must name the machine itself, which stops DNS rebinding and cross-site requests
+LOCAL_HOSTS = {"127.0.0.1", "localhost", "::1"}
+HISTORY_SIZE = 5000  # messages kept per server for clients resuming with ?since=
+MAX_BODY = 1024 * 1024
+MAX_WS_MESSAGE = 64 * 1024
+MAX_CLIENT_BUFFER = 4 * 1024 * 1024  # a subscriber this far behind is dropped and must resume
+SHUTDOWN_TIMEOUT = 90
+PROFILE_FILE = "profile_core.prof"
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_TEXT = 0x1
+WS_CLOSE = 0x8
+WS_PING = 0x9
+WS_PONG = 0xA
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large"}
+
+def host_name(value):
+    # "127.0.0.1:19160" -> "127.0.0.1", "[::1]:19160" -> "::1"
+    if value.startswith("["):
+        return value[1:value.find("]")].lower()
+    return (value.rsplit(":", 1)[0] if value.count(":") == 1 else value).lower()
+
+def json_object(body):
+    # A body that is valid JSON but not an object is as bad a request as one that is not JSON
+    request = json.loads(body or b"{}")
+    if not isinstance(request, dict):
+        raise ValueError("expected a JSON object")
+    return request
+
+def ws_frame(payload, opcode=WS_TEXT):
+    # Server frames are never masked
+    size = len(payload)
+    if size < 126:
+        header = struct.pack(">BB", 0x80 | opcode, size)
+    elif size < 65536:
+        header = struct.pack(">BBH", 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, size)
+    return header + payload
+
+async def ws_read(reader):
+    first, second = await reader.readexactly(2)
+    size = second & 0x7F
+    if size == 126:
+        (size,) = struct.unpack(">H", await reader.readexactly(2))
+    elif size == 127:
+        (size,) = struct.unpack(">Q", await reader.readexactly(8))
+    if size > MAX_WS_MESSAGE:
+        raise ValueError("websocket message too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(size)
+    if mask and size:
+        # XOR the whole payload at once rather than byte by byte
+        key = (mask * (size // 4 + 1))[:size]
+        payload = (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(size, "big")
+    return first & 0x0F, payload
+
+async def read_request(reader):
+    # Returns (method, path, query, headers, body), or None when the client closed the connection
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY:
+        raise ValueError("request body too large")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    return method.upper(), unquote(url.path), query, headers, body
+
+def response_bytes(status, payload, keep_alive=True):
+    # A str payload is sent as plain text (the Prometheus exposition format is text/plain)
+    if isinstance(payload, str):
+        body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload, separators=(",", ":")).encode("utf-8"), "application/json"
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+class Subscriber:
+    __slots__ = ("writer", "server")
+
+    def __init__(self, writer, server):
+        self.writer = writer
+        self.server = server  # None for every server
+
+class Hub:
+    # Fans console lines, events and state changes out to WebSocket subscribers. Messages published in
+    # the same loop iteration go out as one frame, encoded once per server filter rather than once per
+    # client, and each server keeps a numbered history so clients can resume from the last seq they saw.
+    def __init__(self, core):
+        self.core = core
+        self.seq = 0
+        self.history = {}  # server name -> deque of messages
+        self.subscribers = set()
+        self._batch = []
+
+    def publish(self, server, message):
+        # Safe from any thread
+        if self.core.in_loop():
+            self._publish(server, message)
+        else:
+            self.core.call(self._publish, server, message)
+
+    def _publish(self, server, message):
+        self.seq += 1
+        message["seq"] = self.seq
+        message["server"] = server
+        self.history.setdefault(server, deque(maxlen=HISTORY_SIZE)).append(message)
+        if not self._batch:
+            self.core.loop.call_soon(self._flush)
+        self._batch.append(message)
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        frames = {}
+        for subscriber in list(self.subscribers):
+            frame = frames.get(subscriber.server)
+            if frame is None:
+                messages = batch if subscriber.server is None else [m for m in batch if m["server"] == subscriber.server]
+                frame = frames[subscriber.server] = ws_frame(json.dumps(messages, separators=(",", ":")).encode("utf-8")) if messages else b""
+            if frame:
+                self.send(subscriber, frame)
+
+    def send(self, subscriber, frame):
+        transport = subscriber.writer.transport
+        if transport.is_closing():
+            self.subscribers.discard(subscriber)
+        elif transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+            # Too slow to keep up; dropping it keeps memory bounded and the client resumes with ?since=
+            self.subscribers.discard(subscriber)
+            transport.abort()
+        else:
+            subscriber.writer.write(frame)
+
+    def since(self, seq, server=None, types=None):
+        # Messages after seq, oldest first, and whether some were already dropped from history
+        histories = [self.history.get(server, deque())] if server else list(self.history.values())
+        messages = []
+        gap = False
+        for history in histories:
+            if len(history) == history.maxlen and history[0]["seq"] > seq + 1:
+                gap = True
+            for message in reversed(history):
+                if message["seq"] <= seq:
+                    break
+                messages.append(message)
+        messages = [m for m in messages if types is None or m["type"] in types]
+        messages.sort(key=lambda message: message["seq"])
+        return messages, gap
+
+class ApiServer:
+    # Local HTTP API and WebSocket stream over a set of ServerInstances sharing one core loop:
+    #   GET  /servers                          state and player count of every server
+    #   GET  /servers/<name>/players           live roster
+    #   GET  /servers/<name>/players/<player>  registry entry
+    #   GET  /servers/<name>/console?since=N   console lines after seq N
+    #   POST /servers/<name>/commands          {"commands": [...], "wait": true, "lane": "interactive"}
+    #   POST /servers/<name>/start|stop|restart
+    #   GET  /servers/<name>/backups           snapshots, newest first
+    #   POST /servers/<name>/backup            take a snapshot now (waits for it)
+    #   POST /servers/<name>/restore           {"snapshot": "<name>"}, with the server stopped
+    #   POST /broadcast                        {"commands": [...]} to every running server
+    #   GET  /jobs                             scheduled jobs with their next run and timing stats
+    #   POST /jobs                             {"name": ..., "action": ..., "cron"|"every": ...} adds or replaces a job
+    #   POST /jobs/<name>/run                  run a job now, outside its schedule
+    #   DELETE /jobs/<name>
+    #   GET  /ws?server=<name>&since=N         WebSocket: JSON arrays of console/event/state messages
+    #   GET  /metrics                          Prometheus text format
+    #   POST /debug/profile?action=start|stop  cProfile the core loop; stop returns the top functions
+    #   POST /debug/memory?action=start|snapshot|stop  tracemalloc; snapshots show growth since the last one
+    def __init__(self, instances, core, host=API_HOST, port=API_PORT, token=None, jobs=None):
+        self.instances = {instance.name: instance for instance in instances}
+        self.core = core
+        self.jobs = jobs
+        self.host = host
+        self.port = port
+        self.token = token or secrets.token_urlsafe(32)
+        self.allowed_hosts = LOCAL_HOSTS | ({host.lower()} if host not in ("", "0.0.0.0", "::") else set())
+        self.hub = Hub(core)
+        self.profiler = Profiler()
+        self.memory = MemoryTracer()
+        self._server = None
+        for instance in instances:
+            self.watch(instance)
+
+    def watch(self, instance):
+        name = instance.name
+        instance.on_output.append(lambda line: self.hub.publish(name, {"type": "console", "line": line.rstrip("\n")}))
+        instance.events.subscribe(ALL, lambda event: self.hub.publish(
+            name, {"type": "event", "kind": event.kind, "time": event.time, "data": event.data}))
+        instance.controller.subscribe(lambda state, detail: self.hub.publish(
+            name, {"type": "state", "state": state, "detail": detail}))
+
+    def start(self):
+        self.core.run(self._start())
+
+    def stop(self):
+        self.core.run(self._stop())
+
+    async def _start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _stop(self):
+        for subscriber in list(self.hub.subscribers):
+            subscriber.writer.close()
+        self.hub.subscribers.clear()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def local(self, headers):
+        # Browsers always send Host, and send Origin on cross-site POSTs and WebSocket upgrades
+        if "host" in headers and host_name(headers["host"]) not in self.allowed_hosts:
+            return False
+        origin = headers.get("origin")
+        return origin is None or (urlsplit(origin).hostname or "") in self.allowed_hosts
+
+    def authorized(self, headers, query):
+        supplied = query.get("token") or headers.get("authorization", "").removeprefix("Bearer ").strip()
+        return hmac.compare_digest(supplied.encode("utf-8"), self.token.encode("utf-8"))
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if not self.local(headers):
+                    status, payload = 403, {"error": "Host and Origin must be this machine"}
+                elif not self.authorized(headers, query):
+                    status, payload = 401, {"error": "missing or wrong token"}
+                elif path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers, query)
+                    return
+                else:
+                    try:
+                        status, payload = await self.route(method, path, query, body)
+                    except (ValueError, KeyError, TypeError) as e:
+                        status, payload = 400, {"error": str(e)}
+                writer.write(response_bytes(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, query, body):
+        parts = [part for part in path.split("/") if part]
+        request = json_object(body) if method == "POST" else {}
+        if parts == ["servers"] and method == "GET":
+            return 200, [self.describe(instance) for instance in self.instances.values()]
+        if parts == ["metrics"] and method == "GET":
+            return 200, REGISTRY.render()
+        if parts[:1] == ["debug"] and method == "POST":
+            return await self.debug(parts[1:], query.get("action", ""))
+        if parts == ["broadcast"] and method == "POST":
+            commands = self.commands_from(request)
+            sent = broadcast(self.instances.values(), commands)
+            return 200, {name: [await self.result(future) for future in futures] for name, futures in sent.items()}
+        if parts[:1] == ["jobs"] and self.jobs is not None:
+            return self.route_jobs(method, parts[1:], request)
+        if len(parts) < 2 or parts[0] != "servers" or parts[1] not in self.instances:
+            return 404, {"error": "not found"}
+        instance = self.instances[parts[1]]
+        action = parts[2:]
+        if method == "GET":
+            if not action:
+                return 200, self.describe(instance)
+            if action == ["players"]:
+                return 200, [{"name": name, "xuid": xuid, "connected_at": connected_at}
+                             for name, (xuid, connected_at) in sorted(instance.roster.snapshot().items())]
+            if len(action) == 2 and action[0] == "players":
+                entry = await asyncio.get_running_loop().run_in_executor(None, instance.registry.lookup, action[1])
+                return (200, entry) if entry else (404, {"error": "unknown player"})
+            if action == ["backups"]:
+                return 200, [snapshot._asdict() for snapshot in instance.backups.snapshots()]
+            if action == ["console"]:
+                since = int(query.get("since", 0))
+                messages, gap = self.hub.since(since, instance.name, types=("console",))
+                return 200, {"seq": self.hub.seq, "gap": gap, "lines": [[m["seq"], m["line"]] for m in messages]}
+        elif method == "POST":
+            if action == ["commands"]:
+                commands = self.commands_from(request)
+                lane = request.get("lane")
+                if lane is not None and lane not in LANES:
+                    raise ValueError(f"lane must be one of {', '.join(LANES)}")
+                futures = instance.send_commands(commands, lane)
+                if request.get("wait", True) is False:
+                    return 202, {"queued": len(futures)}
+                return 200, [await self.result(future) for future in futures]
+            if action == ["backup"]:
+                try:
+                    snapshot = await asyncio.get_running_loop().run_in_executor(None, instance.backups.backup)
+                except (RuntimeError, OSError) as e:
+                    return 409, {"error": str(e)}
+                return 200, snapshot._asdict()
+            if action == ["restore"]:
+                name = request.get("snapshot")
+                if not isinstance(name, str):
+                    raise ValueError("expected {\"snapshot\": \"<name>\"}")
+                try:
+                    aside = await asyncio.get_running_loop().run_in_executor(None, instance.backups.restore, name)
+                except (RuntimeError, OSError) as e:
+                    return 409, {"error": str(e)}
+                return 200, {"restored": name, "previous_world": aside}
+            if action in (["start"], ["stop"], ["restart"]):
+                getattr(instance, action[0])()
+                return 202, {"state": instance.state}
+        else:
+            return 405, {"error": "method not allowed"}
+        return 404, {"error": "not found"}
+
+    def route_jobs(self, method, parts, entry):
+        if not parts and method == "GET":
+            return 200, self.jobs.describe()
+        if not parts and method == "POST":
+            self.jobs.add(JobConfig(**entry))
+            return 200, {"saved": entry.get("name")}
+        if len(parts) == 2 and parts[1] == "run" and method == "POST":
+            return (202, {"running": parts[0]}) if self.jobs.run_now(parts[0]) else (404, {"error": "unknown job"})
+        if len(parts) == 1 and method == "DELETE":
+            return (200, {"removed": parts[0]}) if self.jobs.remove(parts[0]) else (404, {"error": "unknown job"})
+        return 404, {"error": "not found"}
+
+    async def debug(self, what, action):
+        # Requests are handled on the core loop, so this is the thread the profiler sees
+        loop = asyncio.get_running_loop()
+        if what == ["profile"] and action == "start":
+            self.profiler.start()
+            return 200, {"profiling": True}
+        if what == ["profile"] and action == "stop":
+            return 200, self.profiler.stop(PROFILE_FILE)
+        if what == ["memory"] and action == "start":
+            self.memory.start()
+            return 200, {"tracing": True}
+        if what == ["memory"] and action == "snapshot":
+            return 200, await loop.run_in_executor(None, self.memory.snapshot)
+        if what == ["memory"] and action == "stop":
+            self.memory.stop()
+            return 200, {"tracing": False}
+        return 404, {"error": "not found"}
+
+    def describe(self, instance):
+        return {"name": instance.name, "state": instance.state, "players": len(instance.roster.names()),
+                "stream": instance.stream_stats(), "queue": instance.scheduler.depths()}
+
+    def commands_from(self, request):
+        commands = request.get("commands")
+        if not isinstance(commands, list) or not all(isinstance(command, str) for command in commands):
+            raise ValueError("expected {\"commands\": [\"...\"]}")
+        return [command.strip() for command in commands if command.strip()]
+
+    async def result(self, future):
+        result = await asyncio.wrap_future(future)
+        return {"command": result.command, "ok": result.ok, "lines": result.lines}
+
+    async def _websocket(self, reader, writer, headers, query):
+        server = query.get("server")
+        if server is not None and server not in self.instances:
+            writer.write(response_bytes(404, {"error": "unknown server"}, keep_alive=False))
+            return
+        accept = base64.b64encode(hashlib.sha1((headers.get("sec-websocket-key", "") + WS_GUID).encode()).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber = Subscriber(writer, server)
+        if "since" in query:
+            # Catch up from history before live messages start, so nothing is missed or repeated
+            messages, gap = self.hub.since(int(query["since"]), server)
+            if gap:
+                messages.insert(0, {"type": "gap", "seq": self.hub.seq})
+            if messages:
+                writer.write(ws_frame(json.dumps(messages, separators=(",", ":")).encode("utf-8")))
+        self.hub.subscribers.add(subscriber)
+        try:
+            while True:
+                opcode, payload = await ws_read(reader)
+                if opcode == WS_CLOSE:
+                    writer.write(ws_frame(payload[:2], WS_CLOSE))
+                    break
+                if opcode == WS_PING:
+                    writer.write(ws_frame(payload, WS_PONG))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.hub.subscribers.discard(subscriber)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the server manager without a UI, with a local HTTP/WebSocket API")
+    parser.add_argument("--servers", default=SERVERS_FILE, help="server list (default: the single built-in server)")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--token", help="bearer token (or ?token=) required on every request "
+                                        "(default: the one in --token-file)")
+    parser.add_argument("--token-file", default=TOKEN_FILE, help="where the token is kept; created if missing")
+    parser.add_argument("--start", action="store_true", help="start every server right away")
+    parser.add_argument("--metrics-file", help="also rewrite this Prometheus text file every few seconds")
+    parser.add_argument("--jobs", default=JOBS_FILE, help="scheduled jobs, kept up to date by the /jobs API")
+    args = parser.parse_args()
+
+    try:
+        configs = load_servers(args.servers)
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(f"{args.servers} was not loaded: {e}")
+    core = EventLoopThread()
+    instances = [ServerInstance(config, core) for config in configs]
+    try:
+        job_configs = load_jobs(args.jobs, [instance.name for instance in instances])
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(f"{args.jobs} was not loaded: {e}")
+    jobs = JobScheduler(core, instances, job_configs, args.jobs)
+    api = ApiServer(instances, core, args.host, args.port, args.token or load_token(args.token_file), jobs)
+    for instance in instances:
+        instance.on_output.append(lambda line, name=instance.name: print(f"[{name}] {line}", end=""))
+        instance.open()
+    api.start()
+    print(f"API listening on http://{args.host}:{api.port}")
+    if not args.token:
+        print(f"Send the token from {os.path.abspath(args.token_file)} as 'Authorization: Bearer <token>' or ?token=")
+    if args.metrics_file:
+        export_periodically(core, args.metrics_file)
+    if args.start:
+        for instance in instances:
+            instance.start()
+    jobs.start()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    while not stop.wait(1):
+        pass
+    # Servers get the same graceful "stop" as from the UI before the process exits
+    jobs.stop()
+    for instance in instances:
+        instance.stop()
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    while any(instance.state != STOPPED for instance in instances) and time.monotonic() < deadline:
+        time.sleep(0.2)
+    api.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import re
+import threading
+import time
+from collections import namedtuple, deque
+from concurrent.futures import Future
+
+from bds_events import COMMAND_RESULT
+from bds_metrics import COMMAND_LATENCY, COMMAND_RESULTS, COMMANDS_PENDING
+
+COMMAND_TIMEOUT = 5.0
+# Commands aimed at several players answer with one line each; wait this long for the rest
+RESPONSE_SETTLE = 0.25
+
+# ok is True or False from BDS's answer, or None when no recognisable answer came before the timeout
+CommandResult = namedtuple("CommandResult", "command ok lines")
+
+# What a successful answer to each command starts with. Failures (unknown command, syntax error,
+# no targets, player not found) look the same for every command and go to the oldest command
+# still waiting for an answer, since BDS answers in the order commands were written.
+RESPONSE_PATTERNS = {
+    "op": r"Opped",
+    "deop": r"De-opped",
+    "kick": r"Kicked",
+    "ban": r"Banned",
+    "unban": r"Unbanned",
+    "teleport": r"Teleported",
+    "tp": r"Teleported",
+    "give": r"Gave",
+    "kill": r"Killed",
+    "effect": r"Gave|Applied|Took",
+    "gamemode": r"Set [^\r\n]*?'s game mode to|Your game mode",
+    "clear": r"Cleared",
+    "difficulty": r"Set game difficulty to",
+    "summon": r"Summoned|Object successfully summoned",
+    "enchant": r"Enchanting",
+    "tag": r"Added tag|Removed tag",
+    "function": r"Successfully executed",
+    "xp": r"Gave",
+    "spawnpoint": r"Set [^\r\n]*?'s spawn point to",
+    "setworldspawn": r"Set the world spawn point to",
+    "weather": r"Changing to ",
+    "time": r"Set the time to|Added \d+ to the time|Time is|Day is",
+    "gamerule": r"Game rule ",
+    "list": r"There are \d+/\d+ players online",
+}
+RESPONSE_RES = {verb: re.compile(pattern) for verb, pattern in RESPONSE_PATTERNS.items()}
+
+# Commands that print nothing when they work. They are not queued, or they would claim the next
+# command's failure; their own failures are rare enough to live with. "save" does answer, but its
+# output is not a command result and is followed by the backup manager itself.
+SILENT_COMMANDS = {"say", "me", "tell", "msg", "w", "tellraw", "title", "titleraw", "playsound", "stop", "reload",
+                   "save"}
+
+class Pending:
+    __slots__ = ("command", "pattern", "multi", "future", "sent_at", "deadline", "lines", "settle_at")
+
+    def __init__(self, command, deadline):
+        self.command = command
+        self.pattern = RESPONSE_RES.get(command.split(" ", 1)[0].lower())
+        # Only a selector can make a command answer with more than one line
+        self.multi = "@" in command
+        self.future = Future()
+        self.sent_at = time.perf_counter()
+        self.deadline = deadline
+        self.lines = []
+        self.settle_at = None
+
+    def accepts(self, text):
+        # A command with no known answer only takes failures; a success line always belongs to a command
+        # it fits, and the unmatched command ahead of it finishes without a response
+        return self.pattern is not None and self.pattern.match(text) is not None
+
+class CommandDispatcher:
+    # Writes commands with write(list of commands) and returns a Future per command that resolves
+    # to a CommandResult once BDS answers. Answers are matched in FIFO order from COMMAND_RESULT
+    # events on the bus; futures resolve on the bus or timer thread, never on the Tk loop.
+    def __init__(self, write, bus=None, timeout=COMMAND_TIMEOUT, settle=RESPONSE_SETTLE, name="bds"):
+        self.write = write
+        self.name = name
+        self.timeout = timeout
+        self.settle = settle
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._submit_lock = threading.Lock()
+        COMMANDS_PENDING.labels(name).set_function(lambda: len(self._pending))
+        threading.Thread(target=self._expire_loop, daemon=True).start()
+        if bus is not None:
+            self.attach(bus)
+
+    def attach(self, bus):
+        bus.subscribe(COMMAND_RESULT, self.on_result)
+
+    def submit(self, commands):
+        # Pending entries are queued before the write so an instant answer cannot arrive unclaimed,
+        # and the submit lock keeps the queue in the same order as the writes
+        commands = list(commands)
+        with self._submit_lock:
+            deadline = time.monotonic() + self.timeout
+            entries = [Pending(command, deadline) for command in commands]
+            silent = [entry for entry in entries if entry.command.split(" ", 1)[0].lower() in SILENT_COMMANDS]
+            with self._lock:
+                self._pending.extend(entry for entry in entries if entry not in silent)
+                self._wakeup.notify()
+            try:
+                written = self.write(commands)
+            except Exception as e:
+                written, error = False, str(e)
+            else:
+                error = "server is not running"
+        if written is False:
+            with self._lock:
+                for entry in entries:
+                    self._discard(entry)
+            COMMAND_RESULTS.labels(self.name, "not_sent").inc(len(entries))
+            for entry in entries:
+                entry.future.set_result(CommandResult(entry.command, False, [error]))
+        else:
+            if silent:
+                COMMAND_RESULTS.labels(self.name, "silent").inc(len(silent))
+            for entry in silent:
+                entry.future.set_result(CommandResult(entry.command, None, ["sent, no response expected"]))
+        return [entry.future for entry in entries]
+
+    def submit_one(self, command):
+        return self.submit([command])[0]
+
+    def on_result(self, event):
+        text = event.data["text"]
+        resolved = []
+        with self._lock:
+            # The answer belongs to the oldest command that could have produced it; every command
+            # in front of that one has had its turn, so it is finished
+            for index, entry in enumerate(self._pending):
+                if event.data["ok"]:
+                    if entry.accepts(text):
+                        break
+                elif not entry.lines:
+                    break
+            else:
+                return
+            for _ in range(index):
+                resolved.append(self._finish(self._pending.popleft()))
+            entry.lines.append(text)
+            if event.data["ok"] and entry.multi:
+                entry.settle_at = time.monotonic() + self.settle
+                self._wakeup.notify()
+            else:
+                self._pending.popleft()
+                resolved.append((entry, CommandResult(entry.command, event.data["ok"], entry.lines)))
+        self._resolve(resolved)
+
+    def cancel_all(self, reason="server stopped"):
+        with self._lock:
+            entries = list(self._pending)
+            self._pending.clear()
+        self._resolve([(entry, CommandResult(entry.command, True if entry.lines else None, entry.lines or [reason]))
+                       for entry in entries])
+
+    def _resolve(self, resolved):
+        # Outside the lock: futures run their callbacks inline
+        now = time.perf_counter()
+        for entry, result in resolved:
+            outcome = "no_response" if result.ok is None else "ok" if result.ok else "failed"
+            COMMAND_RESULTS.labels(self.name, outcome).inc()
+            if result.ok is not None:
+                COMMAND_LATENCY.labels(self.name).observe(now - entry.sent_at)
+            entry.future.set_result(result)
+
+    def _finish(self, entry):
+        if entry.lines:
+            return entry, CommandResult(entry.command, True, entry.lines)
+        return entry, CommandResult(entry.command, None, ["no response"])
+
+    def _discard(self, entry):
+        try:
+            self._pending.remove(entry)
+        except ValueError:
+            pass
+
+    def _expire_loop(self):
+        while True:
+            resolved = []
+            with self._lock:
+                now = time.monotonic()
+                # Only the head can finish on its own; later commands wait for it to be answered
+                while self._pending:
+                    head = self._pending[0]
+                    if (head.settle_at is not None and head.settle_at <= now) or head.deadline <= now:
+                        resolved.append(self._finish(self._pending.popleft()))
+                    else:
+                        break
+                if self._pending:
+                    head = self._pending[0]
+                    wait = min(head.deadline, head.settle_at or head.deadline) - now
+                else:
+                    wait = None
+                if not resolved:
+                    self._wakeup.wait(wait)
+            self._resolve(resolved)
+
+def player_outcomes(batch, results):
+    # {player: (ok, text)} for a CommandBatch given the CommandResult of each of its commands.
+    # A command covering several players by selector is checked line by line for each name.
+    outcomes = {}
+    for players, result in zip(batch.targets, results):
+        for player in players:
+            if len(players) > 1 and result.ok:
+                lines = [line for line in result.lines if player.lower() in line.lower()]
+                outcomes[player] = (True, lines[0]) if lines else (None, "not mentioned in the response")
+            else:
+                outcomes[player] = (result.ok, "; ".join(result.lines))
+    return outcomes
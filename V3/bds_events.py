@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+PLAYER_CONNECTED = "player_connected"
+PLAYER_SPAWNED = "player_spawned"
+PLAYER_DISCONNECTED = "player_disconnected"
+SERVER_STARTED = "server_started"
+SERVER_STOPPING = "server_stopping"
+LEVEL_SAVED = "level_saved"
+COMMAND_RESULT = "command_result"
+ERROR = "error"
+WARNING = "warning"
+ALL = "*"
+
+# kind: event type, time: epoch seconds, data: dict of parsed fields, line: the raw line
+Event = namedtuple("Event", "kind time data line")
+
+# Every alternative is a named group so match.lastgroup says which event matched.
+# Field groups are prefixed with their event's short name to keep names unique.
+EVENT_PATTERNS = [
+    ("connected", r"Player connected: (?P<connected_name>[^,\r\n]+)(?:, xuid: (?P<connected_xuid>\d*))?"),
+    ("spawned", r"Player Spawned: (?P<spawned_name>[^\r\n]+?) xuid: (?P<spawned_xuid>\d*)"),
+    ("disconnected", r"Player disconnected: (?P<disconnected_name>[^,\r\n]+)(?:, xuid: (?P<disconnected_xuid>\d*))?"),
+    ("started", r"Server started\."),
+    ("stopping", r"Server stop requested\.|Stopping server\.\.\."),
+    ("saved", r"Data saved\. Files are now ready to be copied\."),
+    ("result", r"(?P<result_text>(?:Unknown command|Syntax error|No targets matched selector|Could not find player|"
+               r"Opped|De-opped|Kicked|Gave|Teleported|Applied|Enchanting|Killed|Cleared|"
+               r"Set (?:[^\r\n]*?'s (?:game mode|spawn point)|the time|game difficulty|the world spawn point) to|"
+               r"Summoned|Object successfully summoned|Added tag|Removed tag|Game mode|Your game mode|Banned|Unbanned|"
+               r"Took|Successfully executed|Changing to |Added \d+ to the time|Time is \d|Day is \d|Game rule |"
+               r"There are \d+/\d+ players online)[^\r\n]*)"),
+    ("error", r"(?<=ERROR\] )(?P<error_text>[^\r\n]*)"),
+    ("warning", r"(?<=WARN\] )(?P<warning_text>[^\r\n]*)"),
+]
+
+GROUP_KINDS = {
+    "connected": PLAYER_CONNECTED,
+    "spawned": PLAYER_SPAWNED,
+    "disconnected": PLAYER_DISCONNECTED,
+    "started": SERVER_STARTED,
+    "stopping": SERVER_STOPPING,
+    "saved": LEVEL_SAVED,
+    "result": COMMAND_RESULT,
+    "error": ERROR,
+    "warning": WARNING,
+}
+
+EVENT_RE = re.compile(
+    r"^(?:\[(?P<ts>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)[^\]\r\n]*\] )?(?:"
+    + "|".join(f"(?P<{name}>{pattern})" for name, pattern in EVENT_PATTERNS)
+    + ")",
+    re.M,
+)
+
+# Cheap literal scan for anything that could start an event; keep in step with EVENT_PATTERNS
+TRIGGER_RE = re.compile(
+    r"Player |Server st|Stopping server|Data saved|ERROR\] |WARN\] |Unknown command|Syntax error|"
+    r"No targets|Could not find|Opped|De-opped|Kicked|Gave|Teleported|Set |Applied|Enchanting|Killed|Cleared|"
+    r"Summoned|Object successfully|Added |Removed tag|Game mode|Game rule|Your game mode|Banned|Unbanned|Took|"
+    r"Successfully executed|Changing to |Time is|Day is|There are "
+)
+
+# Failures among command results, so consumers do not have to re-match the text
+FAILED_RESULT_RE = re.compile(r"^(?:Unknown command|Syntax error|No targets matched selector|Could not find player)")
+
+@lru_cache(maxsize=4096)
+def parse_timestamp(stamp):
+    # Log lines within the same second share a stamp, so the cache absorbs most strptime calls
+    try:
+        return datetime.strptime(stamp, "%Y-%m-%d %H:%M:%S").timestamp()
+    except ValueError:
+        return None
+
+def event_from_match(match, line):
+    name = match.lastgroup
+    kind = GROUP_KINDS[name]
+    stamp = match.group("ts")
+    event_time = (parse_timestamp(stamp) if stamp else None) or time.time()
+    if name in ("connected", "spawned", "disconnected"):
+        data = {"name": match.group(name + "_name").strip(), "xuid": match.group(name + "_xuid") or None}
+    elif name == "result":
+        text = match.group("result_text").strip()
+        data = {"text": text, "ok": not FAILED_RESULT_RE.match(text)}
+    elif name in ("error", "warning"):
+        data = {"text": match.group(name + "_text").strip()}
+    else:
+        data = {}
+    return Event(kind, event_time, data, line)
+
+def parse_line(line):
+    match = EVENT_RE.match(line)
+    if match is None:
+        return None
+    return event_from_match(match, line.rstrip("\r\n"))
+
+def iter_matches(text):
+    # A literal scan finds candidate lines and only those get the full anchored match,
+    # so noise lines never reach Python code. Yields (line_start, match).
+    last_line = -1
+    for hit in TRIGGER_RE.finditer(text):
+        line_start = text.rfind("\n", 0, hit.start()) + 1
+        if line_start == last_line:
+            continue
+        last_line = line_start
+        match = EVENT_RE.match(text, line_start)
+        if match is not None:
+            yield line_start, match
+
+def parse_text(text):
+    # Bulk variant of parse_line for whole chunks
+    for line_start, match in iter_matches(text):
+        line_end = text.find("\n", match.end())
+        line = text[line_start:line_end if line_end >= 0 else len(text)].rstrip("\r")
+        yield event_from_match(match, line)
+
+class EventBus:
+    # Callbacks run synchronously on the publishing thread, so they must be quick;
+    # anything touching Tk should queue the event and handle it from the main loop.
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, kind, callback):
+        with self._lock:
+            self._subscribers[kind] = self._subscribers.get(kind, ()) + (callback,)
+        return lambda: self.unsubscribe(kind, callback)
+
+    def unsubscribe(self, kind, callback):
+        with self._lock:
+            callbacks = list(self._subscribers.get(kind, ()))
+            if callback in callbacks:
+                callbacks.remove(callback)
+            self._subscribers[kind] = tuple(callbacks)
+
+    def publish(self, event):
+        for callback in self._subscribers.get(event.kind, ()) + self._subscribers.get(ALL, ()):
+            try:
+                callback(event)
+            except Exception:
+                pass
+
+    def publish_line(self, line):
+        event = parse_line(line)
+        if event is not None:
+            self.publish(event)
+        return event
@@ -0,0 +1,297 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+# Stand-in for bedrock_server.exe: prints a BDS-style startup banner, generates log traffic and answers
+# commands on stdin the way BDS does, so the manager can be run and measured without a real server.
+# Point a servers.json entry at it with "path": <python>, "args": ["bds_fake.py", ...].
+
+VERSION = "1.21.51.02"
+XUID_BASE = 2535400000000000
+MAX_PLAYERS = 10
+FAILED_TARGET = "No targets matched selector"
+
+NOISE = [
+    "Running AutoCompaction...",
+    "Chunk {x}, {z} loaded from disk",
+    "Saving chunk {x}, {z}",
+    "Entity removed from chunk {x}, {z}",
+]
+
+class FakeServer:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.names = [f"Player{i}" for i in range(args.players)]
+        self.online = {}  # name -> xuid
+        self.saving = False
+        self.functions = self.load_functions()
+        self.muted = False  # commands run by a function print nothing of their own
+        self.stopping = threading.Event()
+        self.out = sys.stdout.buffer
+        self._lock = threading.Lock()
+        # Held while the traffic thread or a command changes who is online
+        self.state_lock = threading.RLock()
+        self.started_at = time.monotonic()
+
+    def stamp(self, level="INFO"):
+        now = time.time()
+        return time.strftime("[%Y-%m-%d %H:%M:%S", time.localtime(now)) + f":{int(now * 1000) % 1000:03d} {level}] "
+
+    def emit(self, *lines, level="INFO"):
+        # One write per call, so a burst reaches the manager in as few reads as BDS would produce
+        if self.muted:
+            return
+        stamp = self.stamp(level)
+        data = "".join(stamp + line + "\n" for line in lines).encode("utf-8")
+        with self._lock:
+            self.out.write(data)
+            self.out.flush()
+
+    def banner(self):
+        self.emit("Starting Server", f"Version: {VERSION}", "OS: Linux", "Session ID: 00000000-fake-0000-0000-000000000000",
+                  "Level Name: Bedrock level", "Game mode: 0 Survival", "Difficulty: 1 EASY",
+                  "opening worlds/Bedrock level/db", "IPv4 supported, port: 19132: Used for gameplay and LAN discovery",
+                  "IPv6 supported, port: 19133: Used for gameplay", "Server started.")
+
+    def xuid(self, name):
+        return XUID_BASE + self.names.index(name) if name in self.names else XUID_BASE + 99999
+
+    # Traffic
+
+    def connect(self, name):
+        if name in self.online:
+            return
+        self.online[name] = self.xuid(name)
+        self.emit(f"Player connected: {name}, xuid: {self.online[name]}")
+        self.emit(f"Player Spawned: {name} xuid: {self.online[name]}, pfid: {self.online[name]:x}")
+
+    def disconnect(self, name):
+        xuid = self.online.pop(name, None)
+        if xuid is not None:
+            self.emit(f"Player disconnected: {name}, xuid: {xuid}, pfid: {xuid:x}")
+
+    def noise(self, count):
+        lines = []
+        for _ in range(count):
+            lines.append(self.rng.choice(NOISE).format(x=self.rng.randrange(-512, 512), z=self.rng.randrange(-512, 512)))
+        self.emit(*lines)
+
+    def traffic(self):
+        args = self.args
+        owed = 0.0
+        tick = 0.01
+        next_churn = time.monotonic() + args.churn_every if args.churn_every else None
+        next_burst = time.monotonic() + args.burst_every if args.burst_every else None
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            if args.duration and now - self.started_at >= args.duration:
+                self.stop()
+                return
+            if args.crash_after and now - self.started_at >= args.crash_after:
+                self.emit("Crash detected, terminating", level="ERROR")
+                os._exit(1)
+            owed += args.rate * tick
+            with self.state_lock:
+                if owed >= 1:
+                    self.noise(int(owed))
+                    owed -= int(owed)
+                if next_churn and now >= next_churn:
+                    # One player comes or goes
+                    name = self.rng.choice(self.names)
+                    if name in self.online:
+                        self.disconnect(name)
+                    else:
+                        self.connect(name)
+                    next_churn = now + args.churn_every
+                if next_burst and now >= next_burst:
+                    # A group arrives together (a realm opening, an event starting) and half of it leaves again
+                    arriving = [name for name in self.names if name not in self.online][:args.burst]
+                    for name in arriving:
+                        self.connect(name)
+                    for name in self.rng.sample(sorted(self.online), len(self.online) // 2):
+                        self.disconnect(name)
+                    next_burst = now + args.burst_every
+            self.stopping.wait(tick)
+
+    def flood(self, count):
+        # count chunk-spam lines as fast as the pipe takes them, in BDS-sized writes
+        for start in range(0, count, 500):
+            self.noise(min(500, count - start))
+
+    # Commands
+
+    def targets(self, selector):
+        if selector in ("@a", "@e"):
+            return sorted(self.online)
+        if selector in ("@r", "@p", "@s"):
+            return [self.rng.choice(sorted(self.online))] if self.online else []
+        return [selector] if selector in self.online else []
+
+    def answer(self, line):
+        words = line.split()
+        if not words:
+            return
+        if self.args.response_delay:
+            time.sleep(self.args.response_delay / 1000)
+        with self.state_lock:
+            self.command(words[0].lower(), words[1:])
+
+    def command(self, verb, rest):
+        if verb == "stop":
+            self.stop()
+        elif verb in ("say", "me", "tell", "msg", "w", "tellraw", "title", "titleraw", "playsound"):
+            pass
+        elif verb == "reload":
+            self.functions = self.load_functions()
+        elif verb == "function" and rest:
+            self.run_function(rest[0])
+        elif verb == "list":
+            self.emit(f"There are {len(self.online)}/{MAX_PLAYERS} players online:", ", ".join(sorted(self.online)))
+        elif verb == "save" and rest:
+            self.save(rest[0].lower())
+        elif verb == "connect" and rest:
+            # Test hook: bring players online on demand
+            for name in rest:
+                self.connect(name)
+        elif verb == "disconnect" and rest:
+            for name in rest:
+                self.disconnect(name)
+        elif verb in PLAYER_COMMANDS:
+            if not rest:
+                self.emit(f"Syntax error: Unexpected \"\": at \"{verb}>><<\"")
+                return
+            players = self.targets(rest[0])
+            if not players:
+                self.emit(FAILED_TARGET)
+                return
+            extra = rest[1:]
+            self.emit(*(PLAYER_COMMANDS[verb](player, extra) for player in players))
+            if verb == "kick":
+                for player in players:
+                    self.disconnect(player)
+        else:
+            self.emit(f"Unknown command: {verb}. Please check that the command exists and that you have permission to use it.")
+
+    def load_functions(self):
+        # name -> commands for every .mcfunction in the behavior packs under the working directory
+        functions = {}
+        for packs in ("behavior_packs", "development_behavior_packs"):
+            for pack in os.listdir(packs) if os.path.isdir(packs) else ():
+                base = os.path.join(packs, pack, "functions")
+                for root, _, names in os.walk(base):
+                    for name in names:
+                        if name.endswith(".mcfunction"):
+                            path = os.path.join(root, name)
+                            key = os.path.relpath(path, base)[:-len(".mcfunction")].replace(os.sep, "/")
+                            with open(path, encoding="utf-8") as function_file:
+                                functions[key] = [line.strip() for line in function_file
+                                                  if line.strip() and not line.startswith("#")]
+        return functions
+
+    def run_function(self, name):
+        commands = self.functions.get(name)
+        if commands is None:
+            self.emit(f"Function {name} not found.")
+            return
+        self.muted = True
+        try:
+            for command in commands:
+                words = command.split()
+                self.command(words[0].lower(), words[1:])
+        finally:
+            self.muted = False
+        self.emit(f"Successfully executed {len(commands)} function entries.")
+
+    def save(self, action):
+        if action == "hold":
+            self.saving = True
+            self.emit("Saving...")
+        elif action == "query":
+            if not self.saving:
+                self.emit("A previous save has not been completed.")
+                return
+            self.emit("Data saved. Files are now ready to be copied.", ", ".join(self.world_files()))
+        elif action == "resume":
+            self.saving = False
+            self.emit("Changes to the level are resumed.")
+
+    def world_files(self):
+        # "path:length" for every file under --world, relative to its parent, as BDS lists them
+        world = self.args.world
+        if not world or not os.path.isdir(world):
+            return ["Bedrock level/db/000005.ldb:1024", "Bedrock level/db/CURRENT:16", "Bedrock level/level.dat:2048"]
+        base = os.path.dirname(os.path.abspath(world))
+        files = []
+        for root, _, names in os.walk(world):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                files.append(f"{os.path.relpath(path, base).replace(os.sep, '/')}:{os.path.getsize(path)}")
+        return files
+
+    def stop(self):
+        # Also reached from the traffic thread (--duration), so it ends the process itself
+        with self.state_lock:
+            self.stopping.set()
+            self.emit("Server stop requested.")
+            for name in sorted(self.online):
+                self.disconnect(name)
+            # BDS takes a while to save the world before it exits
+            time.sleep(self.args.stop_delay)
+            self.emit("Stopping server...", "Quit correctly")
+            os._exit(0)
+
+    def run(self):
+        self.banner()
+        for name in self.names[:self.args.online]:
+            self.connect(name)
+        if self.args.flood:
+            self.flood(self.args.flood)
+        threading.Thread(target=self.traffic, daemon=True).start()
+        for line in sys.stdin:
+            self.answer(line.strip())
+        # stdin closed under us: the manager went away without a "stop"
+        os._exit(0)
+
+def gave(player, extra):
+    item = extra[0] if extra else "stone"
+    amount = extra[1] if len(extra) > 1 else "1"
+    return f"Gave {item} * {amount} to {player}"
+
+PLAYER_COMMANDS = {
+    "op": lambda player, extra: f"Opped: {player}",
+    "deop": lambda player, extra: f"De-opped: {player}",
+    "kick": lambda player, extra: f"Kicked {player} from the game: '{' '.join(extra)}'",
+    "give": gave,
+    "tp": lambda player, extra: f"Teleported {player} to {' '.join(extra) or '0 64 0'}",
+    "teleport": lambda player, extra: f"Teleported {player} to {' '.join(extra) or '0 64 0'}",
+    "kill": lambda player, extra: f"Killed {player}",
+    "effect": lambda player, extra: f"Gave {extra[0] if extra else 'speed'} * 1 to {player} for 30 seconds",
+    "gamemode": lambda player, extra: f"Set {player}'s game mode to {extra[0] if extra else 'Survival'}",
+    "clear": lambda player, extra: f"Cleared the inventory of {player}, removing 0 items",
+    "tag": lambda player, extra: f"Added tag '{extra[-1] if extra else 'tag'}' to {player}",
+    "enchant": lambda player, extra: f"Enchanting succeeded for {player}",
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Bedrock Dedicated Server for testing and benchmarking the manager")
+    parser.add_argument("--rate", type=float, default=5, help="background log lines per second")
+    parser.add_argument("--players", type=int, default=20, help="size of the player pool")
+    parser.add_argument("--online", type=int, default=0, help="players connected at startup")
+    parser.add_argument("--churn-every", type=float, default=0, help="seconds between single connects/disconnects")
+    parser.add_argument("--burst", type=int, default=0, help="players arriving together in a burst")
+    parser.add_argument("--burst-every", type=float, default=0, help="seconds between bursts")
+    parser.add_argument("--flood", type=int, default=0, help="lines of chunk spam written at startup, as fast as possible")
+    parser.add_argument("--response-delay", type=float, default=0, help="milliseconds before each command is answered")
+    parser.add_argument("--stop-delay", type=float, default=1.0, help="seconds between \"stop\" and exiting")
+    parser.add_argument("--duration", type=float, default=0, help="stop by itself after this many seconds")
+    parser.add_argument("--crash-after", type=float, default=0, help="exit with code 1 after this many seconds")
+    parser.add_argument("--world", help="world directory listed by \"save query\"")
+    parser.add_argument("--seed", type=int, default=1)
+    FakeServer(parser.parse_args()).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+# Large command batches are written to a generated behavior pack as .mcfunction files and run with a
+# single "function" command, so BDS parses and logs one line instead of hundreds. Files are named by
+# a hash of their content: a batch that was sent before is already on disk and already loaded.
+
+PACK_DIR = "bds_manager"
+PACK_NAME = "BDS Manager batches"
+PACK_VERSION = [1, 0, 0]
+PACK_UUID = str(uuid.uuid5(uuid.NAMESPACE_URL, "bds-manager/function-pack"))
+MODULE_UUID = str(uuid.uuid5(uuid.NAMESPACE_URL, "bds-manager/function-pack/data"))
+NAMESPACE = "bds_manager"
+DEFAULT_LEVEL = "Bedrock level"
+FUNCTION_MIN_COMMANDS = 32  # smaller batches go to stdin as they are
+FUNCTION_MAX_LINES = 10000  # BDS's functionCommandLimit
+CACHE_SIZE = 200  # generated functions kept; the least recently used go as new ones are written
+
+# Functions run at function-permission-level (2 by default), so only commands that level allows and
+# that answer nothing worth reading per line are batched; op, kick, ban and the like always go direct
+FUNCTION_COMMANDS = {"give", "effect", "enchant", "tp", "teleport", "gamemode", "clear", "kill", "tag", "xp",
+                     "summon", "title", "titleraw", "tell", "msg", "w", "tellraw", "say", "playsound",
+                     "spawnpoint", "clearspawnpoint", "particle", "setblock", "fill", "scoreboard"}
+
+def level_name(server_dir):
+    try:
+        with open(os.path.join(server_dir, "server.properties"), encoding="utf-8") as properties:
+            for line in properties:
+                key, _, value = line.partition("=")
+                if key.strip() == "level-name" and value.strip():
+                    return value.strip()
+    except OSError:
+        pass
+    return DEFAULT_LEVEL
+
+def batchable(commands):
+    return all(command.split(" ", 1)[0].lower() in FUNCTION_COMMANDS for command in commands)
+
+def content_name(commands):
+    digest = hashlib.sha1("\n".join(commands).encode("utf-8")).hexdigest()[:16]
+    return f"{NAMESPACE}/b_{digest}"
+
+class FunctionPack:
+    # Lives in <server>/development_behavior_packs, which BDS reads without pack versioning, and is
+    # registered in the world's world_behavior_packs.json. A new file is only seen after "reload".
+    def __init__(self, server_dir, min_commands=FUNCTION_MIN_COMMANDS, cache_size=CACHE_SIZE):
+        self.server_dir = server_dir
+        self.min_commands = min_commands
+        self.cache_size = cache_size
+        self.pack_dir = os.path.join(server_dir, "development_behavior_packs", PACK_DIR)
+        self.functions_dir = os.path.join(self.pack_dir, "functions")
+        self.loaded = set()  # functions BDS has read, at its start or at the last reload
+        self.ready = False  # the pack was registered when the server started
+        self._lock = threading.Lock()
+
+    def install(self):
+        # Before the server starts. Returns False when there is no world yet to register the pack in.
+        world_dir = os.path.join(self.server_dir, "worlds", level_name(self.server_dir))
+        if not os.path.isdir(world_dir):
+            self.ready = False
+            return False
+        os.makedirs(os.path.join(self.functions_dir, NAMESPACE), exist_ok=True)
+        manifest = {
+            "format_version": 2,
+            "header": {"name": PACK_NAME, "description": "Generated by the server manager",
+                       "uuid": PACK_UUID, "version": PACK_VERSION, "min_engine_version": [1, 20, 0]},
+            "modules": [{"type": "data", "uuid": MODULE_UUID, "version": PACK_VERSION}],
+        }
+        write_json(os.path.join(self.pack_dir, "manifest.json"), manifest)
+        packs_path = os.path.join(world_dir, "world_behavior_packs.json")
+        try:
+            with open(packs_path, encoding="utf-8") as packs_file:
+                packs = json.load(packs_file)
+        except (OSError, ValueError):
+            packs = []
+        if not any(pack.get("pack_id") == PACK_UUID for pack in packs):
+            packs.append({"pack_id": PACK_UUID, "version": PACK_VERSION})
+            write_json(packs_path, packs)
+        self.prune()
+        with self._lock:
+            self.loaded = set(self.names())
+        self.ready = True
+        return True
+
+    def names(self):
+        folder = os.path.join(self.functions_dir, NAMESPACE)
+        try:
+            return [f"{NAMESPACE}/{entry.name[:-len('.mcfunction')]}" for entry in os.scandir(folder)
+                    if entry.name.endswith(".mcfunction")]
+        except FileNotFoundError:
+            return []
+
+    def path_for(self, name):
+        return os.path.join(self.functions_dir, *name.split("/")) + ".mcfunction"
+
+    def prune(self, keep=()):
+        # keep: function names that must stay whatever their age, e.g. the ones about to be run
+        folder = os.path.join(self.functions_dir, NAMESPACE)
+        try:
+            entries = sorted((entry for entry in os.scandir(folder) if entry.name.endswith(".mcfunction")),
+                             key=lambda entry: entry.stat().st_mtime, reverse=True)
+        except FileNotFoundError:
+            return
+        if len(entries) <= self.cache_size:
+            return
+        for entry in entries[self.cache_size:]:
+            if f"{NAMESPACE}/{entry.name[:-len('.mcfunction')]}" in keep:
+                continue
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def wants(self, commands):
+        return self.ready and len(commands) >= self.min_commands and batchable(commands)
+
+    def compile(self, commands):
+        # Returns ([(function name, commands in it)], reload needed). Cached functions are only touched,
+        # so the least recently used are the ones pruned.
+        chunks = []
+        reload = False
+        written = False
+        with self._lock:
+            for start in range(0, len(commands), FUNCTION_MAX_LINES):
+                chunk = commands[start:start + FUNCTION_MAX_LINES]
+                name = content_name(chunk)
+                path = self.path_for(name)
+                if os.path.exists(path):
+                    os.utime(path)
+                else:
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, "w", encoding="utf-8", newline="\n") as function_file:
+                        function_file.write("".join(command + "\n" for command in chunk))
+                    os.replace(tmp_path, path)
+                    written = True
+                reload = reload or name not in self.loaded
+                chunks.append((name, chunk))
+            if written:
+                # BDS keeps what it has loaded until the next reload, so deleting a file is safe now
+                self.prune({name for name, _ in chunks})
+        return chunks, reload
+
+    def reloaded(self, names=None):
+        # names: the functions on disk when the reload was sent, if it was not just now
+        with self._lock:
+            self.loaded = set(self.names() if names is None else names)
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(tmp_path, path)
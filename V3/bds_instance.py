@@ -0,0 +1,298 @@
+import asyncio
+import json
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+from bds_ipc import CommandServer, COMMAND_PORT, COMMAND_TOKEN_FILE, load_token
+from bds_logsink import LogSink
+from bds_roster import RosterTracker
+from bds_events import EventBus, parse_text
+from bds_stream import LineReader, Channel, SPILL
+from bds_archive_index import build_index
+from bds_registry import PlayerRegistry
+from bds_dispatch import CommandDispatcher, CommandResult
+from bds_funcpack import FunctionPack, FUNCTION_MIN_COMMANDS
+from bds_scheduler import CommandScheduler, BULK
+from bds_backup import BackupManager, BACKUP_DIR, KEEP_LAST, KEEP_DAILY
+from bds_lifecycle import ServerController
+from bds_metrics import READ_LINES, READ_BYTES, READ_BATCH, LOG_WRITE, EVENT_PARSE, EVENTS, ROSTER_PLAYERS, track_channel
+
+SERVERS_FILE = "servers.json"
+BDS_PATH = r"D:\\BedrockServer\\bedrock_server.exe"
+LOG_FILE = "server_log.txt"
+COMMAND_FILE = "server_commands.txt"
+OLD_LOGS_DIR = "old_logs"
+REGISTRY_DB = "players.db"
+LOG_FLUSH_INTERVAL = 1.0
+LOG_MAX_BYTES = 64 * 1024 * 1024
+COMPRESS_OLD_LOGS = True
+KEEP_OLD_LOGS = 100
+STOP_TIMEOUT = 60
+AUTO_RESTART = True
+
+# One server. data_dir holds its log, command file, old_logs and registry; workdir is where BDS
+# runs ("" keeps the manager's directory). args are extra command-line arguments for path.
+# Batches of at least function_batch commands run as one generated function (0 sends them line by line).
+# World backups keep the newest backup_keep_last snapshots plus one a day for backup_keep_daily days.
+ServerConfig = namedtuple("ServerConfig", "name path workdir data_dir command_port stop_timeout auto_restart args "
+                                          "function_batch backup_keep_last backup_keep_daily",
+                          defaults=("Bedrock", BDS_PATH, "", "", COMMAND_PORT, STOP_TIMEOUT, AUTO_RESTART, (),
+                                    FUNCTION_MIN_COMMANDS, KEEP_LAST, KEEP_DAILY))
+
+def load_servers(path=SERVERS_FILE):
+    # servers.json is a list of ServerConfig fields, e.g.
+    # [{"name": "Survival", "path": "D:\\Survival\\bedrock_server.exe", "workdir": "D:\\Survival",
+    #   "data_dir": "survival", "command_port": 19150}, ...]
+    # Without it the manager runs the single server it always has, with files in the current directory.
+    # With several servers, one without a data_dir keeps its files in a directory named after it.
+    if not os.path.exists(path):
+        return [ServerConfig()]
+    with open(path, encoding="utf-8") as servers_file:
+        entries = json.load(servers_file)
+    configs = [ServerConfig(**entry) for entry in entries]
+    if len(configs) > 1:
+        configs = [config if config.data_dir else config._replace(data_dir=config.name) for config in configs]
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: server names must be unique")
+    ports = [config.command_port for config in configs]
+    if len(set(ports)) != len(ports):
+        raise ValueError(f"{path}: every server needs its own command_port")
+    data_dirs = [os.path.normcase(os.path.abspath(config.data_dir)) for config in configs]
+    if len(set(data_dirs)) != len(data_dirs):
+        raise ValueError(f"{path}: every server needs its own data_dir for its log, old_logs, players.db and backups")
+    return configs
+
+class ServerInstance:
+    # Everything one BDS needs, without any UI: process supervision, log sink, event bus, roster,
+    # registry and command channel. Instances share the manager's core loop, so N servers cost one
+    # loop thread rather than N readers, watchers and controllers.
+    def __init__(self, config, core):
+        self.config = config
+        self.core = core
+        self.name = config.name
+        self.server_dir = config.workdir or os.path.dirname(config.path)
+        self.log_file = self.data_path(LOG_FILE)
+        self.command_file = self.data_path(COMMAND_FILE)
+        self.old_logs_dir = self.data_path(OLD_LOGS_DIR)
+        self.process = None
+        self.reader_task = None
+        self.on_output = []  # callbacks(line) for every stdout line and manager message; must not block
+        # The stdout reader parses each line once and publishes typed events here
+        self.events = EventBus()
+        # Fed from the event bus and shared with the player list panel
+        self.roster = RosterTracker(log_file=None)
+        self.roster.attach(self.events)
+        ROSTER_PLAYERS.labels(self.name).set_function(lambda: len(self.roster.players))
+        # Persistent player history; archives from before the registry existed are imported in the background
+        self.registry = PlayerRegistry(self.data_path(REGISTRY_DB))
+        self.registry.attach(self.events)
+        self.registry.on_error.append(lambda message: self.emit(f"[Manager] Player registry: {message}\n"))
+        # Every command goes through the dispatcher so BDS answers can be matched back to it in order
+        self.dispatcher = CommandDispatcher(self.write_commands, self.events, name=self.name)
+        # Priority lanes and rate limits in front of the dispatcher, so a bulk job cannot hold up a kick or stop
+        self.scheduler = CommandScheduler(core, self.dispatcher.submit, name=self.name)
+        # Installed in the server directory when BDS starts, if the world exists by then
+        self.function_pack = None
+        if config.function_batch:
+            self.function_pack = FunctionPack(self.server_dir, config.function_batch)
+        # Snapshots of the world, taken between "save hold" and "save resume"
+        self.backups = BackupManager(self, self.data_path(BACKUP_DIR), config.backup_keep_last, config.backup_keep_daily)
+        self.controller = ServerController(core, self.launch, self.send_command, stop_timeout=config.stop_timeout,
+                                           auto_restart=config.auto_restart)
+        self.controller.on_exit.append(self.on_exit)
+        self.log_sink = LogSink(self.log_file, self.old_logs_dir, flush_interval=LOG_FLUSH_INTERVAL,
+                                max_bytes=LOG_MAX_BYTES, compress=COMPRESS_OLD_LOGS, keep_files=KEEP_OLD_LOGS)
+        # Each archive gets a search index once it is compressed, which records where its gzip members start
+        self.log_sink.on_rotate.append(build_index)
+        self.log_sink.on_rotate.append(self.registry.mark_imported)
+        # The reader only hands lines over; disk and parsing happen on these channels' own threads and
+        # overflow goes to a spill file, so neither can stall the pipe or lose a line
+        self.log_channel = Channel(f"{self.name}-log", self.write_log, policy=SPILL)
+        self.event_channel = Channel(f"{self.name}-events", self.publish_events, policy=SPILL)
+        for channel in (self.log_channel, self.event_channel):
+            track_channel(channel)
+        # Commands from a standalone player list arrive over a local socket, with the command file as fallback.
+        # The socket only takes clients that present the token kept next to that file.
+        self.command_server = CommandServer(self.send_commands, port=config.command_port,
+                                            command_file=self.command_file, core=core,
+                                            token=load_token(self.data_path(COMMAND_TOKEN_FILE)))
+
+    def data_path(self, name):
+        if self.config.data_dir:
+            os.makedirs(self.config.data_dir, exist_ok=True)
+        return os.path.join(self.config.data_dir, name)
+
+    def open(self):
+        self.command_server.start()
+        threading.Thread(target=self.registry.import_archives, args=(self.old_logs_dir,), daemon=True).start()
+
+    @property
+    def state(self):
+        return self.controller.state
+
+    def start(self):
+        self.controller.start()
+
+    def stop(self):
+        self.controller.stop()
+
+    def restart(self):
+        self.controller.restart()
+
+    def emit(self, line):
+        for callback in list(self.on_output):
+            try:
+                callback(line)
+            except Exception:
+                pass
+
+    def send_command(self, command):
+        if self.process and command:
+            return self.scheduler.submit([command])[0]
+
+    def send_commands(self, commands, lane=None):
+        # Used by the player list and the command socket; returns a Future per command. Without a lane,
+        # large batches go to the bulk lane and the rest are interactive.
+        commands = list(commands)
+        if self.function_pack is not None and self.process and self.function_pack.wants(commands):
+            return self.send_as_functions(commands)
+        return self.scheduler.submit(commands, lane)
+
+    def send_as_functions(self, commands):
+        # BDS only answers for the function as a whole, so the commands in it cannot be told apart
+        try:
+            chunks, reload = self.function_pack.compile(commands)
+        except OSError as e:
+            self.emit(f"[Manager] Function pack unavailable, sending commands one by one: {e}\n")
+            return self.scheduler.submit(commands)
+        # Taken before the reload is queued, so files written while it waits still need another one
+        names = self.function_pack.names() if reload else None
+        calls = self.scheduler.submit((["reload"] if reload else []) + [f"function {name}" for name, _ in chunks], BULK)
+        if reload:
+            calls[0].add_done_callback(lambda done: self.reload_done(done.result(), names))
+        futures = []
+        for (_, chunk), call in zip(chunks, calls[-len(chunks):]):
+            derived = [Future() for _ in chunk]
+            call.add_done_callback(lambda done, chunk=chunk, derived=derived: self.resolve_chunk(done.result(), chunk, derived))
+            futures.extend(derived)
+        return futures
+
+    def reload_done(self, result, names):
+        # "reload" answers nothing when it works, so it counts once it was written; one that never
+        # reached BDS leaves the pack marked stale and the next batch reloads again
+        if result.ok is not False:
+            self.function_pack.reloaded(names)
+
+    def resolve_chunk(self, result, chunk, futures):
+        # "Successfully executed" only says the function ran; a give to an offline player inside it
+        # fails without a word, so a success is reported as unknown. A failed call failed every command.
+        for command, future in zip(chunk, futures):
+            if result.ok:
+                future.set_result(CommandResult(command, None, ["ran inside function"] + result.lines))
+            else:
+                future.set_result(CommandResult(command, result.ok, result.lines))
+
+    def write_commands(self, commands):
+        # Safe from any thread; a batch is written to stdin in one go on the core loop, the only
+        # place the pipe is touched. False tells the dispatcher nothing was sent.
+        process = self.process
+        if not process or not commands:
+            return False
+        self.core.call(self.write_stdin, process, "".join(command + "\n" for command in commands).encode("utf-8"))
+        return True
+
+    def write_stdin(self, process, data):
+        if not process.stdin.is_closing():
+            process.stdin.write(data)
+
+    async def launch(self):
+        # Runs on the core loop; the log is ready before BDS can write a byte
+        await asyncio.get_running_loop().run_in_executor(None, self.open_log)
+        if self.function_pack is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.install_function_pack)
+        process = await asyncio.create_subprocess_exec(self.config.path, *self.config.args, stdin=asyncio.subprocess.PIPE,
+                                                       stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT,
+                                                       cwd=self.config.workdir or None)
+        self.process = process
+        self.reader_task = asyncio.get_running_loop().create_task(self.read_output(process))
+        return process
+
+    def open_log(self):
+        # A log left behind by a previous session is archived rather than overwritten
+        self.log_sink.close(archive=True)
+        self.log_sink.open()
+        self.roster.clear()
+
+    def install_function_pack(self):
+        # The pack has to be registered before BDS reads the world; without a world yet, batches go line by line
+        try:
+            self.function_pack.install()
+        except OSError as e:
+            self.function_pack.ready = False
+            self.emit(f"[Manager] Could not install the function pack: {e}\n")
+
+    async def read_output(self, process):
+        # Chunked reads and decoding only; everything slower happens behind a channel
+        reader = LineReader(process.stdout)
+        read_lines, read_bytes, read_batch = READ_LINES.labels(self.name), READ_BYTES.labels(self.name), READ_BATCH.labels(self.name)
+        counted = 0
+        while True:
+            lines = await reader.read()
+            read_bytes.inc(reader.bytes_read - counted)
+            counted = reader.bytes_read
+            if not lines:
+                break
+            read_lines.inc(len(lines))
+            read_batch.observe(len(lines))
+            self.log_channel.put(lines)
+            self.event_channel.put(lines)
+            for line in lines:
+                self.emit(line)
+
+    def write_log(self, lines):
+        with LOG_WRITE.labels(self.name).time():
+            self.log_sink.write("".join(lines))
+
+    def publish_events(self, lines):
+        # Parsing includes the roster and registry updates, which run as bus subscribers
+        with EVENT_PARSE.labels(self.name).time():
+            kinds = {}
+            for event in parse_text("".join(lines)):
+                kinds[event.kind] = kinds.get(event.kind, 0) + 1
+                self.events.publish(event)
+        for kind, count in kinds.items():
+            EVENTS.labels(self.name, kind).inc(count)
+
+    def stream_stats(self):
+        return {channel.name: dict(channel.stats) for channel in (self.log_channel, self.event_channel)}
+
+    async def on_exit(self, process, returncode):
+        if self.process is process:
+            self.process = None
+        if self.reader_task:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.reader_task), 5)  # Let the reader drain the last lines
+            except asyncio.TimeoutError:
+                pass
+            self.reader_task = None
+        loop = asyncio.get_running_loop()
+        for channel in (self.event_channel, self.log_channel):
+            await loop.run_in_executor(None, channel.join, 30)
+        self.roster.clear()
+        self.registry.close_sessions()
+        self.scheduler.cancel_all()
+        self.dispatcher.cancel_all()
+        await loop.run_in_executor(None, self.archive_log)
+
+    def archive_log(self):
+        try:
+            self.log_sink.close(archive=True)
+        except Exception as e:
+            self.emit(f"[Manager] Failed to archive log: {e}\n")
+
+def broadcast(instances, commands):
+    # Sends the same commands to every running instance; returns {name: [Future per command]}
+    return {instance.name: instance.send_commands(commands) for instance in instances if instance.process}
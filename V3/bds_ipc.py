@@ -0,0 +1,293 @@
+import asyncio
+import hmac
+import os
+import secrets
+import socket
+import struct
+import threading
+
+from bds_core import EventLoopThread
+
+COMMAND_HOST = "127.0.0.1"
+COMMAND_PORT = 19150
+COMMAND_FILE = "server_commands.txt"
+FILE_POLL_INTERVAL = 0.25
+COMMAND_TOKEN_FILE = "command_token.txt"
+CONNECT_TIMEOUT = 1.0
+ANSWER_TIMEOUT = 10.0  # the handler only queues the commands, so an answer takes milliseconds
+MAX_FRAME = 16 * 1024 * 1024
+MAX_TOKEN = 1024
+
+# Frame: 4-byte big-endian payload length, then UTF-8 commands separated by newlines.
+# The first frame on a connection holds the token instead; a wrong one is NAKed and the connection closed.
+# The server answers every frame with a single byte: ACK once the handler has taken the commands,
+# NAK if the frame is too large or the handler failed. A NAKed frame must not be sent again.
+HEADER = struct.Struct(">I")
+ACK = b"\x06"
+NAK = b"\x15"
+
+def encode_frame(commands):
+    payload = "\n".join(commands).encode("utf-8")
+    return HEADER.pack(len(payload)) + payload
+
+def encode_frames(commands):
+    # Splits a batch so that no frame is larger than MAX_FRAME
+    frames = []
+    batch = []
+    size = 0
+    for command in commands:
+        length = len(command.encode("utf-8")) + 1
+        if length > MAX_FRAME:
+            raise ValueError(f"command of {length} bytes is larger than a frame")
+        if batch and size + length > MAX_FRAME:
+            frames.append(encode_frame(batch))
+            batch = []
+            size = 0
+        batch.append(command)
+        size += length
+    if batch:
+        frames.append(encode_frame(batch))
+    return frames
+
+def commands_in(frames):
+    return [command for frame in frames for command in frame[HEADER.size:].decode("utf-8").split("\n")]
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return bytes(data)
+
+def read_token(path):
+    try:
+        with open(path, encoding="utf-8") as token_file:
+            return token_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load_token(path):
+    # Reuses the token in path, or writes a new one that only the current user can read
+    token = read_token(path)
+    if token:
+        return token
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as token_file:
+        token_file.write(token + "\n")
+    return token
+
+def append_command_file(commands, command_file=COMMAND_FILE):
+    # One write per batch keeps the window against a concurrent rename small
+    with open(command_file, "a", encoding="utf-8") as cmd_file:
+        cmd_file.write("".join(command + "\n" for command in commands))
+
+class CommandFileConsumer:
+    # Consumes the fallback file by renaming it first, so appends are never truncated away.
+    # The renamed file is kept for one more round to pick up writes from a writer that
+    # opened it just before the rename.
+    def __init__(self, command_file=COMMAND_FILE):
+        self.command_file = command_file
+        self.work_file = command_file + ".work"
+        self._offset = 0
+
+    def consume(self):
+        commands = []
+        if os.path.exists(self.work_file):
+            commands += self._read_work(final=True)
+            os.remove(self.work_file)
+            self._offset = 0
+        try:
+            os.replace(self.command_file, self.work_file)
+        except (FileNotFoundError, PermissionError):
+            # Missing, or still held open by a writer on Windows; try again next round
+            return commands
+        commands += self._read_work(final=False)
+        return commands
+
+    def _read_work(self, final):
+        with open(self.work_file, "rb") as work:
+            work.seek(self._offset)
+            data = work.read()
+        end = len(data) if final else data.rfind(b"\n") + 1
+        self._offset += end
+        lines = data[:end].decode("utf-8", "replace").splitlines()
+        return [line.strip() for line in lines if line.strip()]
+
+class CommandServer:
+    # Serves command frames and watches the fallback file on an asyncio loop, its own or a shared
+    # EventLoopThread. handler(commands) runs on that loop thread, so it must not block.
+    # Clients must present token first; without one a random token is made, readable as .token.
+    def __init__(self, handler, host=COMMAND_HOST, port=COMMAND_PORT, command_file=COMMAND_FILE, core=None,
+                 token=None):
+        self.handler = handler
+        self.token = token or secrets.token_urlsafe(32)
+        self.host = host
+        self.port = port
+        self.file_consumer = CommandFileConsumer(command_file)
+        self.core = core
+        self._own_core = core is None
+        self._server = None
+        self._watcher = None
+
+    def start(self):
+        if self.core is None:
+            self.core = EventLoopThread("bds-commands")
+        self.core.run(self._start())
+
+    def stop(self):
+        if self.core is None:
+            return
+        self.core.run(self._stop())
+        if self._own_core:
+            self.core.stop()
+            self.core = None
+
+    async def _start(self):
+        try:
+            self._server = await asyncio.start_server(self._serve, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+        except OSError:
+            # Port in use: clients will fall back to the command file
+            self._server = None
+        self._watcher = asyncio.get_running_loop().create_task(self._watch_file())
+
+    async def _stop(self):
+        if self._watcher:
+            self._watcher.cancel()
+            self._watcher = None
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def dispatch(self, commands):
+        # handler(commands) gets each frame's commands as one list
+        self.handler(commands)
+
+    async def _serve(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+            if size > MAX_TOKEN or not hmac.compare_digest(await reader.readexactly(size), self.token.encode("utf-8")):
+                writer.write(NAK)
+                await writer.drain()
+                return
+            writer.write(ACK)
+            await writer.drain()
+            while True:
+                (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if size > MAX_FRAME:
+                    # The payload is not read, so the stream cannot be resynchronised
+                    writer.write(NAK)
+                    await writer.drain()
+                    break
+                payload = await reader.readexactly(size)
+                commands = [line.strip() for line in payload.decode("utf-8", "replace").split("\n") if line.strip()]
+                try:
+                    self.dispatch(commands)
+                except Exception:
+                    writer.write(NAK)
+                else:
+                    writer.write(ACK)
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _watch_file(self):
+        # The file is only a fallback; one stat-and-rename every FILE_POLL_INTERVAL is all it costs
+        while True:
+            try:
+                commands = self.file_consumer.consume()
+            except OSError:
+                commands = []
+            if commands:
+                self.dispatch(commands)
+            await asyncio.sleep(FILE_POLL_INTERVAL)
+
+class CommandClient:
+    # token, or else the one the manager wrote to token_file, is read again on every connect
+    def __init__(self, host=COMMAND_HOST, port=COMMAND_PORT, command_file=COMMAND_FILE, token=None,
+                 token_file=COMMAND_TOKEN_FILE):
+        self.host = host
+        self.port = port
+        self.command_file = command_file
+        self.token = token
+        self.token_file = token_file
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def send(self, commands):
+        # Returns True when the manager acknowledged the batch, False if it went to the file.
+        # Raises RuntimeError if the manager refused a frame or the token, or sent no answer for a frame
+        # it may have queued; none of those commands are sent again.
+        commands = [command for command in commands if command]
+        if not commands:
+            return True
+        with self._lock:
+            frames = encode_frames(commands)
+            for index, frame in enumerate(frames):
+                sent = self._send_frame(frame)
+                if sent is None:
+                    raise RuntimeError(f"no answer from the manager: {len(commands_in([frame]))} command(s) may "
+                                       f"have run, {len(commands_in(frames[index + 1:]))} were not sent")
+                if not sent:
+                    append_command_file(commands_in(frames[index:]), self.command_file)
+                    return False
+            return True
+
+    def _send_frame(self, frame):
+        # True if ACKed, False if it could not be sent, None if it was sent but never answered
+        for _ in range(2):
+            try:
+                if self._sock is None:
+                    self._connect()
+                self._sock.sendall(frame)
+                break
+            except OSError:
+                # A stale connection gets one reconnect before falling back
+                self.close()
+        else:
+            return False
+        try:
+            answer = recv_exact(self._sock, 1)
+        except OSError:
+            # The manager may have queued the commands already; sending them again could run them twice
+            self.close()
+            return None
+        if answer == ACK:
+            return True
+        self.close()
+        raise RuntimeError("the manager refused the commands")
+
+    def _connect(self):
+        token = self.token or read_token(self.token_file)
+        if not token:
+            raise ConnectionError(f"no command token in {self.token_file}")
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        try:
+            sock.settimeout(ANSWER_TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall(encode_frame([token]))
+            answer = recv_exact(sock, 1)
+        except OSError:
+            sock.close()
+            raise
+        if answer != ACK:
+            sock.close()
+            raise RuntimeError("the manager refused the command token" + ("" if self.token else f" in {self.token_file}"))
+        self._sock = sock
+
+    def close(self):
+        if self._sock:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
@@ -0,0 +1,163 @@
+import csv
+import difflib
+import os
+import re
+from collections import namedtuple
+
+ITEMS_CSV = "GiveItemList.csv"
+INVENTORY_SLOTS = 36
+FUZZY_CUTOFF = 0.6
+FUZZY_CANDIDATES = 40
+
+Item = namedtuple("Item", "name id stack_size numeric_id survival label")
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+def trigrams(text):
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class ItemCatalog:
+    # Loaded once and reloaded only when the CSV's mtime changes
+    def __init__(self, path=ITEMS_CSV):
+        self.path = path
+        self.items = []
+        self.by_label = {}
+        self.by_id = {}
+        self.by_name = {}
+        self.prefix_index = {}
+        self.trigram_index = {}
+        self._mtime = None
+        self._cache = {}
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return bool(self.items)
+        if mtime != self._mtime:
+            self._load()
+            self._mtime = mtime
+        return bool(self.items)
+
+    def _load(self):
+        items = []
+        with open(self.path, newline='', encoding='utf-8') as csvfile:
+            rows = csv.reader(csvfile)
+            header = next(rows, [])
+            columns = {}
+            for index, title in enumerate(header):
+                columns.setdefault(title.strip(), index)
+            name_col = columns.get("Name", 1)
+            id_col = columns.get("Id", 2)
+            stack_col = columns.get("Stack Size")
+            numeric_col = columns.get("Numerical Id")
+            survival_col = columns.get("Survival Obtainable")
+            for row in rows:
+                if len(row) <= max(name_col, id_col) or not row[id_col].strip():
+                    continue
+                name, item_id = row[name_col].strip(), row[id_col].strip()
+                items.append(Item(name, item_id, self._int(row, stack_col, 64), self._int(row, numeric_col, None),
+                                  self._cell(row, survival_col).upper() in ("YES", "TRUE"), f"{name} - {item_id}"))
+
+        prefix_index = {}
+        trigram_index = {}
+        for position, item in enumerate(items):
+            for trigram in trigrams(item.name.lower()):
+                trigram_index.setdefault(trigram, []).append(position)
+            for token in set(tokenize(item.name) + tokenize(item.id)) | {item.id.lower()}:
+                for end in range(1, len(token) + 1):
+                    prefix_index.setdefault(token[:end], set()).add(position)
+
+        self.items = items
+        self.by_label = {item.label: item for item in items}
+        self.by_id = {item.id.lower(): item for item in items}
+        self.by_name = {}
+        for item in items:
+            self.by_name.setdefault(item.name.lower(), item)
+        self.prefix_index = {prefix: frozenset(positions) for prefix, positions in prefix_index.items()}
+        self.trigram_index = trigram_index
+        self._cache = {}
+
+    @staticmethod
+    def _cell(row, column):
+        return row[column].strip() if column is not None and column < len(row) else ""
+
+    @classmethod
+    def _int(cls, row, column, default):
+        try:
+            return int(cls._cell(row, column))
+        except ValueError:
+            return default
+
+    def lookup(self, text):
+        # Accepts a dropdown label, an item id or a display name
+        text = text.strip()
+        item = self.by_label.get(text) or self.by_id.get(text.lower())
+        if item is None and " - " in text:
+            item = self.by_id.get(text.rsplit(" - ", 1)[1].strip().lower())
+        return item or self.by_name.get(text.lower())
+
+    def search(self, query, fuzzy=True):
+        query = query.strip().lower()
+        if query in self._cache:
+            return self._cache[query]
+        tokens = tokenize(query)
+        if not tokens:
+            results = list(self.items)
+        else:
+            # Every query token must prefix some token of the name or id
+            positions = None
+            for token in sorted(tokens, key=len, reverse=True):
+                matched = self.prefix_index.get(token, frozenset())
+                positions = matched if positions is None else positions & matched
+                if not positions:
+                    break
+            if positions:
+                results = sorted((self.items[position] for position in positions),
+                                 key=lambda item: self._rank(item, query))
+            else:
+                results = [item for item in self.items if query in item.label.lower()]
+                if not results and fuzzy:
+                    results = self._fuzzy(query)
+        self._cache[query] = results
+        return results
+
+    @staticmethod
+    def _rank(item, query):
+        name = item.name.lower()
+        return (name != query and item.id.lower() != query, not name.startswith(query), len(name), name)
+
+    def _fuzzy(self, query):
+        # Shared trigrams pick a short list; only those get the more expensive similarity ratio
+        shared = {}
+        for trigram in trigrams(query):
+            for position in self.trigram_index.get(trigram, ()):
+                shared[position] = shared.get(position, 0) + 1
+        candidates = sorted(shared, key=shared.get, reverse=True)[:FUZZY_CANDIDATES]
+        scored = []
+        matcher = difflib.SequenceMatcher(b=query)
+        for position in candidates:
+            item = self.items[position]
+            matcher.set_seq1(item.name.lower())
+            if matcher.real_quick_ratio() >= FUZZY_CUTOFF and matcher.quick_ratio() >= FUZZY_CUTOFF:
+                score = matcher.ratio()
+                if score >= FUZZY_CUTOFF:
+                    scored.append((-score, item.name, item))
+        return [item for _, _, item in sorted(scored)]
+
+    def max_quantity(self, item):
+        # A give larger than a full inventory of stacks would be dropped on the ground
+        return max(1, item.stack_size or 1) * INVENTORY_SLOTS
+
+_catalogs = {}
+
+def get_catalog(path=ITEMS_CSV):
+    catalog = _catalogs.get(path)
+    if catalog is None:
+        catalog = _catalogs[path] = ItemCatalog(path)
+    catalog.refresh()
+    return catalog
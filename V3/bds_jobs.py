@@ -0,0 +1,469 @@
+import argparse
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from bds_metrics import JOB_RUNS, JOB_SECONDS, JOB_LAG, JOB_NEXT_RUN
+
+# Recurring restarts, announcements, backups and log rotations. Every job sits in one heap ordered by
+# due time and a single timer on the core loop is armed for the earliest, so a few hundred jobs cost
+# nothing until one is due.
+
+JOBS_FILE = "jobs.json"
+JOBS_STATE_FILE = "jobs_state.json"  # when each job last ran, for catching up on runs missed while the manager was down
+MAX_SLEEP = 60  # the timer is re-armed at least this often, so a wall clock change or a suspend is noticed
+SKIP = "skip"  # a missed run is dropped; the job waits for its next time
+RUN_ONCE = "run"  # one catch-up run when the manager starts, however many were missed
+ALL_SERVERS = "*"
+
+CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+CRON_ALIASES = {"@hourly": "0 * * * *", "@daily": "0 0 * * *", "@midnight": "0 0 * * *",
+                "@weekly": "0 0 * * 0", "@monthly": "0 0 1 * *", "@yearly": "0 0 1 1 *"}
+CRON_HORIZON = timedelta(days=366 * 5)  # "30 2 31 2 *" never matches; give up instead of looping forever
+
+# One job from jobs.json, e.g.
+# [{"name": "nightly-restart", "server": "Survival", "action": "restart", "cron": "0 4 * * *"},
+#  {"name": "backup", "action": "backup", "every": 3600, "jitter": 120, "missed": "run"},
+#  {"name": "vote", "action": "command", "args": ["say Vote for us!"], "cron": "*/30 8-23 * * *"}]
+# Exactly one of cron (minute hour day month weekday, local time) or every (seconds, counted from the
+# Unix epoch so the times do not drift or move with restarts). jitter delays each run by up to that
+# many seconds. server is a server name or "*" for every server.
+JobConfig = namedtuple("JobConfig", "name action server args every cron jitter missed enabled",
+                       defaults=(ALL_SERVERS, (), 0, "", 0, SKIP, True))
+
+async def run_commands(instance, args):
+    if instance.process is None:
+        return "skipped: server not running"
+    results = [await asyncio.wrap_future(future) for future in instance.send_commands(list(args))]
+    failed = [result for result in results if result.ok is False]
+    if failed:
+        raise RuntimeError("; ".join(f"{result.command}: {' '.join(result.lines)}" for result in failed))
+    return f"{len(results)} commands"
+
+async def run_start(instance, args):
+    if instance.process is not None:
+        return "skipped: already running"
+    instance.start()
+
+async def run_stop(instance, args):
+    if instance.process is None:
+        return "skipped: server not running"
+    instance.stop()
+
+async def run_restart(instance, args):
+    # A server someone stopped on purpose stays stopped
+    if instance.process is None:
+        return "skipped: server not running"
+    instance.restart()
+
+async def run_backup(instance, args):
+    snapshot = await asyncio.get_running_loop().run_in_executor(None, instance.backups.backup)
+    return snapshot.name
+
+async def run_archive(instance, args):
+    archived = await asyncio.get_running_loop().run_in_executor(None, instance.log_sink.rotate)
+    return os.path.basename(archived) if archived else "log was empty"
+
+# action -> coroutine(instance, args) returning a short note, or one starting "skipped" when there was nothing to do
+ACTIONS = {"command": run_commands, "start": run_start, "stop": run_stop, "restart": run_restart,
+           "backup": run_backup, "archive": run_archive}
+
+def parse_cron_field(text, low, high):
+    values = set()
+    for part in text.split(","):
+        base, slash, step = part.partition("/")
+        step = int(step) if slash else 1
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            start, end = (int(bound) for bound in base.split("-", 1))
+        else:
+            start = int(base)
+            end = high if slash else start
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"{part!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+class CronSchedule:
+    def __init__(self, expression):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"cron {expression!r}: expected minute hour day month weekday")
+        try:
+            self.minutes, self.hours, self.days, self.months, weekdays = (
+                parse_cron_field(field, low, high) for field, (_, low, high) in zip(fields, CRON_FIELDS))
+        except ValueError as e:
+            raise ValueError(f"cron {expression!r}: {e}") from None
+        self.weekdays = frozenset(day % 7 for day in weekdays)  # 0 and 7 are both Sunday
+        self.hour_list = sorted(self.hours)
+        self.minute_list = sorted(self.minutes)
+        # As in cron, when both day and weekday are restricted either one matching is enough
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, timestamp):
+        # Jumps a whole month or day at a time, and straight to the next matching hour or minute
+        moment = datetime.fromtimestamp(timestamp).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + CRON_HORIZON
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                later = bisect.bisect(self.hour_list, moment.hour)
+                if later < len(self.hour_list):
+                    moment = moment.replace(hour=self.hour_list[later], minute=0)
+                else:
+                    moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.minute not in self.minutes:
+                later = bisect.bisect(self.minute_list, moment.minute)
+                if later < len(self.minute_list):
+                    moment = moment.replace(minute=self.minute_list[later])
+                else:
+                    moment = moment.replace(minute=0) + timedelta(hours=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"cron {self.expression!r} never matches")
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+class IntervalSchedule:
+    def __init__(self, every):
+        if every <= 0:
+            raise ValueError("every must be a positive number of seconds")
+        self.every = every
+
+    def next_after(self, timestamp):
+        return (timestamp // self.every + 1) * self.every
+
+    def __str__(self):
+        return f"every {self.every:g}s"
+
+def make_schedule(config):
+    if bool(config.cron) == bool(config.every):
+        raise ValueError(f"job {config.name!r}: give exactly one of cron or every")
+    schedule = CronSchedule(config.cron) if config.cron else IntervalSchedule(config.every)
+    schedule.next_after(time.time())  # a cron that can never match fails here, not at run time
+    return schedule
+
+def check_job(config):
+    if not config.name or not isinstance(config.name, str):
+        raise ValueError("every job needs a name")
+    if config.action not in ACTIONS:
+        raise ValueError(f"job {config.name!r}: action must be one of {', '.join(ACTIONS)}")
+    if config.action == "command" and (isinstance(config.args, str) or not config.args):
+        raise ValueError(f"job {config.name!r}: a command job needs args, a list of commands")
+    if config.missed not in (SKIP, RUN_ONCE):
+        raise ValueError(f"job {config.name!r}: missed must be {SKIP!r} or {RUN_ONCE!r}")
+    if config.jitter < 0:
+        raise ValueError(f"job {config.name!r}: jitter cannot be negative")
+    return make_schedule(config)
+
+def load_jobs(path=JOBS_FILE, servers=None):
+    # servers: the configured server names; a job for any other fails here rather than at startup
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as jobs_file:
+        configs = [JobConfig(**entry) for entry in json.load(jobs_file)]
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: job names must be unique")
+    for config in configs:
+        check_job(config)
+        if servers is not None and config.server != ALL_SERVERS and config.server not in servers:
+            raise ValueError(f"job {config.name!r}: no server named {config.server!r}")
+    return configs
+
+def write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file, indent=2)
+    os.replace(tmp_path, path)
+
+def job_entry(config):
+    # Only what differs from the defaults goes back into jobs.json
+    return {field: value for field, value in config._asdict().items()
+            if field in ("name", "action") or value != JobConfig._field_defaults[field]}
+
+class Job:
+    __slots__ = ("config", "schedule", "base", "due", "generation", "running", "stats")
+
+    def __init__(self, config, schedule):
+        self.config = config
+        self.schedule = schedule
+        self.base = None  # the scheduled time of the next run, before jitter
+        self.due = None
+        self.generation = 0  # bumped on every reschedule; heap entries from older ones are skipped
+        self.running = False
+        self.stats = {"runs": 0, "failed": 0, "skipped": 0, "last_run": None, "last_seconds": None, "last_lag": None,
+                      "last_result": None, "last_note": ""}
+
+class JobScheduler:
+    # Runs on the core loop. add/remove/run_now may be called from any thread and write jobs.json back.
+    def __init__(self, core, instances, configs=(), path=JOBS_FILE, state_path=JOBS_STATE_FILE):
+        self.core = core
+        self.instances = {instance.name: instance for instance in instances}
+        self.path = path
+        self.state_path = state_path
+        self.jobs = {}
+        self.configs = {}
+        self.rng = random.Random()
+        self._heap = []
+        self._seq = itertools.count()
+        self._timer = None
+        self._armed_for = None
+        self._lock = threading.Lock()
+        try:
+            with open(state_path, encoding="utf-8") as state_file:
+                self.last_runs = json.load(state_file)
+        except (OSError, ValueError):
+            self.last_runs = {}
+        for config in configs:
+            self.configs[config.name] = (config, self.check(config))
+
+    def check(self, config):
+        schedule = check_job(config)
+        if config.server != ALL_SERVERS and config.server not in self.instances:
+            raise ValueError(f"job {config.name!r}: no server named {config.server!r}")
+        return schedule
+
+    def start(self):
+        self.core.call(self._start)
+
+    def stop(self):
+        self.core.call(self._cancel_timer)
+
+    def add(self, config):
+        # Adds or replaces a job; raises ValueError at once when it is not valid
+        schedule = self.check(config)
+        config = config._replace(args=tuple(config.args))
+        with self._lock:
+            self.configs[config.name] = (config, schedule)
+            self.save()
+        self.core.call(self._add, config, schedule, False)
+
+    def remove(self, name):
+        with self._lock:
+            if self.configs.pop(name, None) is None:
+                return False
+            self.save()
+        self.core.call(self._remove, name)
+        return True
+
+    def reload(self, configs):
+        # Replaces every job, e.g. after jobs.json was edited by hand; nothing changes if one is invalid
+        checked = {config.name: (config, self.check(config)) for config in configs}
+        with self._lock:
+            self.configs = checked
+        self.core.call(self._reload)
+
+    def run_now(self, name):
+        if name not in self.configs:
+            return False
+        self.core.call(self._run_now, name)
+        return True
+
+    def save(self):
+        write_json(self.path, [job_entry(config) for config, _ in self.configs.values()])
+
+    def _run_now(self, name):
+        job = self.jobs.get(name)
+        if job is not None:
+            self._launch(job, time.time(), scheduled=False)
+
+    def _start(self):
+        for config, schedule in list(self.configs.values()):
+            self._add(config, schedule, True)
+
+    def _reload(self):
+        for name in [name for name in self.jobs if name not in self.configs]:
+            self._remove(name)
+        for config, schedule in list(self.configs.values()):
+            self._add(config, schedule, False)
+
+    def _add(self, config, schedule, starting):
+        self._remove(config.name)
+        job = Job(config, schedule)
+        self.jobs[config.name] = job
+        JOB_NEXT_RUN.labels(config.name).set_function(lambda: job.due)
+        if not config.enabled:
+            return
+        now = time.time()
+        last_run = self.last_runs.get(config.name)
+        if starting and config.missed == RUN_ONCE and last_run and schedule.next_after(last_run) <= now:
+            # The manager was down when it was due: one run now stands in for all that were missed
+            self._push(job, now, now)
+        else:
+            self._schedule(job, now)
+        self._arm()
+
+    def _remove(self, name):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            job.generation += 1
+            JOB_NEXT_RUN.remove(name)
+            self._arm()
+
+    def _schedule(self, job, after):
+        base = job.schedule.next_after(after)
+        self._push(job, base, base + (self.rng.uniform(0, job.config.jitter) if job.config.jitter else 0))
+
+    def _push(self, job, base, due):
+        job.generation += 1
+        job.base = base
+        job.due = due
+        heapq.heappush(self._heap, (due, next(self._seq), job, job.generation))
+
+    def _arm(self):
+        heap = self._heap
+        while heap and heap[0][2].generation != heap[0][3]:
+            heapq.heappop(heap)
+        if not heap:
+            self._cancel_timer()
+            return
+        due = heap[0][0]
+        if self._timer is not None and self._armed_for == due:
+            return
+        self._cancel_timer()
+        self._armed_for = due
+        self._timer = self.core.loop.call_later(min(max(0.0, due - time.time()), MAX_SLEEP), self._wake)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _wake(self):
+        self._timer = None
+        now = time.time()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, _, job, generation = heapq.heappop(heap)
+            if job.generation != generation:
+                continue
+            self._launch(job, now)
+            # Counted from now, so runs missed while the loop was held up are dropped, not replayed
+            self._schedule(job, now)
+        self._arm()
+
+    def _launch(self, job, now, scheduled=True):
+        if job.running:
+            # Still busy with its previous run (a slow backup): this one is dropped
+            self._finish(job, "skipped", "previous run still going", 0.0)
+            return
+        if scheduled:
+            JOB_LAG.labels(job.config.name).observe(max(0.0, now - job.due))
+            job.stats["last_lag"] = max(0.0, now - job.due)
+        job.running = True
+        # Only scheduled runs count for missed-run catch-up; a manual run leaves the schedule as it was
+        self.core.loop.create_task(self._run(job, job.base if scheduled else None))
+
+    def targets(self, config):
+        if config.server == ALL_SERVERS:
+            return list(self.instances.values())
+        return [self.instances[config.server]]
+
+    async def _run(self, job, base):
+        config = job.config
+        start = time.perf_counter()
+        notes = []
+        outcomes = set()
+        for instance in self.targets(config):
+            try:
+                note = await ACTIONS[config.action](instance, config.args) or ""
+                outcomes.add("skipped" if note.startswith("skipped") else "ok")
+            except Exception as e:
+                note = f"failed: {e}"
+                outcomes.add("failed")
+            instance.emit(f"[Manager] Job {config.name}: {config.action}" + (f" ({note})" if note else "") + "\n")
+            notes.append(f"{instance.name}: {note}" if len(self.instances) > 1 else note)
+        result = "failed" if "failed" in outcomes else "ok" if "ok" in outcomes else "skipped"
+        job.running = False
+        self._finish(job, result, "; ".join(note for note in notes if note), time.perf_counter() - start)
+        if base is not None and self.jobs.get(config.name) is job:
+            self.last_runs[config.name] = base
+            await asyncio.get_running_loop().run_in_executor(None, self.write_state, dict(self.last_runs))
+
+    def _finish(self, job, result, note, seconds):
+        stats = job.stats
+        stats["runs" if result == "ok" else result] += 1
+        stats["last_run"] = time.time()
+        stats["last_result"] = result
+        stats["last_note"] = note
+        JOB_RUNS.labels(job.config.name, result).inc()
+        if result != "skipped":
+            stats["last_seconds"] = seconds
+            JOB_SECONDS.labels(job.config.name).observe(seconds)
+
+    def write_state(self, last_runs):
+        with self._lock:
+            try:
+                write_json(self.state_path, {name: when for name, when in last_runs.items() if name in self.configs})
+            except OSError:
+                pass
+
+    def describe(self):
+        described = []
+        for name, (config, schedule) in list(self.configs.items()):
+            job = self.jobs.get(name)
+            entry = {"name": name, "action": config.action, "server": config.server, "schedule": str(schedule),
+                     "enabled": config.enabled, "next_run": job.due if job and config.enabled else None,
+                     "running": bool(job and job.running)}
+            entry.update(job.stats if job else {})
+            described.append(entry)
+        return described
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S") if timestamp else "-"
+
+def format_jobs(described):
+    lines = [f"{'job':<24} {'action':<8} {'server':<12} {'schedule':<24} {'next run':<19}  {'runs':>5} {'fail':>4} "
+             f"{'skip':>4} {'last':>8}  last result"]
+    for entry in described:
+        last = f"{entry['last_seconds']:.2f}s" if entry.get("last_seconds") is not None else "-"
+        result = entry.get("last_result") or ""
+        note = entry.get("last_note")
+        if note:
+            result = note if note.startswith(result) else f"{result} ({note})"
+        lines.append(f"{entry['name']:<24} {entry['action']:<8} {entry['server']:<12} {entry['schedule']:<24} "
+                     f"{format_time(entry['next_run']):<19}  {entry.get('runs', 0):>5} {entry.get('failed', 0):>4} "
+                     f"{entry.get('skipped', 0):>4} {last:>8}  {result}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check a jobs file and show when each job runs next")
+    parser.add_argument("path", nargs="?", default=JOBS_FILE)
+    parser.add_argument("--count", type=int, default=3, help="upcoming runs to show per job")
+    args = parser.parse_args()
+    for config in load_jobs(args.path):
+        schedule = make_schedule(config)
+        upcoming = []
+        when = time.time()
+        for _ in range(args.count):
+            when = schedule.next_after(when)
+            upcoming.append(format_time(when))
+        state = "" if config.enabled else " (disabled)"
+        print(f"{config.name}: {config.action} on {config.server}, {schedule}{state}")
+        print("  next: " + ", ".join(upcoming) + (f" (+ up to {config.jitter:g}s jitter)" if config.jitter else ""))
+
+if __name__ == "__main__":
+    main()
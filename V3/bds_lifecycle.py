@@ -0,0 +1,152 @@
+import asyncio
+
+STOPPED = "stopped"
+STARTING = "starting"
+RUNNING = "running"
+STOPPING = "stopping"
+CRASHED = "crashed"
+
+STOP_TIMEOUT = 60  # seconds BDS gets to save the world after "stop"
+TERMINATE_TIMEOUT = 10
+RESTART_BACKOFF_BASE = 5
+RESTART_BACKOFF_MAX = 300
+STABLE_RUN = 600  # a run this long resets the backoff
+
+class ServerController:
+    # Supervises the server on the core's event loop and reports every state change to subscribers.
+    # launch() is a coroutine returning a running asyncio subprocess; send_command(text) writes a line
+    # to its stdin. start/stop/restart may be called from any thread; all state lives on the loop.
+    def __init__(self, core, launch, send_command, stop_command="stop", stop_timeout=STOP_TIMEOUT,
+                 terminate_timeout=TERMINATE_TIMEOUT, auto_restart=True):
+        self.core = core
+        self.launch = launch
+        self.send_command = send_command
+        self.stop_command = stop_command
+        self.stop_timeout = stop_timeout
+        self.terminate_timeout = terminate_timeout
+        self.auto_restart = auto_restart
+        self.on_exit = []  # callbacks(process, returncode), may be coroutines; run before the exit is published
+        self.state = STOPPED
+        self.process = None
+        self._listeners = []
+        self._stop_requested = False
+        self._restart_after_stop = False
+        self._restart_handle = None
+        self._restart_attempts = 0
+        self._started_at = 0
+
+    def subscribe(self, callback):
+        # callback(state, detail) is called on the core's loop thread
+        self._listeners.append(callback)
+
+    def _set_state(self, state, detail=""):
+        self.state = state
+        for callback in list(self._listeners):
+            try:
+                callback(state, detail)
+            except Exception:
+                pass
+
+    def start(self):
+        self.core.call(self._start)
+
+    def stop(self):
+        self.core.call(self._stop)
+
+    def restart(self):
+        self.core.call(self._restart)
+
+    def _start(self):
+        if self.state in (STARTING, RUNNING, STOPPING):
+            return False
+        self._cancel_restart()
+        self._stop_requested = False
+        self._set_state(STARTING)
+        self.core.loop.create_task(self._run())
+        return True
+
+    def _stop(self):
+        if self.state == CRASHED:
+            self._cancel_restart()
+            self._set_state(STOPPED, "auto-restart cancelled")
+            return True
+        if self.state not in (STARTING, RUNNING):
+            return False
+        self._stop_requested = True
+        self._set_state(STOPPING)
+        if self.process is not None:
+            # Otherwise the launch is still in flight and _run stops the process once it exists
+            self.core.loop.create_task(self._shutdown(self.process))
+        return True
+
+    def _restart(self):
+        running = self.state in (STARTING, RUNNING)
+        self._restart_after_stop = running
+        return self._stop() if running else self._start()
+
+    async def _run(self):
+        loop = self.core.loop
+        try:
+            process = await self.launch()
+        except Exception as e:
+            self._set_state(STOPPED, f"failed to start: {e}")
+            return
+        self.process = process
+        self._started_at = loop.time()
+        if self._stop_requested:
+            loop.create_task(self._shutdown(process))
+        else:
+            self._set_state(RUNNING, f"pid {process.pid}")
+
+        returncode = await process.wait()
+        for callback in list(self.on_exit):
+            try:
+                result = callback(process, returncode)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception:
+                pass
+        if self.process is process:
+            self.process = None
+        if self._stop_requested:
+            self._set_state(STOPPED, f"exit code {returncode}")
+            if self._restart_after_stop:
+                self._restart_after_stop = False
+                self._start()
+            return
+        if loop.time() - self._started_at >= STABLE_RUN:
+            self._restart_attempts = 0
+        self._set_state(CRASHED, f"exit code {returncode}")
+        if self.auto_restart:
+            delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** self._restart_attempts)
+            self._restart_attempts += 1
+            self._restart_handle = loop.call_later(delay, self._auto_restart)
+            self._set_state(CRASHED, f"restarting in {delay}s (attempt {self._restart_attempts})")
+
+    async def _shutdown(self, process):
+        try:
+            self.send_command(self.stop_command)
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(process.wait(), self.stop_timeout)
+            return
+        except asyncio.TimeoutError:
+            self._set_state(STOPPING, f"no exit after {self.stop_timeout}s, terminating")
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), self.terminate_timeout)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            self._set_state(STOPPING, "still running, killing")
+            process.kill()
+
+    def _auto_restart(self):
+        self._restart_handle = None
+        self._start()
+
+    def _cancel_restart(self):
+        if self._restart_handle:
+            self._restart_handle.cancel()
+            self._restart_handle = None
@@ -0,0 +1,210 @@
+import gzip
+import os
+import queue
+import re
+import threading
+import time
+from datetime import datetime
+
+LOG_FILE = "server_log.txt"
+OLD_LOGS_DIR = "old_logs"
+FLUSH_INTERVAL = 1.0
+FLUSH_BYTES = 64 * 1024
+MAX_LOG_BYTES = 64 * 1024 * 1024  # 0 disables size-based rotation
+MAX_LOG_AGE = 0  # seconds, 0 disables time-based rotation
+COMPRESS_ARCHIVES = True
+COMPRESS_BLOCK = 64 * 1024  # uncompressed bytes per gzip member
+KEEP_ARCHIVES = 100  # 0 keeps every archive
+KEEP_DAYS = 90  # 0 keeps archives forever
+
+# Written around a rotation that happens while the server runs, so readers can tell it from a restart
+ROTATED_LINE = "[Manager] Log continues in the next archive\n"
+CONTINUED_LINE = "[Manager] Log continued from the previous archive\n"
+
+ARCHIVE_RE = re.compile(r"^server_log_\d{4}-\d\d-\d\d_\d\d-\d\d-\d\d(?:_\d+)?\.txt(?:\.gz)?$")
+
+def archive_name(archive_dir, stamp=None):
+    stamp = stamp or datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    path = os.path.join(archive_dir, f"server_log_{stamp}.txt")
+    counter = 1
+    while os.path.exists(path) or os.path.exists(path + ".gz"):
+        path = os.path.join(archive_dir, f"server_log_{stamp}_{counter}.txt")
+        counter += 1
+    return path
+
+def replace_with_retry(src, dst, attempts=10):
+    # On Windows a reader holding the file open briefly makes the rename fail
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+def compress_file(path, block_size=COMPRESS_BLOCK):
+    # One gzip member per block of whole lines. Any gzip reader still sees a single stream, but a search
+    # can start decompressing at the member holding a line instead of at the start of the file.
+    gz_path = path + ".gz"
+    tmp_path = gz_path + ".tmp"
+    with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+        partial = b""
+        while True:
+            chunk = src.read(block_size)
+            data = partial + chunk
+            cut = len(data) if not chunk else data.rfind(b"\n") + 1
+            partial = data[cut:]
+            if cut:
+                dst.write(gzip.compress(data[:cut], compresslevel=6, mtime=0))
+            if not chunk:
+                break
+    os.replace(tmp_path, gz_path)
+    os.remove(path)
+    return gz_path
+
+def apply_retention(archive_dir, keep_files=KEEP_ARCHIVES, keep_days=KEEP_DAYS):
+    try:
+        entries = [entry for entry in os.scandir(archive_dir) if entry.is_file() and ARCHIVE_RE.match(entry.name)]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda entry: (entry.stat().st_mtime, entry.name), reverse=True)
+    cutoff = time.time() - keep_days * 86400 if keep_days else None
+    removed = []
+    for index, entry in enumerate(entries):
+        if (keep_files and index >= keep_files) or (cutoff and entry.stat().st_mtime < cutoff):
+            try:
+                os.remove(entry.path)
+                removed.append(entry.path)
+                # Drop the archive's search index sidecar along with it
+                stem = re.sub(r"\.txt(?:\.gz)?$", "", entry.path)
+                if os.path.exists(stem + ".idx"):
+                    os.remove(stem + ".idx")
+            except OSError:
+                pass
+    return removed
+
+class LogSink:
+    def __init__(self, path=LOG_FILE, archive_dir=OLD_LOGS_DIR, flush_interval=FLUSH_INTERVAL, flush_bytes=FLUSH_BYTES,
+                 max_bytes=MAX_LOG_BYTES, max_age=MAX_LOG_AGE, compress=COMPRESS_ARCHIVES,
+                 keep_files=KEEP_ARCHIVES, keep_days=KEEP_DAYS):
+        self.path = path
+        self.archive_dir = archive_dir
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.keep_files = keep_files
+        self.keep_days = keep_days
+        self.on_rotate = []  # callbacks(archive_path), run on the archive worker thread once it is compressed
+        self._file = None
+        self._size = 0
+        self._opened_at = 0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._archive_queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+        threading.Thread(target=self._archive_worker, daemon=True).start()
+
+    def open(self):
+        with self._lock:
+            self._open()
+
+    def _open(self):
+        if self._file:
+            return
+        self._file = open(self.path, "a", encoding="utf-8", errors="replace", buffering=self.flush_bytes)
+        self._size = self._file.tell()
+        self._opened_at = time.time()
+
+    def write(self, line):
+        with self._lock:
+            if not self._file:
+                self._open()
+            self._file.write(line)
+            self._size += len(line) if line.isascii() else len(line.encode("utf-8", "replace"))
+            self._dirty = True
+            if (self.max_bytes and self._size >= self.max_bytes) or \
+                    (self.max_age and time.time() - self._opened_at >= self.max_age):
+                self._continue()
+
+    def flush(self):
+        with self._lock:
+            if self._file and self._dirty:
+                self._file.flush()
+                self._dirty = False
+
+    def rotate(self):
+        # Moves the current log into the archive dir with a rename; the copy and compression happen off-thread
+        with self._lock:
+            if self._file is None:
+                return self._rotate()
+            return self._continue()
+
+    def close(self, archive=False):
+        with self._lock:
+            if archive:
+                return self._rotate()
+            self._close()
+
+    def _close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+            self._dirty = False
+
+    def _continue(self):
+        self._file.write(ROTATED_LINE)
+        archived = self._rotate()
+        self._open()
+        self._file.write(CONTINUED_LINE)
+        self._size += len(CONTINUED_LINE)
+        self._dirty = True
+        return archived
+
+    def _rotate(self):
+        self._close()
+        try:
+            if os.path.getsize(self.path) == 0:
+                return None
+        except OSError:
+            return None
+        os.makedirs(self.archive_dir, exist_ok=True)
+        archived = archive_name(self.archive_dir)
+        replace_with_retry(self.path, archived)
+        self._archive_queue.put(archived)
+        return archived
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except (OSError, ValueError):
+                pass
+
+    def _archive_worker(self):
+        while True:
+            archived = self._archive_queue.get()
+            if archived is None:
+                break
+            if self.compress:
+                try:
+                    archived = compress_file(archived)
+                except OSError:
+                    pass
+            for callback in list(self.on_rotate):
+                try:
+                    callback(archived)
+                except Exception:
+                    pass
+            try:
+                apply_retention(self.archive_dir, self.keep_files, self.keep_days)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        self.close()
+        self._stop.set()
+        self._archive_queue.put(None)
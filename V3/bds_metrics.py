@@ -0,0 +1,363 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+METRICS_FILE = "metrics.prom"
+EXPORT_INTERVAL = 15
+# Seconds; spans a sub-millisecond batch up to a command that waits out its timeout
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def render(self):
+        # Prometheus text exposition format
+        out = []
+        with self._lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        for metric in metrics:
+            samples = metric.samples()
+            if not samples:
+                continue
+            out.append(f"# HELP {metric.name} {metric.help}")
+            out.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in samples:
+                out.append(f"{metric.name}{suffix}{labels} {format_value(value)}")
+        return "\n".join(out) + "\n"
+
+    def write_textfile(self, path=METRICS_FILE):
+        # Atomic, so a collector never reads half a file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(tmp_path, path)
+
+REGISTRY = Registry()
+
+class Value:
+    __slots__ = ("value", "function", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        # Read at collection time instead of being pushed; function() may return None to skip the sample
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return None
+        return self.value
+
+class HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for index, bound in enumerate(self.bounds):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        return Timer(self)
+
+class Timer:
+    # with histogram.time(): ... observes the elapsed seconds
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    def _new_child(self):
+        return Value()
+
+    def samples(self):
+        samples = []
+        for values, child in list(self._children.items()):
+            value = child.get()
+            if value is not None:
+                samples.append(("", format_labels(self.labelnames, values), value))
+        return samples
+
+    # Unlabelled metrics are used directly
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+class Counter(Metric):
+    kind = "counter"
+
+class Gauge(Metric):
+    kind = "gauge"
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets) + (float("inf"),)
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return HistogramValue(self.buckets)
+
+    def samples(self):
+        samples = []
+        for values, child in list(self._children.items()):
+            with child.lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", format_labels(self.labelnames, values, ("le", format_value(bound))), cumulative))
+            samples.append(("_sum", format_labels(self.labelnames, values), total))
+            samples.append(("_count", format_labels(self.labelnames, values), count))
+        return samples
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+# Metrics threaded through the manager
+READ_LINES = Counter("bds_stdout_lines_total", "Lines read from server stdout", ["server"])
+READ_BYTES = Counter("bds_stdout_bytes_total", "Bytes read from server stdout", ["server"])
+READ_BATCH = Histogram("bds_stdout_batch_lines", "Lines per stdout read", ["server"], buckets=SIZE_BUCKETS)
+CHANNEL_DEPTH = Gauge("bds_channel_depth_lines", "Lines waiting in a reader channel", ["channel"])
+CHANNEL_LINES = Counter("bds_channel_lines_total", "Lines through a reader channel by outcome", ["channel", "outcome"])
+LOG_WRITE = Histogram("bds_log_write_seconds", "Time to write one batch to the log sink", ["server"])
+EVENT_PARSE = Histogram("bds_event_parse_seconds", "Time to parse and publish one batch of lines", ["server"])
+EVENTS = Counter("bds_events_total", "Parsed server events by kind", ["server", "kind"])
+COMMAND_LATENCY = Histogram("bds_command_latency_seconds", "Time from writing a command to its answer", ["server"])
+COMMAND_RESULTS = Counter("bds_command_results_total", "Command results by outcome", ["server", "outcome"])
+COMMANDS_PENDING = Gauge("bds_commands_pending", "Commands waiting for an answer", ["server"])
+COMMAND_QUEUE_DEPTH = Gauge("bds_command_queue_depth", "Commands waiting in a scheduler lane", ["server", "lane"])
+COMMAND_QUEUE_WAIT = Histogram("bds_command_queue_seconds", "Time a command waited in its lane before the write",
+                               ["server", "lane"])
+COMMANDS_COALESCED = Counter("bds_commands_coalesced_total", "Duplicate commands folded into one already queued",
+                             ["server"])
+ROSTER_PLAYERS = Gauge("bds_roster_players", "Players online", ["server"])
+BACKUP_SECONDS = Histogram("bds_backup_seconds", "Time from save hold to save resume, or of an offline backup",
+                           ["server"], buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+BACKUP_BYTES = Counter("bds_backup_bytes_total", "World bytes backed up, copied or already in the store", ["server", "kind"])
+JOB_RUNS = Counter("bds_job_runs_total", "Scheduled job runs by result (ok, failed, skipped)", ["job", "result"])
+JOB_SECONDS = Histogram("bds_job_seconds", "Time a scheduled job took, over all its servers", ["job"],
+                        buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 900))
+JOB_LAG = Histogram("bds_job_lag_seconds", "How long after its due time a scheduled job was started", ["job"])
+JOB_NEXT_RUN = Gauge("bds_job_next_run_timestamp_seconds", "When a scheduled job runs next (Unix time)", ["job"])
+CONSOLE_RENDER = Histogram("bds_console_render_seconds", "Time to render one batch into the console widget", ["console"])
+CONSOLE_FIND = Histogram("bds_console_find_seconds", "Time to search the console scrollback for one query", ["console"])
+CONSOLE_LINES = Gauge("bds_console_widget_lines", "Lines held by the console widget", ["console"])
+THREADS = Gauge("bds_manager_threads", "Live threads in the manager")
+UPTIME = Gauge("bds_manager_uptime_seconds", "Seconds since the manager started")
+RSS = Gauge("bds_manager_resident_memory_bytes", "Resident memory of the manager process")
+TRACED = Gauge("bds_manager_traced_memory_bytes", "Python heap traced by tracemalloc, while it is on")
+
+STARTED_AT = time.monotonic()
+
+if os.name == "nt":
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        # PROCESS_MEMORY_COUNTERS from psapi.h
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    # K32GetProcessMemoryInfo is psapi's GetProcessMemoryInfo exported by kernel32 since Windows 7
+    kernel32.K32GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+    kernel32.K32GetProcessMemoryInfo.restype = wintypes.BOOL
+
+def resident_memory():
+    # Working set on Windows, resident set from /proc elsewhere; None where neither is available
+    if os.name == "nt":
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        if kernel32.K32GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+THREADS.set_function(threading.active_count)
+UPTIME.set_function(lambda: round(time.monotonic() - STARTED_AT, 3))
+RSS.set_function(resident_memory)
+TRACED.set_function(lambda: tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None)
+
+def track_channel(channel):
+    CHANNEL_DEPTH.labels(channel.name).set_function(lambda: len(channel.buffer))
+    for outcome in ("delivered", "dropped", "coalesced", "spilled"):
+        CHANNEL_LINES.labels(channel.name, outcome).set_function(lambda outcome=outcome: channel.stats[outcome])
+
+def export_periodically(core, path=METRICS_FILE, interval=EXPORT_INTERVAL, registry=REGISTRY):
+    # Rewrites the text file every interval from the core loop; the write itself runs in the executor
+    loop = core.loop
+
+    def tick():
+        loop.run_in_executor(None, registry.write_textfile, path)
+        loop.call_later(interval, tick)
+
+    core.call(tick)
+
+class Profiler:
+    # cProfile only sees the thread that enabled it, so start() and stop() must run on the thread to
+    # profile (use core.call for the loop thread). stop() writes the stats and returns the top entries.
+    def __init__(self):
+        self.profile = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self, path=None, limit=25):
+        if self.profile is None:
+            return ""
+        profile, self.profile = self.profile, None
+        profile.disable()
+        if path:
+            profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+class MemoryTracer:
+    # tracemalloc snapshots; each snapshot is compared with the previous one to show what grew
+    def __init__(self, frames=10):
+        self.frames = frames
+        self.previous = None
+
+    @property
+    def running(self):
+        return tracemalloc.is_tracing()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+
+    def snapshot(self, limit=20):
+        if not tracemalloc.is_tracing():
+            return "tracemalloc is not running\n"
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB"]
+        if self.previous is None:
+            lines += [str(stat) for stat in snapshot.statistics("lineno")[:limit]]
+        else:
+            lines.append("growth since the last snapshot:")
+            lines += [str(stat) for stat in snapshot.compare_to(self.previous, "lineno")[:limit]]
+        self.previous = snapshot
+        return "\n".join(lines) + "\n"
@@ -1,8 +1,16 @@
-import csv
 import tkinter as tk
 from tkinter import ttk, simpledialog, messagebox
 import os
-import re
+import argparse
+import bisect
+import queue
+import time
+from concurrent.futures import Future
+from bds_roster import RosterTracker
+from bds_ipc import CommandClient, COMMAND_PORT, COMMAND_TOKEN_FILE
+from bds_items import get_catalog
+from bds_commands import CommandBatch
+from bds_dispatch import player_outcomes
 
 LOG_FILE = "server_log.txt"
 COMMAND_FILE = "server_commands.txt"
@@ -23,293 +31,435 @@ EFFECTS = ["speed", "slowness", "haste", "mining_fatigue", "strength", "instant_
 # Item categories
 ITEM_CATEGORIES = list(ENCHANTMENTS.keys())
 
-def fetch_player_list():
-    if not os.path.exists(LOG_FILE):
-        return []
-    
-    with open(LOG_FILE, "r") as file:
-        log_content = file.readlines()
-    
-    players = set()
-    for line in log_content:
-        connect_match = re.search(r"Player connected: ([^,]+),", line)
-        disconnect_match = re.search(r"Player disconnected: ([^,]+)", line)
-        
-        if connect_match:
-            players.add(connect_match.group(1))
-        elif disconnect_match and disconnect_match.group(1) in players:
-            players.remove(disconnect_match.group(1))
-    
-    return list(players)
-
-def refresh_players():
-    for widget in player_listbox_frame.winfo_children():
-        widget.destroy()
-    players = fetch_player_list()
-    for player in players:
-        var = tk.BooleanVar()
-        chk = tk.Checkbutton(player_listbox_frame, text=player, variable=var)
-        chk.var = var
-        chk.pack(anchor='w')
-        player_checkboxes[player] = var
-
-def send_command(command):
-    try:
-        with open(COMMAND_FILE, "a") as cmd_file:
-            cmd_file.write(command + "\n")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to send command: {e}")
-
-def execute_command():
-    selected_players = [player for player, var in player_checkboxes.items() if var.get()]
-    if not selected_players:
-        messagebox.showwarning("Warning", "No player selected!")
-        return
+ROSTER_REFRESH_MS = 500
+RESULTS_POLL_MS = 100
+MAX_RESULT_LINES = 500
+OUTCOME_COLORS = {True: "dark green", False: "red", None: "dark orange"}
+OUTCOME_MARKS = {True: "OK", False: "FAILED", None: "?"}
+
+COMMANDS = ["op", "deop", "kick", "ban", "teleport", "give", "kill", "effect", "gamemode", "clear", "difficulty", "summon", "enchant"]
+
+class PlayerListPanel:
+    # Player list and command UI. The manager opens it as a Toplevel sharing its live roster and
+    # command path; run standalone it tails server_log.txt and talks to the manager over its socket.
+    def __init__(self, window, roster=None, command_sink=None, registry=None):
+        self.window = window
+        # Optional PlayerRegistry; op/deop/ban that BDS confirms are recorded in it
+        self.registry = registry
+        # Keeps its place in the log so each refresh only parses new lines
+        self.roster = roster or RosterTracker(LOG_FILE)
+        if command_sink is None:
+            # Talks to the manager over its local command socket, falling back to COMMAND_FILE
+            command_sink = CommandClient(command_file=COMMAND_FILE).send
+        # command_sink(commands) may return a Future per command (the manager's does); results are then
+        # reported per player in the results list instead of a message box per action
+        self.command_sink = command_sink
+        self.results = queue.SimpleQueue()
+
+        window.title("Player List & Commands")
+        window.geometry("400x500")
+
+        self.count_var = tk.StringVar(value="Players online: 0")
+        tk.Label(window, textvariable=self.count_var).pack(pady=5)
+
+        # Scrollable roster; rows are only added or removed as players come and go
+        list_container = tk.Frame(window)
+        list_container.pack(fill=tk.BOTH, expand=True, padx=5)
+        self.player_canvas = tk.Canvas(list_container, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(list_container, orient="vertical", command=self.player_canvas.yview)
+        self.player_canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill="y")
+        self.player_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.player_listbox_frame = tk.Frame(self.player_canvas)
+        self.player_canvas.create_window((0, 0), window=self.player_listbox_frame, anchor="nw")
+        self.player_listbox_frame.bind("<Configure>", self.update_scroll_region)
+        self.player_canvas.bind("<MouseWheel>", self.on_mousewheel)
+
+        self.player_checkboxes = {}  # name -> BooleanVar, kept while the player stays online
+        self.player_rows = {}  # name -> Checkbutton
+        self.player_order = []  # (lowercased name, name), in the same order as the packed rows
+
+        # Command Selection
+        self.command_var = tk.StringVar()
+        self.command_dropdown = ttk.Combobox(window, textvariable=self.command_var, state='readonly')
+        self.command_dropdown["values"] = COMMANDS
+        self.command_dropdown.pack(pady=5)
+        self.command_dropdown.current(0)
+
+        self.execute_button = tk.Button(window, text="Execute Command", command=self.execute_command)
+        self.execute_button.pack(pady=5)
+
+        # Per-player outcome of each action, newest at the bottom
+        tk.Label(window, text="Results").pack()
+        self.results_list = tk.Listbox(window, height=8)
+        self.results_list.pack(fill=tk.BOTH, padx=5, pady=5)
+
+        # Roster changes only flag the panel; the Tk loop picks the flag up on its next tick
+        self.roster_dirty = True
+        self.unsubscribe_roster = self.roster.subscribe(self.mark_roster_dirty)
+        window.bind("<Destroy>", self.on_destroy, add="+")
+        self.auto_refresh()
+        self.results_job = self.window.after(RESULTS_POLL_MS, self.process_results)
+
+    def fetch_player_list(self):
+        self.roster.poll()
+        return self.roster.names()
+
+    def mark_roster_dirty(self):
+        self.roster_dirty = True
+
+    def auto_refresh(self):
+        # poll() is a single stat when the log has not grown; in the manager the roster is pushed instead
+        self.roster.poll()
+        if self.roster_dirty:
+            self.refresh_players()
+        self.refresh_job = self.window.after(ROSTER_REFRESH_MS, self.auto_refresh)
+
+    def on_destroy(self, event):
+        if event.widget is self.window:
+            self.unsubscribe_roster()
+            self.window.after_cancel(self.refresh_job)
+            self.window.after_cancel(self.results_job)
+
+    def refresh_players(self):
+        # Diff against the rows on screen so untouched rows keep their widgets and checkbox state
+        self.roster_dirty = False
+        players = set(self.fetch_player_list())
+        for player in [player for player in self.player_rows if player not in players]:
+            self.player_rows.pop(player).destroy()
+            del self.player_checkboxes[player]
+            del self.player_order[bisect.bisect_left(self.player_order, (player.lower(), player))]
+        for player in players:
+            if player in self.player_rows:
+                continue
+            key = (player.lower(), player)
+            index = bisect.bisect(self.player_order, key)
+            var = tk.BooleanVar()
+            chk = tk.Checkbutton(self.player_listbox_frame, text=player, variable=var)
+            chk.var = var
+            chk.bind("<MouseWheel>", self.on_mousewheel)
+            if index < len(self.player_order):
+                # Insert in sorted position without repacking the rows below it
+                chk.pack(anchor='w', before=self.player_rows[self.player_order[index][1]])
+            else:
+                chk.pack(anchor='w')
+            self.player_order.insert(index, key)
+            self.player_rows[player] = chk
+            self.player_checkboxes[player] = var
+        self.count_var.set(f"Players online: {len(self.player_rows)}")
+
+    def update_scroll_region(self, event=None):
+        self.player_canvas.configure(scrollregion=self.player_canvas.bbox("all"))
+
+    def on_mousewheel(self, event):
+        self.player_canvas.yview_scroll(int(-event.delta / 120), "units")
+
+    def send_command(self, command):
+        self.send_commands([command])
+
+    def send_commands(self, commands):
+        # The whole batch goes out as one frame, or one append to the fallback file
+        try:
+            return self.command_sink(commands)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to send command: {e}")
+
+    def new_batch(self):
+        self.roster.poll()
+        # A tailed log is flushed about once a second, so its roster may miss a player who just joined
+        return CommandBatch(self.roster.names(), live=self.roster.log_file is None)
+
+    def send_batch(self, batch, action):
+        # Returns at once; the outcome is queued for the Tk loop when every command has been answered
+        sent = self.send_commands(batch.commands)
+        summary = batch.summary()
+        if not (isinstance(sent, list) and sent and all(isinstance(future, Future) for future in sent)):
+            self.results.put((action, summary, batch, None))
+            return summary
+        remaining = [len(sent)]
+
+        def on_done(_):
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                self.results.put((action, summary, batch, [future.result() for future in sent]))
+
+        for future in sent:
+            future.add_done_callback(on_done)
+        return summary
+
+    def process_results(self):
+        try:
+            while True:
+                self.show_result(*self.results.get_nowait())
+        except queue.Empty:
+            pass
+        self.results_job = self.window.after(RESULTS_POLL_MS, self.process_results)
+
+    def show_result(self, action, summary, batch, results):
+        stamp = time.strftime("%H:%M:%S")
+        self.add_result_line(f"{stamp} {action} ({summary})", "black")
+        if results is None:
+            return
+        command = batch.commands[0].split(" ", 1)[0].lower() if batch.commands else ""
+        for player, (ok, text) in sorted(player_outcomes(batch, results).items(), key=lambda item: item[0].lower()):
+            self.add_result_line(f"    {OUTCOME_MARKS[ok]:<6} {player}: {text}", OUTCOME_COLORS[ok])
+            if ok and self.registry is not None:
+                self.registry.set_status(command, player)
+
+    def add_result_line(self, text, color):
+        at_bottom = self.results_list.yview()[1] >= 1.0
+        self.results_list.insert(tk.END, text)
+        self.results_list.itemconfig(tk.END, foreground=color)
+        overflow = self.results_list.size() - MAX_RESULT_LINES
+        if overflow > 0:
+            self.results_list.delete(0, overflow - 1)
+        if at_bottom:
+            self.results_list.see(tk.END)
+
+    def execute_command(self):
+        selected_players = [player for player, var in self.player_checkboxes.items() if var.get()]
+        if not selected_players:
+            messagebox.showwarning("Warning", "No player selected!")
+            return
     
-    command = command_var.get()
-
-    if command == "teleport":
-        teleport_window = tk.Toplevel(root)
-        teleport_window.title("Teleport Command")
-
-        destination_var = tk.StringVar()
-        destination_label = tk.Label(teleport_window, text="Enter destination (coordinates or player):")
-        destination_label.pack(pady=5)
-        destination_entry = tk.Entry(teleport_window, textvariable=destination_var)
-        destination_entry.pack(pady=5)
-
-        check_blocks_var = tk.BooleanVar(value=False)
-        check_blocks_check = tk.Checkbutton(teleport_window, text="Check for blocks", variable=check_blocks_var)
-        check_blocks_check.pack(pady=5)
-
-        def confirm_teleport():
-            destination = destination_var.get()
-            check_for_blocks = check_blocks_var.get()
-
-            if not destination:
-                messagebox.showwarning("Warning", "No destination provided!")
-                return
-
-            check_blocks_str = "true" if check_for_blocks else "false"
-            for player_name in selected_players:
-                send_command(f"teleport {player_name} {destination} {check_blocks_str}")
+        command = self.command_var.get()
+
+        if command == "teleport":
+            teleport_window = tk.Toplevel(self.window)
+            teleport_window.title("Teleport Command")
+
+            destination_var = tk.StringVar()
+            destination_label = tk.Label(teleport_window, text="Enter destination (coordinates or player):")
+            destination_label.pack(pady=5)
+            destination_entry = tk.Entry(teleport_window, textvariable=destination_var)
+            destination_entry.pack(pady=5)
+
+            check_blocks_var = tk.BooleanVar(value=False)
+            check_blocks_check = tk.Checkbutton(teleport_window, text="Check for blocks", variable=check_blocks_var)
+            check_blocks_check.pack(pady=5)
+
+            def confirm_teleport():
+                destination = destination_var.get()
+                check_for_blocks = check_blocks_var.get()
+
+                if not destination:
+                    messagebox.showwarning("Warning", "No destination provided!")
+                    return
+
+                check_blocks_str = "true" if check_for_blocks else "false"
+                batch = self.new_batch()
+                batch.add(f"teleport {{target}} {destination} {check_blocks_str}", selected_players)
+                self.send_batch(batch, f"Teleport to {destination}")
+                teleport_window.destroy()
+
+            confirm_button = tk.Button(teleport_window, text="Teleport", command=confirm_teleport)
+            confirm_button.pack(pady=5)
+
+        elif command == "gamemode":
+            gamemode_window = tk.Toplevel(self.window)
+            gamemode_window.title("Select Gamemode")
+
+            def select_gamemode(mode):
+                if mode == "Survival":
+                    gamemode_code = 0
+                elif mode == "Creative":
+                    gamemode_code = 1
+                elif mode == "Adventure":
+                    gamemode_code = 2
+                else:
+                    gamemode_code = 0  # Default to Survival mode if unknown mode
+
+                batch = self.new_batch()
+                batch.add(f"gamemode {gamemode_code} {{target}}", selected_players)
+                self.send_batch(batch, f"Set {mode} mode (gamemode {gamemode_code})")
+                gamemode_window.destroy()
+
+            # Create buttons for each gamemode (Survival is now Gamemode 0)
+            gamemodes = ["Survival", "Creative", "Adventure"]
+            for mode in gamemodes:
+                btn = tk.Button(gamemode_window, text=mode, command=lambda m=mode: select_gamemode(m))
+                btn.pack(pady=5)
+
+        elif command == "effect":
+            effect_window = tk.Toplevel(self.window)
+            effect_window.title("Select Effect")
+            effect_window.geometry("500x400")  # Adjust window size for multiple columns
+
+            # Add a canvas and scrollbar
+            canvas = tk.Canvas(effect_window)
+            canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+            scrollbar = ttk.Scrollbar(effect_window, orient="vertical", command=canvas.yview)
+            scrollbar.pack(side=tk.RIGHT, fill="y")
+            canvas.configure(yscrollcommand=scrollbar.set)
+
+            # Add a frame inside the canvas
+            effect_frame = tk.Frame(canvas)
+            canvas.create_window((0, 0), window=effect_frame, anchor="nw")
+
+            def select_effect(effect):
+                if effect == "clear":
+                    batch = self.new_batch()
+                    batch.add("effect {target} clear", selected_players)
+                    self.send_batch(batch, "Clear all effects")
+                    effect_window.destroy()
+                    return
             
-            messagebox.showinfo("Command Sent", f"Teleported {', '.join(selected_players)} to {destination}.")
-            teleport_window.destroy()
-
-        confirm_button = tk.Button(teleport_window, text="Teleport", command=confirm_teleport)
-        confirm_button.pack(pady=5)
-
-    elif command == "gamemode":
-        gamemode_window = tk.Toplevel(root)
-        gamemode_window.title("Select Gamemode")
-
-        def select_gamemode(mode):
-            if mode == "Survival":
-                gamemode_code = 0
-            elif mode == "Creative":
-                gamemode_code = 1
-            elif mode == "Adventure":
-                gamemode_code = 2
-            else:
-                gamemode_code = 0  # Default to Survival mode if unknown mode
-
-            for player_name in selected_players:
-                send_command(f"gamemode {gamemode_code} {player_name}")
-            messagebox.showinfo("Command Sent", f"Set {', '.join(selected_players)} to {mode} mode (gamemode {gamemode_code}).")
-            gamemode_window.destroy()
-
-        # Create buttons for each gamemode (Survival is now Gamemode 0)
-        gamemodes = ["Survival", "Creative", "Adventure"]
-        for mode in gamemodes:
-            btn = tk.Button(gamemode_window, text=mode, command=lambda m=mode: select_gamemode(m))
-            btn.pack(pady=5)
-
-    elif command == "effect":
-        effect_window = tk.Toplevel(root)
-        effect_window.title("Select Effect")
-        effect_window.geometry("500x400")  # Adjust window size for multiple columns
-
-        # Add a canvas and scrollbar
-        canvas = tk.Canvas(effect_window)
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+                duration = simpledialog.askinteger("Duration", "Enter duration (seconds):", minvalue=1, maxvalue=1000)
+                amplifier = simpledialog.askinteger("Amplifier", "Enter amplifier level (0-255):", minvalue=0, maxvalue=255)
+                if duration is not None and amplifier is not None:
+                    batch = self.new_batch()
+                    batch.add(f"effect {{target}} {effect} {duration} {amplifier}", selected_players)
+                    self.send_batch(batch, f"Effect {effect} {duration} {amplifier}")
+                effect_window.destroy()
 
-        scrollbar = ttk.Scrollbar(effect_window, orient="vertical", command=canvas.yview)
-        scrollbar.pack(side=tk.RIGHT, fill="y")
-        canvas.configure(yscrollcommand=scrollbar.set)
+            # Layout effects in 3 columns
+            columns = 3
+            for i, effect in enumerate(EFFECTS + ["clear"]):
+                btn = tk.Button(effect_frame, text=effect, width=20, command=lambda e=effect: select_effect(e))
+                btn.grid(row=i // columns, column=i % columns, padx=10, pady=5)
 
-        # Add a frame inside the canvas
-        effect_frame = tk.Frame(canvas)
-        canvas.create_window((0, 0), window=effect_frame, anchor="nw")
+            # Update the scroll region
+            effect_frame.update_idletasks()
+            canvas.configure(scrollregion=canvas.bbox("all"))
 
-        def select_effect(effect):
-            if effect == "clear":
-                for player_name in selected_players:
-                    send_command(f"effect {player_name} clear")
-                messagebox.showinfo("Command Sent", f"Cleared all effects on {', '.join(selected_players)}")
-                effect_window.destroy()
-                return
-            
-            duration = simpledialog.askinteger("Duration", "Enter duration (seconds):", minvalue=1, maxvalue=1000)
-            amplifier = simpledialog.askinteger("Amplifier", "Enter amplifier level (0-255):", minvalue=0, maxvalue=255)
-            if duration is not None and amplifier is not None:
-                for player_name in selected_players:
-                    send_command(f"effect {player_name} {effect} {duration} {amplifier}")
-                messagebox.showinfo("Command Sent", f"Executed effect {effect} {duration} {amplifier} on {', '.join(selected_players)}")
-            effect_window.destroy()
-
-        # Layout effects in 3 columns
-        columns = 3
-        for i, effect in enumerate(EFFECTS + ["clear"]):
-            btn = tk.Button(effect_frame, text=effect, width=20, command=lambda e=effect: select_effect(e))
-            btn.grid(row=i // columns, column=i % columns, padx=10, pady=5)
-
-        # Update the scroll region
-        effect_frame.update_idletasks()
-        canvas.configure(scrollregion=canvas.bbox("all"))
-
-    elif command == "enchant":
-        enchant_item(selected_players)
+        elif command == "enchant":
+            self.enchant_item(selected_players)
     
-    elif command == "give":
-        give_item(selected_players)
+        elif command == "give":
+            self.give_item(selected_players)
     
-    else:
-        for player_name in selected_players:
-            send_command(f"{command} {player_name}")
-        messagebox.showinfo("Command Sent", f"Executed {command} on {', '.join(selected_players)}")
-
-def enchant_item(selected_players):
-    enchant_window = tk.Toplevel(root)
-    enchant_window.title("Select Item Type")
-
-    def select_item(item_type):
-        enchant_window.destroy()
-        show_enchants(selected_players, item_type)
+        else:
+            batch = self.new_batch()
+            batch.add(command + " {target}", selected_players)
+            self.send_batch(batch, command.capitalize())
+
+    def enchant_item(self, selected_players):
+        enchant_window = tk.Toplevel(self.window)
+        enchant_window.title("Select Item Type")
+
+        def select_item(item_type):
+            enchant_window.destroy()
+            self.show_enchants(selected_players, item_type)
     
-    # Display buttons for item types
-    for item_type in ITEM_CATEGORIES:
-        btn = tk.Button(enchant_window, text=item_type.capitalize(), command=lambda it=item_type: select_item(it))
-        btn.pack(pady=5)
-
-def show_enchants(selected_players, selected_item):
-    enchant_window = tk.Toplevel(root)
-    enchant_window.title(f"Enchant {selected_item.capitalize()}")
+        # Display buttons for item types
+        for item_type in ITEM_CATEGORIES:
+            btn = tk.Button(enchant_window, text=item_type.capitalize(), command=lambda it=item_type: select_item(it))
+            btn.pack(pady=5)
+
+    def show_enchants(self, selected_players, selected_item):
+        enchant_window = tk.Toplevel(self.window)
+        enchant_window.title(f"Enchant {selected_item.capitalize()}")
     
-    selected_enchants = {}
+        selected_enchants = {}
     
-    def apply_enchants():
-        for enchant, level_var in selected_enchants.items():
-            level = level_var.get()
-            if level > 0:  # Only apply if a level is selected
-                for player_name in selected_players:
-                    send_command(f"enchant {player_name} {enchant.lower().replace(' ', '_')} {level}")
-        enchant_window.destroy()
+        def apply_enchants():
+            batch = self.new_batch()
+            for enchant, level_var in selected_enchants.items():
+                level = level_var.get()
+                if level > 0:  # Only apply if a level is selected
+                    batch.add(f"enchant {{target}} {enchant.lower().replace(' ', '_')} {level}", selected_players)
+            self.send_batch(batch, f"Enchant {selected_item}")
+            enchant_window.destroy()
     
-    # Display applicable enchantments based on the selected item
-    applicable_enchants = ENCHANTMENTS.get(selected_item.lower(), {})
+        # Display applicable enchantments based on the selected item
+        applicable_enchants = ENCHANTMENTS.get(selected_item.lower(), {})
     
-    for enchant, max_level in applicable_enchants.items():
-        frame = tk.Frame(enchant_window)
-        frame.pack(pady=5)
+        for enchant, max_level in applicable_enchants.items():
+            frame = tk.Frame(enchant_window)
+            frame.pack(pady=5)
         
-        label = tk.Label(frame, text=enchant)
-        label.pack(side="left", padx=10)
+            label = tk.Label(frame, text=enchant)
+            label.pack(side="left", padx=10)
         
-        level_var = tk.IntVar(value=0)
-        selected_enchants[enchant] = level_var
+            level_var = tk.IntVar(value=0)
+            selected_enchants[enchant] = level_var
         
-        level_spinbox = tk.Spinbox(frame, from_=0, to=max_level, textvariable=level_var, width=5)
-        level_spinbox.pack(side="left")
+            level_spinbox = tk.Spinbox(frame, from_=0, to=max_level, textvariable=level_var, width=5)
+            level_spinbox.pack(side="left")
     
-    apply_button = tk.Button(enchant_window, text="Apply Enchantments", command=apply_enchants)
-    apply_button.pack(pady=10)
-
-# Function to read the CSV and filter columns 2 and 3 (index 1 and 2)
-def load_item_list():
-    if not os.path.exists(ITEMS_CSV):
-        messagebox.showerror("Error", f"{ITEMS_CSV} not found!")
-        return []
-    
-    item_list = []
-    with open(ITEMS_CSV, newline='', encoding='utf-8') as csvfile:
-        csvreader = csv.reader(csvfile)
-        for row in csvreader:
-            # Use column 3 for the command
-            if len(row) > 2:
-                item_name = row[1]  # Column 2 (displayed to user)
-                command_item = row[2]  # Column 3 (used in command)
-                item_list.append(f"{item_name} - {command_item}")
-    return item_list
-
-# Function for the give command with dropdown selection and quantity
-def give_item(selected_players):
-    item_list = load_item_list()
-    if not item_list:
-        messagebox.showerror("Error", "Item list is empty or unavailable.")
-        return
-
-    give_window = tk.Toplevel(root)
-    give_window.title("Select Item to Give")
-
-    # Create a combobox for item selection (with search functionality)
-    item_var = tk.StringVar()
-    item_dropdown = ttk.Combobox(give_window, textvariable=item_var, values=item_list)
-    item_dropdown.pack(pady=10)
-    item_dropdown.focus_set()
-
-    # Make the dropdown searchable
-    def on_type(event):
-        value = event.widget.get().lower()
-        filtered_items = [item for item in item_list if value in item.lower()]
-        item_dropdown["values"] = filtered_items
-
-    item_dropdown.bind("<KeyRelease>", on_type)
-
-    # Add entry for quantity
-    quantity_var = tk.IntVar(value=1)
-    quantity_label = tk.Label(give_window, text="Quantity:")
-    quantity_label.pack(pady=5)
-    quantity_entry = tk.Entry(give_window, textvariable=quantity_var)
-    quantity_entry.pack(pady=5)
-
-    def confirm_give():
-        selected_item = item_var.get().split(" - ")[1]  # Use column 3 (command format)
-        quantity = quantity_var.get()  # Get the quantity
-
-        if not selected_item:
-            messagebox.showwarning("Warning", "No item selected!")
-            return
+        apply_button = tk.Button(enchant_window, text="Apply Enchantments", command=apply_enchants)
+        apply_button.pack(pady=10)
 
-        for player_name in selected_players:
-            send_command(f"give {player_name} {selected_item} {quantity}")
-        messagebox.showinfo("Command Sent", f"Gave {quantity}x {selected_item} to {', '.join(selected_players)}")
-        give_window.destroy()
-
-    give_button = tk.Button(give_window, text="Give Item", command=confirm_give)
-    give_button.pack(pady=10)
-
-# GUI Setup
-root = tk.Tk()
-root.title("Player List & Commands")
-root.geometry("400x500")
-
-player_checkboxes = {}
-player_listbox_frame = tk.Frame(root)
-player_listbox_frame.pack(pady=5)
-
-refresh_button = tk.Button(root, text="Refresh Players", command=refresh_players)
-refresh_button.pack(pady=5)
-
-# Command Selection
-command_var = tk.StringVar()
-command_dropdown = ttk.Combobox(root, textvariable=command_var, state='readonly')
-command_dropdown["values"] = ["op", "deop", "kick", "ban", "teleport", "give", "kill", "effect", "gamemode", "clear", "difficulty", "summon", "enchant"]
-command_dropdown.pack(pady=5)
-command_dropdown.current(0)
+    # Function for the give command with dropdown selection and quantity
+    def give_item(self, selected_players):
+        if not os.path.exists(ITEMS_CSV):
+            messagebox.showerror("Error", f"{ITEMS_CSV} not found!")
+            return
+        # Parsed once and indexed; reloaded only if the CSV changes on disk
+        catalog = get_catalog(ITEMS_CSV)
+        if not catalog.items:
+            messagebox.showerror("Error", "Item list is empty or unavailable.")
+            return
+        item_list = [item.label for item in catalog.items]
+
+        give_window = tk.Toplevel(self.window)
+        give_window.title("Select Item to Give")
+
+        # Create a combobox for item selection (with search functionality)
+        item_var = tk.StringVar()
+        item_dropdown = ttk.Combobox(give_window, textvariable=item_var, values=item_list)
+        item_dropdown.pack(pady=10)
+        item_dropdown.focus_set()
+
+        # Make the dropdown searchable
+        def on_type(event):
+            item_dropdown["values"] = [item.label for item in catalog.search(event.widget.get())]
+
+        item_dropdown.bind("<KeyRelease>", on_type)
+
+        # Add entry for quantity
+        quantity_var = tk.IntVar(value=1)
+        quantity_label = tk.Label(give_window, text="Quantity:")
+        quantity_label.pack(pady=5)
+        quantity_entry = tk.Entry(give_window, textvariable=quantity_var)
+        quantity_entry.pack(pady=5)
+        stack_label = tk.Label(give_window, text="")
+        stack_label.pack(pady=5)
+
+        def on_select(event=None):
+            item = catalog.lookup(item_var.get())
+            stack_label.config(text=f"Stack size: {item.stack_size}" if item else "")
+
+        item_dropdown.bind("<<ComboboxSelected>>", on_select)
+
+        def confirm_give():
+            item = catalog.lookup(item_var.get())
+            if not item:
+                messagebox.showwarning("Warning", "No item selected!")
+                return
 
-execute_button = tk.Button(root, text="Execute Command", command=execute_command)
-execute_button.pack(pady=5)
+            try:
+                quantity = quantity_var.get()
+            except tk.TclError:
+                quantity = 0
+            max_quantity = catalog.max_quantity(item)
+            if not 1 <= quantity <= max_quantity:
+                messagebox.showwarning("Warning", f"Quantity must be between 1 and {max_quantity} "
+                                                  f"({item.name} stacks to {item.stack_size}).")
+                return
 
-refresh_players()
-root.mainloop()
+            selected_item = item.id
+            batch = self.new_batch()
+            batch.add(f"give {{target}} {selected_item} {quantity}", selected_players)
+            self.send_batch(batch, f"Give {quantity}x {selected_item}")
+            give_window.destroy()
+
+        give_button = tk.Button(give_window, text="Give Item", command=confirm_give)
+        give_button.pack(pady=10)
+
+if __name__ == "__main__":
+    # With several servers, point the panel at one of them: its log file and command port
+    parser = argparse.ArgumentParser(description="Player list for a running server")
+    parser.add_argument("--log", default=LOG_FILE)
+    parser.add_argument("--port", type=int, default=COMMAND_PORT)
+    parser.add_argument("--commands", default=COMMAND_FILE)
+    parser.add_argument("--token-file", help=f"the manager's command token (default: {COMMAND_TOKEN_FILE} "
+                                             "beside --commands)")
+    args = parser.parse_args()
+    token_file = args.token_file or os.path.join(os.path.dirname(args.commands), COMMAND_TOKEN_FILE)
+    root = tk.Tk()
+    app = PlayerListPanel(root, roster=RosterTracker(args.log),
+                          command_sink=CommandClient(port=args.port, command_file=args.commands,
+                                                     token_file=token_file).send)
+    root.mainloop()
@@ -0,0 +1,271 @@
+import argparse
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+from bds_events import PLAYER_CONNECTED, PLAYER_DISCONNECTED
+from bds_archive_index import archive_stem as strip_archive_suffix
+
+REGISTRY_DB = "players.db"
+OLD_LOGS_DIR = "old_logs"
+BATCH_SIZE = 500
+BATCH_INTERVAL = 0.5
+WRITE_RETRIES = 3
+RETRY_DELAY = 0.2  # seconds, doubled after each failed attempt
+BUSY_RE = re.compile(r"locked|busy")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name TEXT PRIMARY KEY COLLATE NOCASE,
+    xuid TEXT,
+    first_seen REAL,
+    last_seen REAL,
+    playtime REAL NOT NULL DEFAULT 0,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    online_since REAL,
+    is_op INTEGER NOT NULL DEFAULT 0,
+    is_banned INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS players_xuid ON players (xuid);
+CREATE INDEX IF NOT EXISTS players_last_seen ON players (last_seen);
+CREATE INDEX IF NOT EXISTS players_playtime ON players (playtime);
+CREATE TABLE IF NOT EXISTS imported_archives (
+    stem TEXT PRIMARY KEY,
+    imported_at REAL NOT NULL
+);
+"""
+
+CONNECT_SQL = """
+INSERT INTO players (name, xuid, first_seen, last_seen, sessions, online_since) VALUES (?, ?, ?, ?, 1, ?)
+ON CONFLICT (name) DO UPDATE SET
+    xuid = coalesce(excluded.xuid, xuid),
+    first_seen = min(coalesce(first_seen, excluded.first_seen), excluded.first_seen),
+    last_seen = max(coalesce(last_seen, excluded.last_seen), excluded.last_seen),
+    sessions = sessions + 1,
+    -- An open session here lost its disconnect; how long it lasted is unknown, so none of it counts
+    online_since = excluded.online_since
+"""
+
+DISCONNECT_SQL = """
+UPDATE players SET
+    playtime = playtime + max(0, ? - online_since),
+    last_seen = max(coalesce(last_seen, 0), ?),
+    online_since = NULL
+WHERE name = ? AND online_since IS NOT NULL
+"""
+
+# At startup: sessions left open by a manager that was killed are dropped without crediting the gap
+DROP_STALE_SQL = "UPDATE players SET online_since = NULL WHERE online_since IS NOT NULL"
+
+CLOSE_ALL_SQL = """
+UPDATE players SET
+    playtime = playtime + max(0, ? - online_since),
+    last_seen = max(coalesce(last_seen, 0), ?),
+    online_since = NULL
+WHERE online_since IS NOT NULL
+"""
+
+IMPORT_SQL = """
+INSERT INTO players (name, xuid, first_seen, last_seen, playtime, sessions) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    xuid = coalesce(xuid, excluded.xuid),
+    first_seen = min(coalesce(first_seen, excluded.first_seen), excluded.first_seen),
+    last_seen = max(coalesce(last_seen, excluded.last_seen), excluded.last_seen),
+    playtime = playtime + excluded.playtime,
+    sessions = sessions + excluded.sessions
+"""
+
+STATUS_SQL = {
+    "op": "INSERT INTO players (name, is_op) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET is_op = 1",
+    "deop": "INSERT INTO players (name, is_op) VALUES (?, 0) ON CONFLICT (name) DO UPDATE SET is_op = 0",
+    "ban": "INSERT INTO players (name, is_banned) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET is_banned = 1",
+    "unban": "INSERT INTO players (name, is_banned) VALUES (?, 0) ON CONFLICT (name) DO UPDATE SET is_banned = 0",
+}
+
+COLUMNS = ("name", "xuid", "first_seen", "last_seen", "playtime", "sessions", "online_since", "is_op", "is_banned")
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def archive_stem(name):
+    return strip_archive_suffix(os.path.basename(name))
+
+class PlayerRegistry:
+    # All writes go through one background thread that commits them in batched transactions;
+    # callers only put work on a queue. Reads use their own WAL connection and never wait on writes.
+    def __init__(self, path=REGISTRY_DB, drop_stale=True):
+        # drop_stale=False for tools that may run beside the manager and must not end its sessions
+        self.path = path
+        conn = connect(path)
+        conn.executescript(SCHEMA)
+        if drop_stale:
+            conn.execute(DROP_STALE_SQL)
+        conn.commit()
+        conn.close()
+        self._reader = connect(path)
+        self._read_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self.failed_writes = 0
+        self.on_error = []  # callbacks(message), run on the writer thread when a write is given up
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def attach(self, bus):
+        bus.subscribe(PLAYER_CONNECTED, self.record_event)
+        bus.subscribe(PLAYER_DISCONNECTED, self.record_event)
+
+    def record_event(self, event):
+        name = event.data["name"]
+        if event.kind == PLAYER_CONNECTED:
+            self._writes.put((CONNECT_SQL, (name, event.data["xuid"], event.time, event.time, event.time)))
+        elif event.kind == PLAYER_DISCONNECTED:
+            self._writes.put((DISCONNECT_SQL, (event.time, event.time, name)))
+
+    def close_sessions(self, at=None):
+        # Called when the server stops: everyone still online is disconnected
+        at = at or time.time()
+        self._writes.put((CLOSE_ALL_SQL, (at, at)))
+
+    def set_status(self, command, name):
+        if command in STATUS_SQL:
+            self._writes.put((STATUS_SQL[command], (name,)))
+
+    def mark_imported(self, archive_path):
+        # Archives rotated while the registry was recording live must not be imported again
+        self._writes.put(("INSERT OR IGNORE INTO imported_archives (stem, imported_at) VALUES (?, ?)",
+                          (archive_stem(archive_path), time.time())))
+
+    def flush(self, timeout=None):
+        # Waits for the writes queued so far; False on timeout or if any of them failed
+        done = threading.Event()
+        failed = self.failed_writes
+        self._writes.put(done)
+        return done.wait(timeout) and self.failed_writes == failed
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        while True:
+            batch = [self._writes.get()]
+            deadline = time.monotonic() + BATCH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                if isinstance(batch[-1], threading.Event):
+                    break
+            waiters = [item for item in batch if isinstance(item, threading.Event)]
+            self._write_batch(conn, [item for item in batch if not isinstance(item, threading.Event)])
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, conn, writes):
+        # A failed transaction is rolled back by the context manager. A busy or locked database gets a
+        # few retries; after that each write goes alone, so one bad write does not take the batch with it.
+        delay = RETRY_DELAY
+        for attempt in range(WRITE_RETRIES):
+            try:
+                with conn:
+                    for write in writes:
+                        conn.execute(*write)
+                return
+            except sqlite3.Error as e:
+                if attempt == WRITE_RETRIES - 1 or not BUSY_RE.search(str(e)):
+                    break
+                time.sleep(delay)
+                delay *= 2
+        for write in writes:
+            try:
+                with conn:
+                    conn.execute(*write)
+            except sqlite3.Error as e:
+                self.failed_writes += 1
+                self._report(f"write failed ({e}): {write[0].split()[0]} {write[1]}")
+
+    def _report(self, message):
+        for callback in list(self.on_error):
+            try:
+                callback(message)
+            except Exception:
+                pass
+
+    def import_archives(self, archive_dir=OLD_LOGS_DIR, workers=None):
+        # One-time bulk import: archives already imported (or recorded live) are skipped
+        from bds_analytics import collect_archives, join_sessions
+        if not os.path.isdir(archive_dir):
+            return 0
+        archives, _ = collect_archives(archive_dir, workers)
+        with self._read_lock:
+            done = {row[0] for row in self._reader.execute("SELECT stem FROM imported_archives")}
+        new = {name: entry for name, entry in archives.items() if archive_stem(name) not in done}
+        if not new:
+            return 0
+
+        totals = {}
+        # Joined over every archive, since a session can run across a rotation into an imported one
+        for origin, (name, xuid, start, end) in join_sessions(archives):
+            if origin not in new:
+                continue
+            total = totals.setdefault(name.lower(), [name, xuid, start, end, 0.0, 0])
+            total[1] = total[1] or xuid
+            total[2] = min(total[2], start)
+            total[3] = max(total[3], end)
+            total[4] += end - start
+            total[5] += 1
+        conn = connect(self.path)
+        try:
+            with conn:
+                conn.executemany(IMPORT_SQL, totals.values())
+                conn.executemany("INSERT OR IGNORE INTO imported_archives (stem, imported_at) VALUES (?, ?)",
+                                 [(archive_stem(name), time.time()) for name in new])
+        finally:
+            conn.close()
+        return len(new)
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            return [dict(zip(COLUMNS, row)) for row in self._reader.execute(sql, params)]
+
+    def lookup(self, name):
+        rows = self._query(f"SELECT {', '.join(COLUMNS)} FROM players WHERE name = ?", (name,))
+        return rows[0] if rows else None
+
+    def by_xuid(self, xuid):
+        return self._query(f"SELECT {', '.join(COLUMNS)} FROM players WHERE xuid = ?", (xuid,))
+
+    def recent(self, limit=50):
+        return self._query(f"SELECT {', '.join(COLUMNS)} FROM players ORDER BY last_seen DESC LIMIT ?", (limit,))
+
+    def top_playtime(self, limit=20):
+        return self._query(f"SELECT {', '.join(COLUMNS)} FROM players ORDER BY playtime DESC LIMIT ?", (limit,))
+
+def main():
+    parser = argparse.ArgumentParser(description="Player registry")
+    parser.add_argument("--db", default=REGISTRY_DB)
+    parser.add_argument("--import-logs", metavar="DIR", nargs="?", const=OLD_LOGS_DIR,
+                        help="import archived logs that have not been imported yet")
+    parser.add_argument("--player", help="show one player")
+    parser.add_argument("--top", type=int, default=0, help="list the top N players by playtime")
+    args = parser.parse_args()
+
+    registry = PlayerRegistry(args.db, drop_stale=False)
+    if args.import_logs:
+        start = time.perf_counter()
+        count = registry.import_archives(args.import_logs)
+        print(f"imported {count} archive(s) in {time.perf_counter() - start:.2f}s")
+    if args.player:
+        print(registry.lookup(args.player) or f"{args.player} not found")
+    for row in registry.top_playtime(args.top) if args.top else []:
+        print(f"{row['name']:<20} {row['playtime'] / 3600:8.1f} h  {row['sessions']:>5} sessions  xuid {row['xuid']}")
+
+if __name__ == "__main__":
+    main()
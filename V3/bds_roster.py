@@ -0,0 +1,163 @@
+import gzip
+import os
+import threading
+from bds_events import parse_text, PLAYER_CONNECTED, PLAYER_DISCONNECTED
+from bds_logsink import CONTINUED_LINE, OLD_LOGS_DIR, ARCHIVE_RE
+
+LOG_FILE = "server_log.txt"
+READ_CHUNK = 1024 * 1024
+HEAD_SIZE = 64
+CONTINUED_HEAD = CONTINUED_LINE.encode("utf-8")
+
+class RosterTracker:
+    # With log_file=None the tracker is fed events from the manager's bus instead of tailing a file
+    def __init__(self, log_file=LOG_FILE):
+        self.log_file = log_file
+        self.players = {}  # name -> (xuid, connected_at)
+        self._lock = threading.Lock()
+        self._listeners = ()
+        self._file_id = None
+        self._offset = 0
+        self._head = b""
+        self._partial = b""
+
+    def reset(self, keep_players=False):
+        if not keep_players:
+            self.players = {}
+        self._file_id = None
+        self._offset = 0
+        self._head = b""
+        self._partial = b""
+
+    def clear(self):
+        with self._lock:
+            had_players = bool(self.players)
+            self.reset()
+        if had_players:
+            self._notify()
+
+    def poll(self):
+        # Parses only the bytes appended since the last call; returns True if the roster changed
+        if self.log_file is None:
+            return False
+        with self._lock:
+            changed = self._poll()
+        if changed:
+            self._notify()
+        return changed
+
+    def _poll(self):
+        before = dict(self.players)
+        try:
+            stat = os.stat(self.log_file)
+        except OSError:
+            self.reset()
+            return bool(before)
+
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id != self._file_id or stat.st_size < self._offset:
+            # Rotated or truncated: start over, but keep who is online until the new head shows
+            # whether the server restarted or the sink rotated the log while it ran
+            if self._file_id is not None and file_id != self._file_id:
+                self._read_rotated()
+            self.reset(keep_players=True)
+            self._file_id = file_id
+
+        if stat.st_size == self._offset and len(self._head) == min(HEAD_SIZE, stat.st_size):
+            return self.players != before
+
+        with open(self.log_file, "rb") as log_file:
+            if self._head:
+                # Truncated and refilled past our offset between two polls
+                if log_file.read(len(self._head)) != self._head:
+                    self.reset(keep_players=True)
+                    self._file_id = file_id
+            if len(self._head) < HEAD_SIZE:
+                log_file.seek(0)
+                head = log_file.read(HEAD_SIZE)
+                if not self._head and not head.startswith(CONTINUED_HEAD[:len(head)]):
+                    self.players = {}
+                self._head = head
+            log_file.seek(self._offset)
+            while True:
+                chunk = log_file.read(READ_CHUNK)
+                if not chunk:
+                    break
+                self._offset += len(chunk)
+                self._feed(chunk)
+        return self.players != before
+
+    def _read_rotated(self):
+        # Lines written after the last poll went into the archive; find it by its head and read the rest
+        archive_dir = os.path.join(os.path.dirname(self.log_file), OLD_LOGS_DIR)
+        try:
+            names = sorted((name for name in os.listdir(archive_dir) if ARCHIVE_RE.match(name)), reverse=True)
+        except OSError:
+            return
+        for name in names[:3]:
+            path = os.path.join(archive_dir, name)
+            try:
+                with (gzip.open if name.endswith(".gz") else open)(path, "rb") as archive:
+                    if not self._head or archive.read(len(self._head)) != self._head:
+                        continue
+                    archive.seek(self._offset)
+                    while True:
+                        chunk = archive.read(READ_CHUNK)
+                        if not chunk:
+                            break
+                        self._feed(chunk)
+                    self._feed(b"\n")
+                return
+            except (OSError, EOFError):
+                continue
+
+    def subscribe(self, callback):
+        # callback() runs on whichever thread changed the roster
+        self._listeners += (callback,)
+        return lambda: self.unsubscribe(callback)
+
+    def unsubscribe(self, callback):
+        self._listeners = tuple(listener for listener in self._listeners if listener is not callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def attach(self, bus):
+        bus.subscribe(PLAYER_CONNECTED, self.apply)
+        bus.subscribe(PLAYER_DISCONNECTED, self.apply)
+
+    def apply(self, event):
+        with self._lock:
+            changed = self._apply(event)
+        if changed:
+            self._notify()
+        return changed
+
+    def _apply(self, event):
+        if event.kind == PLAYER_CONNECTED:
+            self.players[event.data["name"]] = (event.data["xuid"], event.time)
+            return True
+        if event.kind == PLAYER_DISCONNECTED:
+            return self.players.pop(event.data["name"], None) is not None
+        return False
+
+    def _feed(self, chunk):
+        data = self._partial + chunk
+        end = data.rfind(b"\n") + 1
+        self._partial = data[end:]
+        changed = False
+        for event in parse_text(data[:end].decode("utf-8", "replace")):
+            changed = self._apply(event) or changed
+        return changed
+
+    def names(self):
+        with self._lock:
+            return list(self.players)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.players)
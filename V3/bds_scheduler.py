@@ -0,0 +1,201 @@
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from bds_dispatch import CommandResult
+from bds_metrics import COMMAND_QUEUE_DEPTH, COMMAND_QUEUE_WAIT, COMMANDS_COALESCED, COMMAND_RESULTS
+
+URGENT = "urgent"  # admin commands: jump every queue and ignore the rate limit
+INTERACTIVE = "interactive"  # a person is waiting: console entry, player list actions
+BULK = "bulk"  # large batches and command file replays; drained in the background at BULK_RATE
+LANES = (URGENT, INTERACTIVE, BULK)
+
+URGENT_COMMANDS = {"stop", "kick", "ban", "deop", "save"}
+# Sending these twice in a row does nothing the first would not, so a duplicate of the last command
+# queued for the same target shares its result instead of being queued again. "time add" and
+# "effect" add up, so only "time set" is listed.
+IDEMPOTENT_COMMANDS = {"op", "deop", "kick", "ban", "unban", "gamemode", "difficulty", "gamerule", "time set",
+                       "weather", "allowlist", "whitelist", "tag", "list", "reload"}
+# These change the world or the server rather than a player; their target is the command itself
+WORLD_COMMANDS = {"time", "weather", "difficulty", "gamerule", "daylock", "alwaysday", "stop", "save", "reload",
+                  "list"}
+SECOND_ARGUMENT_TARGET = {"gamemode", "allowlist", "whitelist"}  # gamemode <mode> <player>, allowlist add <player>
+BULK_THRESHOLD = 20  # batches larger than this go to the bulk lane unless a lane is given
+STDIN_RATE = 200.0  # commands per second, every lane together
+STDIN_BURST = 200
+BULK_RATE = 50.0
+BULK_BURST = 50
+MAX_QUEUED = 50000  # per lane; beyond this new commands fail at once
+PUMP_INTERVAL = 0.05
+
+COMMAND_RE = re.compile(r'\s*(\S+)(?:\s+("[^"]*"|\S+))?(?:\s+("[^"]*"|\S+))?')
+
+def command_target(command):
+    # What a command acts on, so commands for the same player or setting are never reordered
+    match = COMMAND_RE.match(command)
+    if not match:
+        return ""
+    verb, first, second = match.group(1).lower(), match.group(2), match.group(3)
+    if verb == "gamerule" and first:
+        return f"gamerule {first.lower()}"
+    if verb in WORLD_COMMANDS:
+        return verb
+    target = second if verb in SECOND_ARGUMENT_TARGET else first
+    return target.strip('"').lower() if target else verb
+
+def idempotent(command):
+    words = command.lower().split()
+    return bool(words) and (words[0] in IDEMPOTENT_COMMANDS or " ".join(words[:2]) in IDEMPOTENT_COMMANDS)
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, count=1):
+        # May go below zero (urgent commands are never refused); later commands then wait it out
+        self.tokens -= count
+
+    def wait_for(self, count=1):
+        return max(0.0, (count - self.tokens) / self.rate)
+
+class Queued:
+    __slots__ = ("command", "target", "lane", "futures", "queued_at")
+
+    def __init__(self, command, target, lane):
+        self.command = command
+        self.target = target
+        self.lane = lane
+        self.futures = [Future()]
+        self.queued_at = time.perf_counter()
+
+class CommandScheduler:
+    # Sits in front of the dispatcher: commands wait in priority lanes and are handed to submit(commands)
+    # in the order they are written, so answers are still matched in FIFO order. Runs on the core loop;
+    # submit() is safe from any thread and returns a Future per command at once.
+    def __init__(self, core, submit, name="bds", rate=STDIN_RATE, burst=STDIN_BURST, bulk_rate=BULK_RATE,
+                 bulk_burst=BULK_BURST, max_queued=MAX_QUEUED):
+        self.core = core
+        self.forward = submit
+        self.name = name
+        self.max_queued = max_queued
+        self.lanes = {lane: deque() for lane in LANES}
+        self.bucket = TokenBucket(rate, burst)
+        self.bulk_bucket = TokenBucket(bulk_rate, bulk_burst)
+        self._queued = {}  # target -> the last Queued entry for it, while it waits
+        self._waiting = {}  # target -> interactive entries for it still waiting
+        self._lock = threading.Lock()
+        self._timer = None
+        for lane in LANES:
+            COMMAND_QUEUE_DEPTH.labels(name, lane).set_function(lambda lane=lane: len(self.lanes[lane]))
+
+    def lane_for(self, command, lane=None):
+        if command.split(" ", 1)[0].lower() in URGENT_COMMANDS:
+            return URGENT
+        return lane or INTERACTIVE
+
+    def submit(self, commands, lane=None):
+        commands = list(commands)
+        if lane is None and len(commands) > BULK_THRESHOLD:
+            lane = BULK
+        futures = []
+        rejected = []
+        floor = 0  # a command never overtakes one sent before it in the same call
+        with self._lock:
+            for command in commands:
+                target = command_target(command)
+                entry = self._queued.get(target)
+                if entry is not None and entry.command == command and idempotent(command):
+                    future = Future()
+                    entry.futures.append(future)
+                    futures.append(future)
+                    floor = max(floor, LANES.index(entry.lane))
+                    COMMANDS_COALESCED.labels(self.name).inc()
+                    continue
+                # Nor an interactive one for the same target: an urgent deop must not land before a
+                # queued op, or a kick before the tell explaining it. Bulk work may still be overtaken.
+                rank = max(floor, LANES.index(self.lane_for(command, lane)))
+                if self._waiting.get(target):
+                    rank = max(rank, LANES.index(INTERACTIVE))
+                entry = Queued(command, target, LANES[rank])
+                queue = self.lanes[entry.lane]
+                if len(queue) >= self.max_queued:
+                    rejected.append(entry)
+                else:
+                    queue.append(entry)
+                    self._queued[target] = entry
+                    if entry.lane == INTERACTIVE:
+                        self._waiting[target] = self._waiting.get(target, 0) + 1
+                    floor = rank
+                futures.extend(entry.futures)
+        for entry in rejected:
+            COMMAND_RESULTS.labels(self.name, "rejected").inc()
+            entry.futures[0].set_result(CommandResult(entry.command, False, [f"{entry.lane} queue is full"]))
+        self.core.call(self._pump)
+        return futures
+
+    def depths(self):
+        return {lane: len(queue) for lane, queue in self.lanes.items()}
+
+    def _pump(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        self.bucket.refill(now)
+        self.bulk_bucket.refill(now)
+        released = []
+        with self._lock:
+            for lane in LANES:
+                queue = self.lanes[lane]
+                while queue:
+                    if lane != URGENT and self.bucket.tokens < 1:
+                        break
+                    if lane == BULK and self.bulk_bucket.tokens < 1:
+                        break
+                    entry = queue.popleft()
+                    if self._queued.get(entry.target) is entry:
+                        del self._queued[entry.target]
+                    if lane == INTERACTIVE:
+                        self._waiting[entry.target] -= 1
+                        if not self._waiting[entry.target]:
+                            del self._waiting[entry.target]
+                    self.bucket.take()
+                    if lane == BULK:
+                        self.bulk_bucket.take()
+                    released.append(entry)
+            waiting = [lane for lane in LANES if self.lanes[lane]]
+        if released:
+            # Everything released together goes out as one write
+            sent_at = time.perf_counter()
+            for entry in released:
+                COMMAND_QUEUE_WAIT.labels(self.name, entry.lane).observe(sent_at - entry.queued_at)
+            for entry, future in zip(released, self.forward([entry.command for entry in released])):
+                future.add_done_callback(lambda done, entry=entry: self._resolve(entry, done.result()))
+        if waiting:
+            wait = self.bucket.wait_for()
+            if BULK in waiting and waiting == [BULK]:
+                wait = max(wait, self.bulk_bucket.wait_for())
+            self._timer = self.core.loop.call_later(max(wait, PUMP_INTERVAL), self._pump)
+
+    def _resolve(self, entry, result):
+        for future in entry.futures:
+            future.set_result(result)
+
+    def cancel_all(self, reason="server stopped"):
+        with self._lock:
+            entries = [entry for queue in self.lanes.values() for entry in queue]
+            for queue in self.lanes.values():
+                queue.clear()
+            self._queued.clear()
+            self._waiting.clear()
+        for entry in entries:
+            self._resolve(entry, CommandResult(entry.command, None, [reason]))
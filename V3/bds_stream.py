@@ -0,0 +1,178 @@
+import codecs
+import os
+import tempfile
+import threading
+from collections import deque
+
+DROP = "drop"  # new lines are discarded while the buffer is full
+COALESCE = "coalesce"  # the oldest lines are discarded and replaced by one "lines skipped" marker
+SPILL = "spill"  # overflow goes to a temp file and is delivered later, in order
+
+READ_CHUNK = 64 * 1024
+CHANNEL_MAX_LINES = 20000
+SPILL_BUFFER = 1024 * 1024
+
+def split_lines(decoder, partial, chunk):
+    # Feeds one raw chunk (b"" at EOF) through the incremental decoder. Returns (complete lines, partial):
+    # lines end in "\n" with any "\r" removed; a multi-byte character split across chunks is held back.
+    final = not chunk
+    text = partial + decoder.decode(chunk, final)
+    if "\r" in text:
+        text = text.replace("\r\n", "\n")
+    parts = text.split("\n")
+    partial = parts.pop()
+    lines = [part + "\n" for part in parts]
+    if final and partial:
+        lines.append(partial + "\n")
+        partial = ""
+    return lines, partial
+
+class LineReader:
+    # Turns a byte stream into lists of lines with chunked reads and incremental UTF-8 decoding
+    def __init__(self, stream, chunk_size=READ_CHUNK):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self.partial = ""
+        self.done = False
+        self.bytes_read = 0
+
+    async def read(self):
+        # Returns the next batch of complete lines, [] at EOF
+        while not self.done:
+            chunk = await self.stream.read(self.chunk_size)
+            self.done = not chunk
+            self.bytes_read += len(chunk)
+            lines, self.partial = split_lines(self.decoder, self.partial, chunk)
+            if lines:
+                return lines
+        return []
+
+class Channel:
+    # Bounded buffer between the stdout reader and one slow consumer. put() never blocks, whatever the
+    # consumer is doing; what happens once max_lines are waiting is the channel's policy.
+    # With a consumer, a worker thread calls consumer(lines) with everything waiting; without one,
+    # the owner pulls with take() (the Tk console does this from its own timer).
+    def __init__(self, name, consumer=None, policy=DROP, max_lines=CHANNEL_MAX_LINES, spill_dir=None):
+        if policy not in (DROP, COALESCE, SPILL):
+            raise ValueError(f"unknown overflow policy {policy!r}")
+        self.name = name
+        self.consumer = consumer
+        self.policy = policy
+        self.max_lines = max_lines
+        self.spill_dir = spill_dir
+        self.buffer = deque()
+        self.stats = {"lines": 0, "delivered": 0, "dropped": 0, "coalesced": 0, "spilled": 0, "peak": 0}
+        self._skipped = 0
+        self._spill = None  # (path, file) while overflow is being spilled
+        self._busy = False
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        if consumer is not None:
+            threading.Thread(target=self._work, name=f"channel-{name}", daemon=True).start()
+
+    def put(self, lines):
+        with self._lock:
+            self.stats["lines"] += len(lines)
+            if self.policy == COALESCE:
+                self._coalesce(lines)
+            else:
+                room = self.max_lines - len(self.buffer)
+                if self._spill is not None:
+                    # Once spilling, keep spilling until the consumer takes it all, so order is kept
+                    room = 0
+                if len(lines) > room:
+                    overflow = lines[max(room, 0):]
+                    lines = lines[:max(room, 0)]
+                    self._overflow(overflow)
+                self.buffer.extend(lines)
+            self.stats["peak"] = max(self.stats["peak"], len(self.buffer))
+            self._ready.notify()
+
+    def _coalesce(self, lines):
+        # Keep the newest lines; the consumer is told how many it missed
+        self.buffer.extend(lines)
+        excess = len(self.buffer) - self.max_lines
+        for _ in range(excess):
+            self.buffer.popleft()
+        if excess > 0:
+            self._skipped += excess
+            self.stats["coalesced"] += excess
+
+    def _overflow(self, lines):
+        if self.policy == DROP:
+            self.stats["dropped"] += len(lines)
+        else:
+            if self._spill is None:
+                spill_file = tempfile.NamedTemporaryFile("w", encoding="utf-8", prefix=f"bds_{self.name}_",
+                                                         suffix=".spill", dir=self.spill_dir, delete=False, newline="",
+                                                         buffering=SPILL_BUFFER)
+                self._spill = (spill_file.name, spill_file)
+            self._spill[1].write("".join(lines))
+            self.stats["spilled"] += len(lines)
+
+    def take(self):
+        # Everything waiting, oldest first. Meant for COALESCE and DROP channels read by their owner;
+        # spilled lines are read back here too, outside the lock.
+        with self._lock:
+            lines, spill_path = self._take()
+        if spill_path is not None:
+            for block in self._read_spill(spill_path):
+                lines.extend(block)
+        self.stats["delivered"] += len(lines)
+        return lines
+
+    def _take(self):
+        lines = list(self.buffer)
+        self.buffer.clear()
+        if self._skipped:
+            lines.insert(0, f"[Manager] {self._skipped} lines skipped\n")
+            self._skipped = 0
+        spill_path = None
+        if self._spill is not None:
+            spill_path, spill_file = self._spill
+            spill_file.close()
+            self._spill = None
+        return lines, spill_path
+
+    def _read_spill(self, path):
+        # Yields the spilled lines in blocks of at most max_lines, then removes the file
+        try:
+            with open(path, encoding="utf-8", newline="") as spilled:
+                block = []
+                for line in spilled:
+                    block.append(line)
+                    if len(block) >= self.max_lines:
+                        yield block
+                        block = []
+                if block:
+                    yield block
+        finally:
+            os.remove(path)
+
+    def _deliver(self, lines):
+        self.stats["delivered"] += len(lines)
+        try:
+            self.consumer(lines)
+        except Exception:
+            pass
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._busy = False
+                self._ready.notify_all()
+                while not self.buffer and self._spill is None:
+                    self._ready.wait()
+                self._busy = True
+                lines, spill_path = self._take()
+            if lines:
+                self._deliver(lines)
+            if spill_path is not None:
+                for block in self._read_spill(spill_path):
+                    self._deliver(block)
+
+    def join(self, timeout=None):
+        # Waits until the consumer has handled everything put so far
+        with self._lock:
+            return self._ready.wait_for(lambda: not self.buffer and self._spill is None and not self._busy, timeout)
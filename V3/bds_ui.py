@@ -1,70 +1,315 @@
 import tkinter as tk
-from tkinter import scrolledtext, messagebox
-import subprocess
-import threading
-import time
+from tkinter import ttk, scrolledtext, messagebox, simpledialog
+import asyncio
 import os
-from datetime import datetime
+import threading
+from bds_core import EventLoopThread, TkBridge
+from bds_console import ConsoleView, VIEWS, COMMAND_ECHO
+from bds_instance import ServerInstance, load_servers, broadcast, SERVERS_FILE
+from bds_jobs import JobScheduler, load_jobs, format_jobs, JOBS_FILE
+from bds_pl import PlayerListPanel
+from bds_lifecycle import STOPPED, STARTING, RUNNING, CRASHED
+from bds_metrics import REGISTRY, Profiler, MemoryTracer, export_periodically, METRICS_FILE
 
-LOG_FILE = "server_log.txt"
-COMMAND_FILE = "server_commands.txt"
-OLD_LOGS_DIR = "old_logs"
+FIND_DELAY_MS = 120  # find runs once typing pauses this long
+# Prometheus text file, rewritten every EXPORT_INTERVAL seconds for a node_exporter textfile collector
+EXPORT_METRICS = True
+PROFILE_CORE_FILE = "profile_core.prof"
+PROFILE_UI_FILE = "profile_ui.prof"
+
+class ServerTab:
+    # Controls, console and player list for one server instance
+    def __init__(self, app, notebook, instance):
+        self.app = app
+        self.instance = instance
+        self.player_window = None
+        self.find_job = None
+        self.frame = tk.Frame(notebook)
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.columnconfigure(1, weight=1)
+        self.frame.rowconfigure(1, weight=1)
+        notebook.add(self.frame, text=instance.name)
+        
+        # Start, Stop and Restart buttons
+        buttons = tk.Frame(self.frame)
+        buttons.grid(row=0, column=0, columnspan=2, sticky='ew')
+        for column in range(3):
+            buttons.columnconfigure(column, weight=1)
+        self.start_bds_button = tk.Button(buttons, text="Start BDS", command=instance.start)
+        self.start_bds_button.grid(row=0, column=0, padx=2, pady=5, sticky='ew')
+        self.stop_button = tk.Button(buttons, text="Stop Server", command=instance.stop, state=tk.DISABLED)
+        self.stop_button.grid(row=0, column=1, padx=2, pady=5, sticky='ew')
+        self.restart_button = tk.Button(buttons, text="Restart Server", command=instance.restart, state=tk.DISABLED)
+        self.restart_button.grid(row=0, column=2, padx=2, pady=5, sticky='ew')
+        
+        # Console log
+        self.log = scrolledtext.ScrolledText(self.frame, width=85, height=20, state=tk.DISABLED)
+        self.log.grid(row=1, column=0, columnspan=2, pady=5, sticky='nsew')
+        self.console = ConsoleView(self.log, name=f"{instance.name}-console")
+        instance.on_output.append(self.console.write)
+        
+        # Filtered views and find in the scrollback
+        toolbar = tk.Frame(self.frame)
+        toolbar.grid(row=2, column=0, columnspan=2, sticky='ew')
+        toolbar.columnconfigure(3, weight=1)
+        tk.Label(toolbar, text="Show:").grid(row=0, column=0)
+        self.view_var = tk.StringVar(value=next(iter(VIEWS)))
+        self.view_box = ttk.Combobox(toolbar, textvariable=self.view_var, values=list(VIEWS), state="readonly", width=18)
+        self.view_box.grid(row=0, column=1, padx=2)
+        self.view_box.bind("<<ComboboxSelected>>", lambda event: self.change_view())
+        tk.Label(toolbar, text="Find:").grid(row=0, column=2, padx=(8, 0))
+        self.find_var = tk.StringVar()
+        self.find_var.trace_add("write", lambda *args: self.schedule_find())
+        self.find_entry = tk.Entry(toolbar, textvariable=self.find_var)
+        self.find_entry.grid(row=0, column=3, padx=2, sticky='ew')
+        self.find_entry.bind("<Return>", lambda event: self.find_next())
+        self.find_entry.bind("<Shift-Return>", lambda event: self.find_previous())
+        self.find_entry.bind("<Escape>", lambda event: self.find_var.set(""))
+        tk.Button(toolbar, text="Previous", command=self.find_previous).grid(row=0, column=4, padx=2)
+        tk.Button(toolbar, text="Next", command=self.find_next).grid(row=0, column=5, padx=2)
+        self.find_status = tk.StringVar()
+        tk.Label(toolbar, textvariable=self.find_status, width=16, anchor='w').grid(row=0, column=6)
+        self.log.bind("<Control-f>", lambda event: self.find_entry.focus_set())
+        
+        # Command input
+        self.command_entry = tk.Entry(self.frame, width=60)
+        self.command_entry.grid(row=3, column=0, pady=5, sticky='ew')
+        self.command_entry.bind("<Return>", lambda event: self.send_command())
+        self.command_entry.bind("<Control-f>", lambda event: self.find_entry.focus_set())
+        
+        self.send_button = tk.Button(self.frame, text="Send Command", command=self.send_command)
+        self.send_button.grid(row=3, column=1, pady=5, sticky='ew')
+        
+        # Open Player List and Backup buttons
+        self.player_list_button = tk.Button(self.frame, text="Open Player List", command=self.open_player_list)
+        self.player_list_button.grid(row=4, column=0, pady=5, sticky='ew')
+        self.backup_button = tk.Button(self.frame, text="Backup World Now", command=self.backup)
+        self.backup_button.grid(row=4, column=1, pady=5, sticky='ew')
+        
+        # Server status
+        self.status_var = tk.StringVar(value="Server: stopped")
+        self.status_label = tk.Label(self.frame, textvariable=self.status_var, anchor='w')
+        self.status_label.grid(row=5, column=0, columnspan=2, sticky='ew')
+        instance.controller.subscribe(lambda state, detail: app.bridge.post(self.show_server_state, state, detail))
+    
+    def open_player_list(self):
+        if self.player_window is not None and self.player_window.winfo_exists():
+            self.player_window.deiconify()
+            self.player_window.lift()
+            return
+        try:
+            self.player_window = tk.Toplevel(self.frame)
+            self.player_window.title(f"{self.instance.name}: Player List & Commands")
+            self.player_panel = PlayerListPanel(self.player_window, roster=self.instance.roster,
+                                                command_sink=self.instance.send_commands,
+                                                registry=self.instance.registry)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to open player list: {e}")
+    
+    def backup(self):
+        # Runs on its own thread; the button comes back when the snapshot is done or has failed
+        self.backup_button.config(state=tk.DISABLED)
+        threading.Thread(target=self.run_backup, daemon=True).start()
+    
+    def run_backup(self):
+        try:
+            self.instance.backups.backup()
+        except Exception as e:
+            self.app.bridge.post(messagebox.showerror, "Backup failed", str(e))
+        finally:
+            self.app.bridge.post(self.backup_button.config, {"state": tk.NORMAL})
+    
+    def send_command(self):
+        command = self.command_entry.get()
+        if self.instance.send_command(command):
+            # Echoed into the console only, where the Commands view shows it with BDS's answer
+            self.console.write(f"{COMMAND_ECHO}{command}\n")
+            self.command_entry.delete(0, tk.END)
+    
+    def change_view(self):
+        self.console.set_view(VIEWS[self.view_var.get()])
+        self.show_find_status(self.console.status())
+    
+    def schedule_find(self):
+        # Each pause in typing runs one search, which narrows the previous one as the query grows
+        if self.find_job is not None:
+            self.frame.after_cancel(self.find_job)
+        self.find_job = self.frame.after(FIND_DELAY_MS, self.run_find)
+    
+    def run_find(self):
+        self.find_job = None
+        self.show_find_status(self.console.find(self.find_var.get()))
+    
+    def find_next(self):
+        if self.find_job is not None:
+            self.frame.after_cancel(self.find_job)
+            self.run_find()
+        else:
+            self.show_find_status(self.console.find_next())
+        return "break"
+    
+    def find_previous(self):
+        if self.find_job is not None:
+            self.frame.after_cancel(self.find_job)
+            self.run_find()
+        self.show_find_status(self.console.find_previous())
+        return "break"
+    
+    def show_find_status(self, status):
+        self.find_status.set(status or f"{self.console.count():,} lines")
+    
+    def show_server_state(self, state, detail):
+        self.status_var.set(f"Server: {state}" + (f" ({detail})" if detail else ""))
+        self.console.write(f"[Manager] Server {state}" + (f": {detail}" if detail else "") + "\n")
+        self.start_bds_button.config(state=tk.NORMAL if state in (STOPPED, CRASHED) else tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL if state in (STARTING, RUNNING, CRASHED) else tk.DISABLED)
+        self.restart_button.config(state=tk.NORMAL if state in (RUNNING, STOPPED, CRASHED) else tk.DISABLED)
+        if state == STOPPED:
+            self.app.start_playit_button.config(state=tk.NORMAL)
 
 class BedrockServerUI:
-    def __init__(self, root):
+    # One tab per server in servers.json, all supervised from a single core loop
+    def __init__(self, root, configs=None):
         self.root = root
         self.root.title("Bedrock Server Manager")
-        self.root.geometry("700x600")
+        self.root.geometry("700x650")
         self.root.columnconfigure(0, weight=1)
-        self.root.rowconfigure(3, weight=1)
+        self.root.rowconfigure(1, weight=1)
         
-        self.server_process = None
         self.playit_process = None
+        if not configs:
+            try:
+                configs = load_servers(SERVERS_FILE)
+            except (OSError, ValueError, TypeError) as e:
+                # Nothing to supervise: guessing a server from a broken file could start the wrong one
+                messagebox.showerror("Error", f"{SERVERS_FILE} was not loaded: {e}")
+                root.destroy()
+                raise SystemExit(1)
+        # All process, pipe and socket I/O runs on one asyncio loop; results reach Tk through the bridge
+        self.core = EventLoopThread()
+        self.bridge = TkBridge(root)
+        self.instances = [ServerInstance(config, self.core) for config in configs]
+        self.core_profiler = Profiler()
+        self.ui_profiler = Profiler()
+        self.memory = MemoryTracer()
+        if EXPORT_METRICS:
+            export_periodically(self.core, METRICS_FILE)
+        # Restarts, announcements, backups and log rotations from jobs.json, all on the core loop
+        try:
+            jobs = load_jobs(JOBS_FILE, [instance.name for instance in self.instances])
+        except (OSError, ValueError, TypeError) as e:
+            messagebox.showerror("Error", f"{JOBS_FILE} was not loaded: {e}")
+            jobs = []
+        self.jobs = JobScheduler(self.core, self.instances, jobs, JOBS_FILE)
+        
+        # Profiling is off unless switched on here; cProfile sees only the thread it runs on
+        menu = tk.Menu(root)
+        self.debug_menu = tk.Menu(menu, tearoff=0)
+        self.debug_menu.add_command(label="Start profiling core loop", command=self.toggle_core_profile)
+        self.debug_menu.add_command(label="Start profiling UI", command=self.toggle_ui_profile)
+        self.debug_menu.add_command(label="Memory snapshot", command=self.memory_snapshot)
+        self.debug_menu.add_command(label="Write metrics now", command=self.write_metrics)
+        menu.add_cascade(label="Debug", menu=self.debug_menu)
+        jobs_menu = tk.Menu(menu, tearoff=0)
+        jobs_menu.add_command(label="Show scheduled jobs", command=self.show_jobs)
+        jobs_menu.add_command(label="Run job now...", command=self.run_job)
+        jobs_menu.add_command(label=f"Reload {JOBS_FILE}", command=self.reload_jobs)
+        menu.add_cascade(label="Jobs", menu=jobs_menu)
+        root.config(menu=menu)
         
         # Start Playit.gg button
         self.start_playit_button = tk.Button(root, text="Start Playit.gg", command=self.start_playit)
         self.start_playit_button.grid(row=0, column=0, columnspan=2, pady=5, sticky='ew')
         
-        # Start BDS button
-        self.start_bds_button = tk.Button(root, text="Start BDS", command=self.start_bds)
-        self.start_bds_button.grid(row=1, column=0, columnspan=2, pady=5, sticky='ew')
-        
-        # Stop button
-        self.stop_button = tk.Button(root, text="Stop Server", command=self.stop_server, state=tk.DISABLED)
-        self.stop_button.grid(row=2, column=0, columnspan=2, pady=5, sticky='ew')
-        
-        # Console log
-        self.log = scrolledtext.ScrolledText(root, width=85, height=20, state=tk.DISABLED)
-        self.log.grid(row=3, column=0, columnspan=2, pady=5, sticky='nsew')
-        
-        # Command input
-        self.command_entry = tk.Entry(root, width=60)
-        self.command_entry.grid(row=4, column=0, pady=5, sticky='ew')
+        self.notebook = ttk.Notebook(root)
+        self.notebook.grid(row=1, column=0, columnspan=2, sticky='nsew')
+        self.tabs = [ServerTab(self, self.notebook, instance) for instance in self.instances]
         
-        self.send_button = tk.Button(root, text="Send Command", command=self.send_command)
-        self.send_button.grid(row=4, column=1, pady=5, sticky='ew')
+        # Broadcast to every running server
+        if len(self.instances) > 1:
+            self.broadcast_entry = tk.Entry(root, width=60)
+            self.broadcast_entry.grid(row=2, column=0, pady=5, sticky='ew')
+            self.broadcast_entry.bind("<Return>", lambda event: self.broadcast_command())
+            self.broadcast_button = tk.Button(root, text="Broadcast to All", command=self.broadcast_command)
+            self.broadcast_button.grid(row=2, column=1, pady=5, sticky='ew')
         
-        # Open Player List Button
-        self.player_list_button = tk.Button(root, text="Open Player List", command=self.open_player_list)
-        self.player_list_button.grid(row=5, column=0, columnspan=2, pady=5, sticky='ew')
-        
-        # Command Monitor Thread
-        threading.Thread(target=self.monitor_commands, daemon=True).start()
+        for instance in self.instances:
+            instance.open()
+        self.jobs.start()
     
-    def open_player_list(self):
+    def broadcast_command(self):
+        command = self.broadcast_entry.get().strip()
+        if not command:
+            return
+        sent = broadcast(self.instances, [command])
+        if not sent:
+            messagebox.showwarning("Warning", "No server is running.")
+            return
+        self.broadcast_entry.delete(0, tk.END)
+        for instance in self.instances:
+            if instance.name in sent:
+                instance.emit(f"[Manager] Broadcast: {command}\n")
+            for future in sent.get(instance.name, ()):
+                future.add_done_callback(lambda done, instance=instance: instance.emit(
+                    f"[Manager] Broadcast {done.result().command}: {'; '.join(done.result().lines)}\n"))
+    
+    def toggle_core_profile(self):
+        if not self.core_profiler.running:
+            self.core.call(self.core_profiler.start)
+            self.debug_menu.entryconfig(0, label="Stop profiling core loop")
+            return
+        self.debug_menu.entryconfig(0, label="Start profiling core loop")
+        self.core.call(lambda: self.bridge.post(self.show_report, "Core loop profile",
+                                                self.core_profiler.stop(PROFILE_CORE_FILE)))
+    
+    def toggle_ui_profile(self):
+        if not self.ui_profiler.running:
+            self.ui_profiler.start()
+            self.debug_menu.entryconfig(1, label="Stop profiling UI")
+            return
+        self.debug_menu.entryconfig(1, label="Start profiling UI")
+        self.show_report("UI profile", self.ui_profiler.stop(PROFILE_UI_FILE))
+    
+    def memory_snapshot(self):
+        # The first snapshot starts tracemalloc; later ones show growth since the previous one
+        if not self.memory.running:
+            self.memory.start()
+        self.show_report("Memory", self.memory.snapshot())
+    
+    def write_metrics(self):
         try:
-            import sys
-            subprocess.Popen([sys.executable, "bds_pl.py"], shell=True)
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to open player list: {e}")
+            REGISTRY.write_textfile(METRICS_FILE)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to write {METRICS_FILE}: {e}")
+            return
+        messagebox.showinfo("Metrics", f"Metrics written to {os.path.abspath(METRICS_FILE)}")
     
-    def send_command(self, command=None):
-        if not command:
-            command = self.command_entry.get()
-        if self.server_process and command:
-            self.server_process.stdin.write(command + "\n")
-            self.server_process.stdin.flush()
-            self.command_entry.delete(0, tk.END)
+    def show_jobs(self):
+        if not self.jobs.configs:
+            messagebox.showinfo("Jobs", f"No jobs scheduled. Add them to {os.path.abspath(JOBS_FILE)}.")
+            return
+        self.show_report("Scheduled jobs", format_jobs(self.jobs.describe()))
+    
+    def run_job(self):
+        name = simpledialog.askstring("Run job now", "Job name:", parent=self.root)
+        if name and not self.jobs.run_now(name.strip()):
+            messagebox.showerror("Error", f"No job named {name.strip()!r}.")
+    
+    def reload_jobs(self):
+        try:
+            self.jobs.reload(load_jobs(JOBS_FILE, list(self.jobs.instances)))
+        except (OSError, ValueError, TypeError) as e:
+            messagebox.showerror("Error", f"{JOBS_FILE} was not reloaded: {e}")
+            return
+        messagebox.showinfo("Jobs", f"{len(self.jobs.configs)} jobs scheduled.")
+    
+    def show_report(self, title, text):
+        window = tk.Toplevel(self.root)
+        window.title(title)
+        report = scrolledtext.ScrolledText(window, width=120, height=30, font=("Courier", 9))
+        report.pack(fill=tk.BOTH, expand=True)
+        report.insert(tk.END, text)
+        report.config(state=tk.DISABLED)
     
     def start_playit(self):
         try:
@@ -72,86 +317,15 @@ class BedrockServerUI:
             playit_shortcut = os.path.join(r"D:\\BedrockServer", "playit.exe.lnk")
             
             if os.path.exists(playit_shortcut):
-                self.playit_process = subprocess.Popen(f'start "" "{playit_shortcut}"', shell=True)
+                self.playit_process = self.core.run(asyncio.create_subprocess_shell(f'start "" "{playit_shortcut}"'), 10)
             elif os.path.exists(playit_path):
-                self.playit_process = subprocess.Popen([playit_path], shell=True)
+                self.playit_process = self.core.run(asyncio.create_subprocess_exec(playit_path), 10)
             else:
                 raise FileNotFoundError("Playit.exe or its shortcut was not found in the server directory.")
             self.start_playit_button.config(state=tk.DISABLED)
             messagebox.showinfo("Success", "Playit.gg started successfully!")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start Playit.gg: {e}")
-    
-    def start_bds(self):
-        try:
-            self.server_process = subprocess.Popen([r"D:\\BedrockServer\\bedrock_server.exe"], 
-                                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True)
-            self.start_bds_button.config(state=tk.DISABLED)
-            self.stop_button.config(state=tk.NORMAL)
-            threading.Thread(target=self.read_output, daemon=True).start()
-            messagebox.showinfo("Success", "BDS started successfully!")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to start BDS: {e}")
-    
-    def read_output(self):
-        with open(LOG_FILE, "w") as log_file:
-            while self.server_process:
-                line = self.server_process.stdout.readline()
-                if not line:
-                    break
-                log_file.write(line)
-                log_file.flush()
-                self.log.config(state=tk.NORMAL)
-                self.log.insert(tk.END, line)
-                self.log.config(state=tk.DISABLED)
-                self.log.yview(tk.END)
-    
-    def stop_server(self):
-        if self.server_process:
-            self.server_process.stdin.write("stop\n")
-            self.server_process.stdin.flush()
-            self.server_process.wait()
-            self.server_process = None
-        
-        time.sleep(1)  # Wait for the file to be released
-        self.archive_log()
-        
-        self.start_bds_button.config(state=tk.NORMAL)
-        self.start_playit_button.config(state=tk.NORMAL)
-        self.stop_button.config(state=tk.DISABLED)
-        messagebox.showinfo("Server Stopped", "The server has been stopped.")
-    
-    def archive_log(self):
-        if not os.path.exists(OLD_LOGS_DIR):
-            os.makedirs(OLD_LOGS_DIR)
-        
-        if os.path.exists(LOG_FILE):
-            try:
-                timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                archived_log = os.path.join(OLD_LOGS_DIR, f"server_log_{timestamp}.txt")
-                
-                with open(LOG_FILE, "r") as log_file:
-                    log_content = log_file.read()
-                
-                with open(archived_log, "w") as new_log:
-                    new_log.write(log_content)
-                
-                with open(LOG_FILE, "w") as clear_log:
-                    clear_log.write("")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to archive log: {e}")
-    
-    def monitor_commands(self):
-        while True:
-            if os.path.exists(COMMAND_FILE):
-                with open(COMMAND_FILE, "r") as file:
-                    commands = file.readlines()
-                if commands:
-                    with open(COMMAND_FILE, "w") as file:
-                        file.write("")  # Clear file after reading
-                    for cmd in commands:
-                        self.send_command(cmd.strip())
-            time.sleep(2)
 
 if __name__ == "__main__":
     root = tk.Tk()